@@ -0,0 +1,371 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+from predict_reimbursement import (np, validate_inputs, get_models, load_trips,
+                                   _predict_arrays)
+from prediction_server import DEFAULT_HOST, DEFAULT_PORT, INPUT_NAMES
+
+
+# Longest a request waits for others to share its batch
+DEFAULT_WINDOW_MS = float(os.environ.get('REIMBURSEMENT_BATCH_WINDOW_MS', 2.0))
+
+# A batch is scored as soon as it reaches this many requests
+DEFAULT_MAX_BATCH = int(os.environ.get('REIMBURSEMENT_MAX_BATCH', 256))
+
+# Latency samples kept for the percentile metrics
+LATENCY_SAMPLES = 100_000
+
+
+class BatchMetrics:
+    """Latency and throughput counters of a MicroBatcher."""
+
+    def __init__(self):
+        self.requests = 0
+        self.batches = 0
+        self.failed = 0
+        self.compute_seconds = 0.0
+        self.first_arrival = None
+        self.last_done = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.waits = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, arrivals: List[float], started: float, done: float, failed: bool):
+        """Add one scored batch: its requests' arrival times and the scoring interval."""
+        self.batches += 1
+        self.requests += len(arrivals)
+        self.failed += len(arrivals) if failed else 0
+        self.compute_seconds += done - started
+        if self.first_arrival is None or arrivals[0] < self.first_arrival:
+            self.first_arrival = arrivals[0]
+        self.last_done = done
+        self.latencies.extend(done - arrival for arrival in arrivals)
+        self.waits.extend(started - arrival for arrival in arrivals)
+
+    def summary(self) -> dict:
+        """
+        Return the latency/throughput trade-off so far.
+
+        Returns:
+            Dictionary with request and batch counts, ``mean_batch_size``,
+            ``requests_per_second`` (first arrival to last answer), latency
+            percentiles in milliseconds and the mean time spent waiting for
+            a batch to fill
+        """
+        summary = {'requests': self.requests, 'batches': self.batches, 'failed': self.failed,
+                   'mean_batch_size': self.requests / self.batches if self.batches else 0.0}
+        if not self.latencies:
+            return summary
+        elapsed = self.last_done - self.first_arrival
+        latencies = np.array(self.latencies) * 1000
+        summary.update({
+            'requests_per_second': self.requests / elapsed if elapsed > 0 else 0.0,
+            'latency_p50_ms': float(np.percentile(latencies, 50)),
+            'latency_p95_ms': float(np.percentile(latencies, 95)),
+            'latency_p99_ms': float(np.percentile(latencies, 99)),
+            'mean_wait_ms': float(np.mean(self.waits) * 1000),
+            'mean_compute_ms_per_batch': self.compute_seconds / self.batches * 1000,
+        })
+        return summary
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-trip requests into vectorized batches.
+
+    The first request of a batch starts a ``window``-second timer; the batch
+    is scored when the timer fires or ``max_batch`` requests have arrived,
+    whichever comes first. Scoring runs off the event loop: in one
+    background thread (so requests keep collecting meanwhile) or, when a
+    ``worker_pool.PredictionPool`` is given, in its worker processes.
+    """
+
+    def __init__(self, window: float = DEFAULT_WINDOW_MS / 1000,
+                 max_batch: int = DEFAULT_MAX_BATCH, pool=None):
+        """
+        Args:
+            window: Seconds a request waits for others to join its batch
+            max_batch: Requests per batch that trigger scoring immediately
+            pool: Optional started PredictionPool to score batches in
+        """
+        self.window = window
+        self.max_batch = max_batch
+        self.pool = pool
+        self.metrics = BatchMetrics()
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self._executor = None if pool is not None else ThreadPoolExecutor(max_workers=1)
+
+    async def predict(self, trip_duration_days: float, miles_traveled: float,
+                      total_receipts_amount: float) -> float:
+        """
+        Predict one trip as part of the next batch.
+
+        Raises:
+            ValueError: If the inputs are invalid (checked before batching,
+                so one bad request never fails the others)
+        """
+        is_valid, error_msg = validate_inputs(trip_duration_days, miles_traveled,
+                                              total_receipts_amount)
+        if not is_valid:
+            raise ValueError(error_msg)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((float(trip_duration_days), float(miles_traveled),
+                              float(total_receipts_amount), future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        """Hand the collected requests to a scoring task."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._score(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _score(self, batch: list):
+        """Score one batch and resolve each request's future."""
+        days, miles, receipts, futures, arrivals = zip(*batch)
+        days, miles, receipts = np.array(days), np.array(miles), np.array(receipts)
+        started = time.perf_counter()
+        try:
+            if self.pool is not None:
+                predictions = await asyncio.wrap_future(self.pool.submit(days, miles, receipts))
+            else:
+                predictions = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, _predict_arrays, days, miles, receipts)
+        except Exception as e:
+            self.metrics.record(arrivals, started, time.perf_counter(), failed=True)
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.metrics.record(arrivals, started, time.perf_counter(), failed=False)
+        for future, prediction in zip(futures, predictions.tolist()):
+            if not future.done():
+                future.set_result(prediction)
+
+    async def close(self):
+        """Score anything still collecting, wait for in-flight batches, stop the thread."""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+class AsyncPredictionServer:
+    """
+    Minimal HTTP/1.1 front end (keep-alive, GET only) over a MicroBatcher.
+
+    Endpoints match prediction_server.py: ``/health``, ``/predict`` and
+    ``/stats`` (here the batching metrics).
+    """
+
+    def __init__(self, batcher: MicroBatcher):
+        self.batcher = batcher
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._reply(writer, 400, "Malformed request line", keep_alive=False)
+                    break
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version == 'HTTP/1.1')
+                if method != 'GET':
+                    status, body, content_type = 405, f"Unsupported method: {method}", 'text/plain'
+                else:
+                    status, body, content_type = await self._route(target)
+                await self._reply(writer, status, body, content_type, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, target: str) -> Tuple[int, str, str]:
+        url = urlsplit(target)
+        if url.path == '/health':
+            return 200, 'ok', 'text/plain'
+        if url.path == '/stats':
+            return 200, json.dumps(self.batcher.metrics.summary()), 'application/json'
+        if url.path != '/predict':
+            return 404, f"Unknown endpoint: {url.path}", 'text/plain'
+
+        query = parse_qs(url.query)
+        missing = [name for name in INPUT_NAMES if name not in query]
+        if missing:
+            return 400, f"Missing parameters: {', '.join(missing)}", 'text/plain'
+        try:
+            result = await self.batcher.predict(*[query[name][0] for name in INPUT_NAMES])
+        except ValueError as e:
+            return 400, str(e), 'text/plain'
+        except Exception as e:
+            return 500, f"Prediction failed: {str(e)}", 'text/plain'
+        return 200, str(result), 'text/plain'
+
+    async def _reply(self, writer: asyncio.StreamWriter, status: int, body: str,
+                     content_type: str = 'text/plain', keep_alive: bool = True):
+        payload = (body + '\n').encode()
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                  405: 'Method Not Allowed', 500: 'Internal Server Error'}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\n"
+                     f"Content-Type: {content_type}\r\n"
+                     f"Content-Length: {len(payload)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                     + payload)
+        await writer.drain()
+
+
+async def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                window: float = DEFAULT_WINDOW_MS / 1000, max_batch: int = DEFAULT_MAX_BATCH,
+                workers: int = 0):
+    """
+    Load the models once and serve micro-batched predictions until cancelled.
+
+    Args:
+        host: Interface to bind (localhost only by default)
+        port: TCP port to listen on
+        window: Batching window in seconds
+        max_batch: Requests per batch that trigger scoring immediately
+        workers: Score batches in a prefork pool of this many processes (0 = in-process)
+    """
+    get_models()
+    pool = None
+    if workers:
+        from worker_pool import PredictionPool
+
+        pool = PredictionPool(workers).start()
+    batcher = MicroBatcher(window, max_batch, pool)
+
+    server = await asyncio.start_server(AsyncPredictionServer(batcher).handle, host, port)
+    print(f"Serving micro-batched predictions on http://{host}:{port} "
+          f"(window {window * 1000:g} ms, max batch {max_batch})", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.close()
+        if pool is not None:
+            pool.close()
+
+
+async def _replay(days: np.ndarray, miles: np.ndarray, receipts: np.ndarray, window: float,
+                  max_batch: int, concurrency: int) -> dict:
+    """Send every trip through a fresh MicroBatcher from ``concurrency`` concurrent callers."""
+    batcher = MicroBatcher(window, max_batch)
+    trips = iter(zip(days.tolist(), miles.tolist(), receipts.tolist()))
+
+    async def caller():
+        for trip in trips:
+            await batcher.predict(*trip)
+
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    await batcher.close()
+    return batcher.metrics.summary()
+
+
+def benchmark(path: str, windows_ms: List[float], max_batches: List[int],
+              concurrency: int) -> List[dict]:
+    """
+    Measure the latency/throughput trade-off over batching settings.
+
+    Returns:
+        One ``BatchMetrics.summary()`` per (window, max batch) pair, with
+        ``window_ms`` and ``max_batch`` added
+    """
+    days, miles, receipts = load_trips(path)
+    get_models()
+    results = []
+    for window_ms in windows_ms:
+        for max_batch in max_batches:
+            summary = asyncio.run(_replay(days, miles, receipts, window_ms / 1000, max_batch,
+                                          concurrency))
+            results.append({'window_ms': window_ms, 'max_batch': max_batch, **summary})
+    return results
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python async_server.py serve [--port 8765] [--window-ms 2] [--max-batch 256] [--workers N]
+        python async_server.py bench <trips.json> [--window-ms 0 1 2 5] [--max-batch 32 256]
+                                     [--concurrency 256]
+    """
+    parser = argparse.ArgumentParser(description="Asyncio micro-batching prediction front end")
+    parser.add_argument('command', choices=['serve', 'bench'])
+    parser.add_argument('path', nargs='?', help="Trips file to replay (bench)")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--window-ms', type=float, nargs='+', default=None)
+    parser.add_argument('--max-batch', type=int, nargs='+', default=None)
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Prefork worker processes to score batches in (serve)")
+    parser.add_argument('--concurrency', type=int, default=256,
+                        help="Concurrent callers replaying the trips (bench)")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port,
+                              (args.window_ms or [DEFAULT_WINDOW_MS])[0] / 1000,
+                              (args.max_batch or [DEFAULT_MAX_BATCH])[0], args.workers))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if not args.path:
+        print("Error: bench needs a trips file", file=sys.stderr)
+        sys.exit(1)
+    try:
+        results = benchmark(args.path, args.window_ms or [0.0, 1.0, 2.0, 5.0],
+                            args.max_batch or [32, DEFAULT_MAX_BATCH], args.concurrency)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"{'window ms':>9s} {'max batch':>9s} {'mean batch':>10s} {'req/s':>10s} "
+          f"{'p50 ms':>8s} {'p99 ms':>8s}")
+    for result in results:
+        print(f"{result['window_ms']:9g} {result['max_batch']:9d} {result['mean_batch_size']:10.1f} "
+              f"{result['requests_per_second']:10,.0f} {result['latency_p50_ms']:8.2f} "
+              f"{result['latency_p99_ms']:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
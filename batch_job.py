@@ -0,0 +1,306 @@
+import sys
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List
+
+from predict_reimbursement import MODEL_DIR, _predict_arrays, get_models, np
+from stream_score import INPUT_NAMES, iter_json_trips, iter_csv_trips, iter_chunks, _write_chunk
+from dataset_cache import source_hash
+from model_registry import resolve_model_dir
+from prediction_cache import model_artifact_hash
+
+
+# Trips per shard: the unit of parallelism, progress and resumption
+DEFAULT_SHARD_SIZE = 100_000
+
+# Progress record in the output directory, rewritten after every shard
+MANIFEST_FILENAME = 'manifest.json'
+
+# Shard inputs, split from the source once per job
+SHARD_INPUT_DIR = 'inputs'
+
+
+def _atomic_write(path: str, write):
+    """Call ``write(f)`` on a temporary file, then rename it over ``path``."""
+    temporary = f'{path}.tmp-{os.getpid()}'
+    try:
+        with open(temporary, 'w', newline='') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def save_manifest(output_dir: str, manifest: dict):
+    """Atomically rewrite the job manifest."""
+    _atomic_write(os.path.join(output_dir, MANIFEST_FILENAME),
+                  lambda f: json.dump(manifest, f, indent=2))
+
+
+def load_manifest(output_dir: str) -> dict:
+    """Read the job manifest (None if the job was never split)."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def split_input(input_path: str, output_dir: str, shard_size: int = DEFAULT_SHARD_SIZE,
+                fmt: str = 'csv') -> List[dict]:
+    """
+    Stream the source into fixed-size shard inputs (``inputs/shard-NNNNN.npy``).
+
+    Returns:
+        One manifest entry per shard, all pending
+    """
+    os.makedirs(os.path.join(output_dir, SHARD_INPUT_DIR), exist_ok=True)
+    shards = []
+    with open(input_path, newline='') as f:
+        trips = iter_csv_trips(f) if input_path.endswith('.csv') else iter_json_trips(f)
+        for shard_id, inputs in enumerate(iter_chunks(trips, shard_size)):
+            name = f'shard-{shard_id:05d}'
+            path = os.path.join(output_dir, SHARD_INPUT_DIR, f'{name}.npy')
+            # np.save appends .npy to names without it, so stage under one
+            temporary = os.path.join(output_dir, SHARD_INPUT_DIR, f'.{name}.tmp.npy')
+            np.save(temporary, inputs)
+            os.replace(temporary, path)
+            shards.append({'id': shard_id, 'rows': int(len(inputs)), 'status': 'pending',
+                           'input': os.path.join(SHARD_INPUT_DIR, f'{name}.npy'),
+                           'output': f'{name}.{fmt}'})
+    return shards
+
+
+def _init_worker(model_dir: str):
+    """Worker-process initializer: load the models once per process."""
+    get_models(model_dir)
+
+
+def score_shard(output_dir: str, shard: dict, model_dir: str, fmt: str = 'csv') -> dict:
+    """
+    Score one shard and atomically write its output file.
+
+    ``model_dir`` should be a version directory, not a registry root, so a
+    promotion mid-job cannot change the model.
+
+    Returns:
+        Dictionary with the shard ``id``, ``rows``, scoring ``seconds`` and
+        the worker ``pid``
+    """
+    start_time = time.perf_counter()
+    inputs = np.load(os.path.join(output_dir, shard['input']), mmap_mode='r')
+    predictions = _predict_arrays(inputs[:, 0], inputs[:, 1], inputs[:, 2], model_dir)
+    _atomic_write(os.path.join(output_dir, shard['output']),
+                  lambda f: _write_chunk(f, np.asarray(inputs), predictions, fmt))
+    return {'id': shard['id'], 'rows': int(len(inputs)),
+            'seconds': time.perf_counter() - start_time, 'pid': os.getpid()}
+
+
+def _score_in_worker(output_dir: str, shard: dict, model_dir: str, fmt: str) -> dict:
+    """Process-pool entry point: failures come back as results, not exceptions."""
+    try:
+        return score_shard(output_dir, shard, model_dir, fmt)
+    except Exception as e:
+        return {'id': shard['id'], 'error': f"{type(e).__name__}: {e}"}
+
+
+def run_job(input_path: str, output_dir: str, model_dir: str = None,
+            shard_size: int = DEFAULT_SHARD_SIZE, workers: int = None, fmt: str = 'csv',
+            max_shards: int = None, restart: bool = False) -> dict:
+    """
+    Score ``input_path`` shard by shard, resuming an earlier run of the same job.
+
+    The first run splits the source into shards and writes the manifest,
+    pinned to the source's content hash and the model version. Every run
+    then scores only the shards not yet done, in ``workers`` processes;
+    each shard's output is written atomically before the manifest marks it
+    done, so an interrupted job loses at most the shards in flight.
+
+    Args:
+        input_path: JSON array, JSON Lines or CSV file of trips
+        output_dir: Directory for the shard outputs and the manifest
+        model_dir: Model directory or registry root (defaults to ``MODEL_DIR``)
+        shard_size: Trips per shard (only used when the job is split)
+        workers: Worker processes (defaults to ``worker_pool.DEFAULT_WORKERS``;
+            1 scores in this process)
+        fmt: 'csv' or 'jsonl' shard outputs (see stream_score.py)
+        max_shards: Score at most this many shards in this run
+        restart: Discard the manifest of an earlier, different job
+
+    Returns:
+        The manifest, whose last ``runs`` entry has this run's throughput
+
+    Raises:
+        ValueError: If the manifest belongs to another source, model or
+            format and ``restart`` is not set
+    """
+    from worker_pool import DEFAULT_WORKERS
+
+    model_version = resolve_model_dir(model_dir or MODEL_DIR)
+    job = {'source': os.path.abspath(input_path), 'source_sha256': source_hash(input_path),
+           'model_dir': model_version, 'model_sha256': model_artifact_hash(model_version),
+           'format': fmt}
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    if manifest is not None and not restart:
+        changed = [key for key, value in job.items() if manifest.get(key) != value]
+        if changed:
+            raise ValueError(f"{output_dir} holds a job with a different {', '.join(changed)}; "
+                             f"pass --restart to rescore from scratch")
+    else:
+        manifest = {**job, 'shard_size': shard_size,
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'runs': [],
+                    'shards': split_input(input_path, output_dir, shard_size, fmt)}
+        save_manifest(output_dir, manifest)
+
+    # Done shards whose output went missing are scored again
+    pending = [shard for shard in manifest['shards']
+               if shard['status'] != 'done'
+               or not os.path.exists(os.path.join(output_dir, shard['output']))]
+    if max_shards is not None:
+        pending = pending[:max_shards]
+
+    workers = max(1, min(workers or DEFAULT_WORKERS, len(pending) or 1))
+    run = {'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'workers': workers,
+           'shards': 0, 'failed': 0, 'rows': 0}
+    start_time = time.perf_counter()
+
+    def finish(result):
+        shard = manifest['shards'][result['id']]
+        if 'error' in result:
+            shard.update(status='failed', error=result['error'])
+            run['failed'] += 1
+        else:
+            shard.update(status='done', seconds=result['seconds'], pid=result['pid'])
+            shard.pop('error', None)
+            run['shards'] += 1
+            run['rows'] += result['rows']
+        save_manifest(output_dir, manifest)
+
+    # Workers score with the version the manifest records, even if the
+    # registry promotes another one mid-job
+    if workers == 1:
+        _init_worker(model_version)
+        for shard in pending:
+            finish(_score_in_worker(output_dir, shard, model_version, fmt))
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(model_version,)) as pool:
+            futures = [pool.submit(_score_in_worker, output_dir, shard, model_version, fmt)
+                       for shard in pending]
+            try:
+                for future in as_completed(futures):
+                    finish(future.result())
+            except BaseException:
+                # Interrupted: finished shards are recorded, the rest stay pending
+                for future in futures:
+                    future.cancel()
+                raise
+
+    run['seconds'] = time.perf_counter() - start_time
+    run['trips_per_second'] = run['rows'] / max(run['seconds'], 1e-9)
+    manifest['runs'].append(run)
+    save_manifest(output_dir, manifest)
+    return manifest
+
+
+def merge_outputs(output_dir: str, merged_path: str):
+    """
+    Concatenate the shard outputs, in input order, into one file.
+
+    Raises:
+        ValueError: If any shard is not done yet
+    """
+    manifest = load_manifest(output_dir)
+    if manifest is None:
+        raise ValueError(f"no {MANIFEST_FILENAME} in {output_dir}")
+    unfinished = [shard['id'] for shard in manifest['shards'] if shard['status'] != 'done']
+    if unfinished:
+        raise ValueError(f"{len(unfinished)} shards not done (first: {unfinished[0]}); "
+                         f"resume the job before merging")
+
+    def write(out):
+        if manifest['format'] == 'csv':
+            out.write(','.join(INPUT_NAMES) + ',predicted_reimbursement\n')
+        for shard in manifest['shards']:
+            with open(os.path.join(output_dir, shard['output'])) as f:
+                for block in iter(lambda: f.read(1 << 20), ''):
+                    out.write(block)
+
+    _atomic_write(merged_path, write)
+
+
+def print_report(manifest: dict):
+    """Print per-shard timing and this run's aggregate throughput."""
+    print(f"{'shard':>6s} {'rows':>9s} {'status':>8s} {'seconds':>9s} {'trips/s':>10s} {'pid':>7s}")
+    for shard in manifest['shards']:
+        seconds = shard.get('seconds')
+        timing = (f"{seconds:9.2f} {shard['rows'] / max(seconds, 1e-9):10,.0f}"
+                  if seconds is not None else f"{'-':>9s} {'-':>10s}")
+        print(f"{shard['id']:6d} {shard['rows']:9d} {shard['status']:>8s} {timing} "
+              f"{shard.get('pid', '-'):>7}")
+        if 'error' in shard:
+            print(f"       {shard['error']}")
+
+    run = manifest['runs'][-1]
+    done = sum(shard['status'] == 'done' for shard in manifest['shards'])
+    print(f"\nThis run: {run['shards']} shards ({run['rows']:,} trips) on {run['workers']} "
+          f"workers in {run['seconds']:.2f}s ({run['trips_per_second']:,.0f} trips/second), "
+          f"{run['failed']} failed")
+    print(f"Job: {done}/{len(manifest['shards'])} shards done")
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python batch_job.py <trips.json|trips.jsonl|trips.csv> --output-dir scored/
+                            [--shard-size 100000] [--workers N] [--format csv|jsonl]
+                            [--max-shards N] [--restart] [--merge results.csv]
+
+    Rerunning the same command after an interruption scores only the
+    shards that were not finished.
+    """
+    parser = argparse.ArgumentParser(description="Sharded, resumable offline batch scoring")
+    parser.add_argument('input', help="JSON array, JSON Lines or CSV file of trips")
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--max-shards', type=int, default=None,
+                        help="Score at most this many shards in this run")
+    parser.add_argument('--restart', action='store_true',
+                        help="Rescore from scratch if the output dir holds another job")
+    parser.add_argument('--merge', default=None,
+                        help="Concatenate the shard outputs into this file once all are done")
+    args = parser.parse_args()
+
+    try:
+        manifest = run_job(args.input, args.output_dir, args.model_dir, args.shard_size,
+                           args.workers, args.format, args.max_shards, args.restart)
+        print_report(manifest)
+        if args.merge and all(shard['status'] == 'done' for shard in manifest['shards']):
+            merge_outputs(args.output_dir, args.merge)
+            print(f"✓ Merged into {args.merge}")
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume", file=sys.stderr)
+        sys.exit(130)
+
+    if any(shard['status'] != 'done' for shard in manifest['shards']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
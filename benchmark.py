@@ -0,0 +1,349 @@
+import sys
+import os
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+from typing import List, Tuple
+
+import predict_reimbursement
+from predict_reimbursement import np
+from stream_score import peak_rss_mb
+
+
+# Wall-clock budget for one cold `predict_reimbursement.py` call (what eval.sh
+# pays per case), including interpreter startup
+STARTUP_BUDGET_MS = 100.0
+
+# Batch sizes for the throughput benchmark
+BATCH_SIZES = [1, 10, 100, 1000, 5000]
+
+DATASETS = ['public_cases.json', 'private_cases.json']
+
+# Stored results that `benchmark.py suite` is compared against
+BASELINE_PATH = 'benchmark_baseline.json'
+
+# Allowed relative slowdown before a metric counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# Metrics where bigger is better; every other metric is a time or size
+HIGHER_IS_BETTER = ('trips_per_second',)
+
+# Latency tails reported but not gated: single slow samples are scheduler
+# noise, so the gate uses p50/p95 and the medians
+UNGATED = ('max_ms', 'p99_ms')
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PREDICT_COMMAND = [sys.executable, os.path.join(SCRIPT_DIR, 'predict_reimbursement.py'),
+                   '5', '250', '450.50']
+
+
+def _time_command(command: List[str], runs: int) -> List[float]:
+    """Run a command ``runs`` times, returning each wall-clock time in ms."""
+    times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run(command, capture_output=True, check=True)
+        times.append((time.perf_counter() - start_time) * 1000)
+    return times
+
+
+def import_breakdown(command: List[str] = None) -> List[Tuple[str, int, int]]:
+    """
+    Collect the ``python -X importtime`` breakdown of a command.
+
+    Args:
+        command: Python command to profile (defaults to a single prediction)
+
+    Returns:
+        List of (module, self µs, cumulative µs) for top-level imports,
+        slowest first
+    """
+    command = command or PREDICT_COMMAND
+    completed = subprocess.run([command[0], '-X', 'importtime', *command[1:]],
+                               capture_output=True, text=True, check=True)
+
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Top-level imports have no indentation; nested ones are part of their parent
+        if not name.startswith('  '):
+            imports.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    return sorted(imports, key=lambda item: item[2], reverse=True)
+
+
+def startup_benchmark(runs: int = 10, budget_ms: float = STARTUP_BUDGET_MS,
+                      top: int = 10) -> dict:
+    """
+    Measure cold-start latency of a single command-line prediction.
+
+    Args:
+        runs: Number of cold processes to time
+        budget_ms: Median wall-clock budget
+        top: Number of slowest top-level imports to report
+
+    Returns:
+        Dictionary with the timings, import breakdown and budget verdict
+    """
+    interpreter_ms = _time_command([sys.executable, '-c', 'pass'], runs)
+    predict_ms = _time_command(PREDICT_COMMAND, runs)
+    imports = import_breakdown()
+
+    median_ms = statistics.median(predict_ms)
+    return {
+        'runs': runs,
+        'interpreter_median_ms': statistics.median(interpreter_ms),
+        'predict_median_ms': median_ms,
+        'predict_max_ms': max(predict_ms),
+        'import_total_ms': sum(cumulative for _, _, cumulative in imports) / 1000,
+        'slowest_imports': [
+            {'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative / 1000}
+            for name, self_us, cumulative in imports[:top]
+        ],
+        'budget_ms': budget_ms,
+        'within_budget': median_ms <= budget_ms,
+    }
+
+
+def print_startup_report(result: dict):
+    """Print a startup benchmark result."""
+    print("\n--- Cold Start (single prediction) ---")
+    print(f"Interpreter only (median):   {result['interpreter_median_ms']:8.1f} ms")
+    print(f"Prediction (median):         {result['predict_median_ms']:8.1f} ms")
+    print(f"Prediction (max):            {result['predict_max_ms']:8.1f} ms")
+    print(f"Top-level imports:           {result['import_total_ms']:8.1f} ms")
+
+    print("\nSlowest imports (cumulative):")
+    for item in result['slowest_imports']:
+        print(f"  {item['module']:30s} {item['cumulative_ms']:8.1f} ms")
+
+    status = "✅ within" if result['within_budget'] else "❌ over"
+    print(f"\n{status} budget of {result['budget_ms']:.0f} ms")
+
+
+def warm_latency(days: np.ndarray, miles: np.ndarray, receipts: np.ndarray) -> dict:
+    """
+    Time single ``predict_reimbursement`` calls with the models already loaded.
+
+    Both prediction caches (the in-process LRU and the ``REIMBURSEMENT_CACHE_DB``
+    disk cache) are bypassed so every call runs the full pipeline.
+
+    Returns:
+        Dictionary of p50/p95/p99/max latency in ms
+    """
+    predict_reimbursement.get_models()
+    cache = predict_reimbursement._PREDICTION_CACHE
+    maxsize, cache.maxsize = cache.maxsize, 0
+    cache_db, predict_reimbursement.CACHE_DB = predict_reimbursement.CACHE_DB, None
+
+    latencies = []
+    try:
+        for trip in zip(days.tolist(), miles.tolist(), receipts.tolist()):
+            cache.clear()
+            start_time = time.perf_counter()
+            predict_reimbursement.predict_reimbursement(*trip)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+    finally:
+        cache.maxsize = maxsize
+        predict_reimbursement.CACHE_DB = cache_db
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'max_ms': max(latencies)}
+
+
+def batch_throughput(days: np.ndarray, miles: np.ndarray, receipts: np.ndarray,
+                     batch_sizes: List[int] = None) -> dict:
+    """
+    Measure vectorized scoring throughput at several batch sizes.
+
+    Returns:
+        Dictionary mapping ``batch_<size>`` to trips/second over the dataset
+    """
+    predict_reimbursement.get_models()
+    results = {}
+    for batch_size in batch_sizes or BATCH_SIZES:
+        start_time = time.perf_counter()
+        for start in range(0, len(days), batch_size):
+            end = start + batch_size
+            predict_reimbursement._predict_arrays(days[start:end], miles[start:end],
+                                                  receipts[start:end])
+        elapsed = time.perf_counter() - start_time
+        results[f'batch_{batch_size}'] = {'trips_per_second': len(days) / elapsed}
+    return results
+
+
+def peak_memory(days: np.ndarray, miles: np.ndarray, receipts: np.ndarray) -> dict:
+    """
+    Measure memory used to score the whole dataset in one batch.
+
+    Returns:
+        Dictionary with the traced Python allocation peak and process peak RSS
+    """
+    predict_reimbursement.get_models()
+    tracemalloc.start()
+    try:
+        predict_reimbursement._predict_arrays(days, miles, receipts)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'batch_peak_mb': peak / 2**20, 'process_peak_rss_mb': peak_rss_mb()}
+
+
+def run_suite(datasets: List[str] = None, startup_runs: int = 10) -> dict:
+    """
+    Run every benchmark over each dataset.
+
+    Args:
+        datasets: Trip files to benchmark (defaults to the public and private cases)
+        startup_runs: Cold processes to time for the startup benchmark
+
+    Returns:
+        Nested results dictionary (see ``flatten_metrics``)
+    """
+    startup = startup_benchmark(startup_runs)
+    results = {
+        'startup': {key: startup[key] for key in
+                    ('interpreter_median_ms', 'predict_median_ms', 'predict_max_ms')},
+        'datasets': {},
+    }
+
+    for path in datasets or DATASETS:
+        days, miles, receipts = predict_reimbursement.load_trips(path)
+        results['datasets'][os.path.basename(path)] = {
+            'trips': len(days),
+            'warm_latency': warm_latency(days, miles, receipts),
+            'batch_throughput': batch_throughput(days, miles, receipts),
+            'memory': peak_memory(days, miles, receipts),
+        }
+
+    return results
+
+
+def flatten_metrics(results: dict, prefix: str = '') -> dict:
+    """Flatten nested results into ``{'a.b.c': value}`` numeric metrics."""
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def compare_to_baseline(results: dict, baseline: dict,
+                        tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Find metrics that regressed beyond ``tolerance`` relative to the baseline.
+
+    Args:
+        results: Output of ``run_suite``
+        baseline: A previous ``run_suite`` output
+        tolerance: Allowed relative change in the bad direction
+
+    Returns:
+        One description per regressed metric (empty when all pass); the
+        ``UNGATED`` latency tails are never reported
+    """
+    current, previous = flatten_metrics(results), flatten_metrics(baseline)
+    regressions = []
+    for name, old in previous.items():
+        if (name not in current or name.endswith('.trips') or name.endswith(UNGATED)
+                or old == 0):
+            continue
+        new = current[name]
+        if name.endswith(HIGHER_IS_BETTER):
+            regressed = new < old * (1 - tolerance)
+        else:
+            regressed = new > old * (1 + tolerance)
+        if regressed:
+            regressions.append(f"{name}: {new:,.3f} vs baseline {old:,.3f}")
+    return regressions
+
+
+def print_suite_report(results: dict):
+    """Print a benchmark suite result."""
+    startup = results['startup']
+    print(f"\nCold start: median {startup['predict_median_ms']:.1f} ms "
+          f"(interpreter {startup['interpreter_median_ms']:.1f} ms)")
+
+    for name, result in results['datasets'].items():
+        latency, memory = result['warm_latency'], result['memory']
+        print(f"\n--- {name} ({result['trips']} trips) ---")
+        print(f"Warm latency: p50 {latency['p50_ms']:.3f} ms, p95 {latency['p95_ms']:.3f} ms, "
+              f"p99 {latency['p99_ms']:.3f} ms")
+        for batch, throughput in result['batch_throughput'].items():
+            print(f"  {batch:12s} {throughput['trips_per_second']:12,.0f} trips/second")
+        print(f"Peak memory: {memory['batch_peak_mb']:.1f} MB traced, "
+              f"{memory['process_peak_rss_mb']:.0f} MB RSS")
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python benchmark.py startup [--runs 10] [--budget-ms 100] [--output results.json]
+        python benchmark.py suite [--output results.json] [--baseline benchmark_baseline.json]
+                                  [--tolerance 0.25] [--update-baseline]
+    """
+    parser = argparse.ArgumentParser(description="Prediction performance benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    startup = subparsers.add_parser('startup', help="Cold-start latency of one prediction")
+    startup.add_argument('--runs', type=int, default=10, help="Cold processes to time")
+    startup.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS,
+                         help="Median wall-clock budget")
+    startup.add_argument('--output', default=None, help="Also write the result as JSON")
+
+    suite = subparsers.add_parser('suite', help="Latency, throughput and memory benchmarks")
+    suite.add_argument('--datasets', nargs='+', default=DATASETS, help="Trip files to use")
+    suite.add_argument('--output', default=None, help="Also write the results as JSON")
+    suite.add_argument('--baseline', default=BASELINE_PATH, help="Stored results to compare with")
+    suite.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                       help="Allowed relative regression per metric")
+    suite.add_argument('--update-baseline', action='store_true',
+                       help="Overwrite the baseline with these results")
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'startup':
+        result = startup_benchmark(args.runs, args.budget_ms)
+        print_startup_report(result)
+        failed = not result['within_budget']
+    else:
+        result = run_suite(args.datasets)
+        print_suite_report(result)
+
+        failed = False
+        if args.update_baseline:
+            with open(args.baseline, 'w') as f:
+                json.dump(result, f, indent=2)
+            print(f"\n✓ Saved baseline to {args.baseline}")
+        elif os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                regressions = compare_to_baseline(result, json.load(f), args.tolerance)
+            if regressions:
+                failed = True
+                print(f"\n❌ {len(regressions)} regression(s) vs {args.baseline}:")
+                for regression in regressions:
+                    print(f"  {regression}")
+            else:
+                print(f"\n✅ No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+from __future__ import annotations
+
+import sys
+import os
+import json
+import argparse
+from bisect import bisect_right
+from typing import Callable, List, Sequence, Tuple
+
+from lazy_imports import lazy_import
+from features import RAW_FEATURES
+
+np = lazy_import('numpy')
+
+
+# Written next to the other model artifacts; load_models attaches it as 'rules'
+RULES_FILENAME = 'rules.json'
+
+# Thresholds of the hypothesized rules (Business Logic Hypothesis Document, H1-H4
+# and the .49/.99 rounding quirk). The dollar amounts are fitted to the cases.
+DEFAULT_THRESHOLDS = {
+    'bonus_min_days': 4,          # H1: bonus zone for 4-6 day trips
+    'bonus_max_days': 6,
+    'mileage_tier_miles': 100.0,  # H2: mileage rate changes past 100 miles
+    'receipt_cap': 800.0,         # H3: diminishing returns above ~$800
+    'low_spend_per_day': 50.0,    # H4: penalty below $50/day
+    'rounding_cents': [49, 99],   # receipts ending in .49 / .99
+}
+
+# One coefficient per term, in this order
+TERM_NAMES = ['base', 'per_diem', 'bonus_zone_per_diem', 'mileage_first_tier',
+              'mileage_second_tier', 'receipts_below_cap', 'receipts_above_cap',
+              'low_spend', 'rounding_quirk']
+
+# Region grid for fallback mode: lower edges along each input
+REGION_EDGES = {
+    'days': [0, 2, 4, 7, 11],
+    'miles': [0, 100, 300, 600, 1000],
+    'receipts': [0, 50, 300, 800, 1500],
+}
+
+# Fallback mode trusts the rules in a region only if it holds at least this
+# many held-out cases and the rules' MAE on them is no worse than the ensemble's
+MIN_REGION_CASES = 5
+
+
+def rule_terms(days: np.ndarray, miles: np.ndarray, receipts: np.ndarray,
+               thresholds: dict = None) -> np.ndarray:
+    """
+    Evaluate every rule term for many trips.
+
+    Returns:
+        Array of shape (n_trips, len(TERM_NAMES)); the reimbursement is this
+        matrix times the fitted coefficients
+    """
+    t = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    days = np.atleast_1d(np.asarray(days, dtype=float))
+    miles = np.atleast_1d(np.asarray(miles, dtype=float))
+    receipts = np.atleast_1d(np.asarray(receipts, dtype=float))
+
+    in_bonus_zone = (days >= t['bonus_min_days']) & (days <= t['bonus_max_days'])
+    cents = np.round(receipts * 100) % 100
+    return np.column_stack([
+        np.ones_like(days),
+        days,
+        days * in_bonus_zone,
+        np.minimum(miles, t['mileage_tier_miles']),
+        np.maximum(miles - t['mileage_tier_miles'], 0),
+        np.minimum(receipts, t['receipt_cap']),
+        np.maximum(receipts - t['receipt_cap'], 0),
+        receipts < t['low_spend_per_day'] * np.maximum(days, 1),
+        np.isin(cents, t['rounding_cents']),
+    ]).astype(float)
+
+
+def rule_terms_one(days: float, miles: float, receipts: float,
+                   thresholds: dict = None) -> List[float]:
+    """Pure-Python ``rule_terms`` for a single trip (no NumPy import)."""
+    t = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    in_bonus_zone = t['bonus_min_days'] <= days <= t['bonus_max_days']
+    return [
+        1.0,
+        days,
+        days if in_bonus_zone else 0.0,
+        min(miles, t['mileage_tier_miles']),
+        max(miles - t['mileage_tier_miles'], 0.0),
+        min(receipts, t['receipt_cap']),
+        max(receipts - t['receipt_cap'], 0.0),
+        float(receipts < t['low_spend_per_day'] * max(days, 1)),
+        float(round(receipts * 100) % 100 in t['rounding_cents']),
+    ]
+
+
+class RuleEngine:
+    """
+    Closed-form reimbursement from the hypothesized business rules.
+
+    In 'residual' mode the ensemble was trained on what the rules miss and
+    the two are added. In 'fallback' mode the rules answer trips in regions
+    where they are at least as accurate as the ensemble on held-out cases and
+    the ensemble answers the rest.
+    """
+
+    def __init__(self, coefficients: Sequence[float], thresholds: dict = None,
+                 mode: str = 'residual', trusted_regions: Sequence[bool] = None,
+                 region_error: Sequence[float] = None, ensemble_error: Sequence[float] = None,
+                 region_cases: Sequence[int] = None):
+        """
+        Args:
+            coefficients: Dollar amount per term of ``TERM_NAMES``
+            thresholds: Overrides of ``DEFAULT_THRESHOLDS``
+            mode: 'residual' or 'fallback'
+            trusted_regions: Fallback mode: flat mask over the ``REGION_EDGES`` grid
+            region_error: Fallback mode: held-out MAE of the rules per region
+            ensemble_error: Fallback mode: held-out MAE of the ensemble per region
+            region_cases: Fallback mode: held-out cases per region
+        """
+        if mode not in ('residual', 'fallback'):
+            raise ValueError(f"Unknown rule mode: {mode}")
+        self.coefficients = [float(c) for c in coefficients]
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.mode = mode
+        self.trusted_regions = list(trusted_regions or [])
+        self.region_error = list(region_error or [])
+        self.ensemble_error = list(ensemble_error or [])
+        self.region_cases = list(region_cases or [])
+
+    def predict(self, days, miles, receipts) -> np.ndarray:
+        """Rule-based reimbursement for many trips."""
+        return rule_terms(days, miles, receipts, self.thresholds) @ np.array(self.coefficients)
+
+    def predict_one(self, days: float, miles: float, receipts: float) -> float:
+        """Rule-based reimbursement for one trip, in pure Python."""
+        terms = rule_terms_one(days, miles, receipts, self.thresholds)
+        return sum(c * x for c, x in zip(self.coefficients, terms))
+
+    def trusted(self, days, miles, receipts) -> np.ndarray:
+        """Fallback mode: mask of trips in regions where the rules are trusted."""
+        index = region_index(days, miles, receipts)
+        return np.array(self.trusted_regions, dtype=bool)[index]
+
+    def apply(self, days, miles, receipts, ensemble: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+        """
+        Combine the rules with the ensemble for many trips.
+
+        Args:
+            days, miles, receipts: Input arrays
+            ensemble: Called with a row mask, returns the ensemble's
+                predictions for those rows
+
+        Returns:
+            Array of final predictions
+        """
+        predictions = self.predict(days, miles, receipts)
+        if self.mode == 'residual':
+            return predictions + ensemble(np.ones(len(predictions), dtype=bool))
+
+        untrusted = ~self.trusted(days, miles, receipts)
+        if untrusted.any():
+            predictions[untrusted] = ensemble(untrusted)
+        return predictions
+
+    def apply_one(self, days: float, miles: float, receipts: float,
+                  ensemble: Callable[[], float]) -> float:
+        """Pure-Python ``apply`` for a single trip; ``ensemble`` takes no arguments."""
+        prediction = self.predict_one(days, miles, receipts)
+        if self.mode == 'residual':
+            return prediction + ensemble()
+        if self.trusted_regions[region_index_one(days, miles, receipts)]:
+            return prediction
+        return ensemble()
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form (see ``save_rules``)."""
+        return {'mode': self.mode, 'terms': TERM_NAMES, 'coefficients': self.coefficients,
+                'thresholds': self.thresholds, 'region_edges': REGION_EDGES,
+                'trusted_regions': self.trusted_regions, 'region_error': self.region_error,
+                'ensemble_error': self.ensemble_error, 'region_cases': self.region_cases}
+
+
+def region_index(days, miles, receipts) -> np.ndarray:
+    """Flat ``REGION_EDGES`` grid index of each trip."""
+    index = np.zeros(len(np.atleast_1d(days)), dtype=np.intp)
+    for name, values in (('days', days), ('miles', miles), ('receipts', receipts)):
+        edges = REGION_EDGES[name]
+        position = np.searchsorted(edges, np.atleast_1d(np.asarray(values, dtype=float)),
+                                   side='right') - 1
+        index = index * len(edges) + np.clip(position, 0, len(edges) - 1)
+    return index
+
+
+def region_index_one(days: float, miles: float, receipts: float) -> int:
+    """Pure-Python ``region_index`` for a single trip."""
+    index = 0
+    for name, value in (('days', days), ('miles', miles), ('receipts', receipts)):
+        edges = REGION_EDGES[name]
+        index = index * len(edges) + min(max(bisect_right(edges, value) - 1, 0), len(edges) - 1)
+    return index
+
+
+def fit_rules(days: np.ndarray, miles: np.ndarray, receipts: np.ndarray, expected: np.ndarray,
+              mode: str = 'residual', thresholds: dict = None, holdout: Tuple = None,
+              min_region_cases: int = MIN_REGION_CASES) -> RuleEngine:
+    """
+    Fit the rules' dollar amounts to known cases by least squares.
+
+    With the thresholds fixed, every rule is linear in its dollar amount, so
+    the fit is a single ``lstsq`` solve.
+
+    Args:
+        days, miles, receipts: Input arrays of the known cases
+        expected: Their recorded reimbursements
+        mode: 'residual' or 'fallback'
+        thresholds: Overrides of ``DEFAULT_THRESHOLDS``
+        holdout: Fallback mode: (days, miles, receipts, expected, ensemble
+            predictions) of cases neither the rules nor the ensemble were
+            fitted on; the trusted regions are chosen on these
+        min_region_cases: Fallback mode: regions with fewer held-out cases
+            keep the ensemble
+
+    Returns:
+        Fitted RuleEngine
+
+    Raises:
+        ValueError: In fallback mode without ``holdout``
+    """
+    terms = rule_terms(days, miles, receipts, thresholds)
+    expected = np.asarray(expected, dtype=float)
+    coefficients = np.linalg.lstsq(terms, expected, rcond=None)[0]
+    if mode != 'fallback':
+        return RuleEngine(coefficients, thresholds, mode)
+    if holdout is None:
+        raise ValueError("fallback mode needs held-out cases to choose its trusted regions")
+
+    holdout_days, holdout_miles, holdout_receipts, holdout_expected, ensemble = holdout
+    holdout_expected = np.asarray(holdout_expected, dtype=float)
+    rules_errors = np.abs(rule_terms(holdout_days, holdout_miles, holdout_receipts, thresholds)
+                          @ coefficients - holdout_expected)
+    ensemble_errors = np.abs(np.asarray(ensemble, dtype=float) - holdout_expected)
+
+    n_regions = int(np.prod([len(edges) for edges in REGION_EDGES.values()]))
+    index = region_index(holdout_days, holdout_miles, holdout_receipts)
+    counts = np.bincount(index, minlength=n_regions)
+    region_error = np.bincount(index, weights=rules_errors, minlength=n_regions) / np.maximum(counts, 1)
+    ensemble_error = np.bincount(index, weights=ensemble_errors,
+                                 minlength=n_regions) / np.maximum(counts, 1)
+    trusted = (counts >= max(min_region_cases, 1)) & (region_error <= ensemble_error)
+
+    # Regions without any held-out case have no error to report
+    return RuleEngine(coefficients, thresholds, mode, trusted.tolist(),
+                      [float(e) if n else None for e, n in zip(region_error, counts)],
+                      [float(e) if n else None for e, n in zip(ensemble_error, counts)],
+                      counts.tolist())
+
+
+def fit_fallback_rules(model_dir: str, data_path: str = 'public_cases.csv',
+                       min_region_cases: int = MIN_REGION_CASES) -> RuleEngine:
+    """
+    Fit fallback-mode rules against the ensemble of a model directory.
+
+    The rules are fitted on the training split that ``train_models.py`` uses
+    and the regions are judged on its hold-out split, where neither the rules
+    nor the ensemble have seen the cases.
+
+    Args:
+        model_dir: Directory written by ``ModelTrainer.save_models``
+        data_path: Cases the models were trained on
+        min_region_cases: Regions with fewer held-out cases keep the ensemble
+
+    Returns:
+        Fitted RuleEngine
+    """
+    import contextlib
+    from train_models import ModelTrainer
+    from predict_reimbursement import load_models, ensemble_predict_batch
+
+    trainer = ModelTrainer(data_path=data_path)
+    with contextlib.redirect_stdout(sys.stderr):
+        X_train, X_test, y_train, y_test = trainer.load_and_prepare_data()
+    raw = [trainer.feature_names.index(name) for name in RAW_FEATURES]
+
+    # The models as they are served without rules
+    models = load_models(model_dir, use_lookup_table=False, case_index='')
+    models.pop('rules', None)
+    ensemble = ensemble_predict_batch(models, X_test)
+
+    return fit_rules(*X_train[:, raw].T, y_train, 'fallback',
+                     holdout=(*X_test[:, raw].T, y_test, ensemble),
+                     min_region_cases=min_region_cases)
+
+
+def save_rules(model_dir: str, rules: RuleEngine):
+    """Write a RuleEngine to ``rules.json`` in a model directory."""
+    with open(os.path.join(model_dir, RULES_FILENAME), 'w') as f:
+        json.dump(rules.to_dict(), f, indent=2)
+
+
+def load_rules(model_dir: str) -> RuleEngine:
+    """
+    Read the ``rules.json`` of a model directory.
+
+    Raises:
+        ValueError: For fallback rules whose regions were not chosen on
+            held-out cases (written before ``fit_fallback_rules``)
+    """
+    with open(os.path.join(model_dir, RULES_FILENAME)) as f:
+        data = json.load(f)
+    if data['mode'] == 'fallback' and 'region_cases' not in data:
+        raise ValueError(f"{RULES_FILENAME} in {model_dir} predates held-out region checks; "
+                         f"refit it with business_rules.py fit")
+    return RuleEngine(data['coefficients'], data['thresholds'], data['mode'],
+                      data.get('trusted_regions'), data.get('region_error'),
+                      data.get('ensemble_error'), data.get('region_cases'))
+
+
+def print_fallback_report(rules: RuleEngine):
+    """Print the held-out accuracy of the rules and the ensemble in each trusted region."""
+    trusted = [i for i, trust in enumerate(rules.trusted_regions) if trust]
+    cases = sum(rules.region_cases)
+    answered = sum(rules.region_cases[i] for i in trusted)
+    if not answered:
+        print(f"Rules answer 0/{cases} held-out cases; the ensemble is served everywhere")
+        return
+    rules_mae = sum(rules.region_error[i] * rules.region_cases[i] for i in trusted) / answered
+    ensemble_mae = sum(rules.ensemble_error[i] * rules.region_cases[i] for i in trusted) / answered
+    print(f"Rules answer {answered}/{cases} held-out cases in {len(trusted)} regions "
+          f"(MAE ${rules_mae:.2f} vs ensemble ${ensemble_mae:.2f} on those)")
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python business_rules.py fit [--model-dir models] [--data public_cases.csv]
+                                     [--min-region-cases 5]
+        python business_rules.py show [--model-dir models]
+
+    ``fit`` attaches fallback-mode rules to an existing model directory (for a
+    registry root, as a new version), using the hold-out split of ``--data``
+    that ``train_models.py`` sets aside. For residual mode, train with
+    ``python train_models.py --rules``.
+    """
+    from predict_reimbursement import MODEL_DIR
+    from model_registry import is_registry, resolve_model_dir, publish, _copy_files
+
+    parser = argparse.ArgumentParser(description="Business-rule fast path")
+    parser.add_argument('command', choices=['fit', 'show'])
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--data', default='public_cases.csv')
+    parser.add_argument('--min-region-cases', type=int, default=MIN_REGION_CASES)
+    args = parser.parse_args()
+
+    try:
+        source = resolve_model_dir(args.model_dir)
+        if args.command == 'fit':
+            rules_path = os.path.join(source, RULES_FILENAME)
+            if os.path.exists(rules_path):
+                with open(rules_path) as f:
+                    mode = json.load(f)['mode']
+                if mode == 'residual':
+                    raise ValueError(f"{source} was trained on the rules' residual; "
+                                     f"its rules can't be replaced")
+            rules = fit_fallback_rules(source, args.data, args.min_region_cases)
+
+            if is_registry(args.model_dir):
+                # Published versions are immutable
+                def write_artifacts(staging):
+                    _copy_files(source, staging)
+                    if os.path.exists(os.path.join(staging, RULES_FILENAME)):
+                        os.remove(os.path.join(staging, RULES_FILENAME))
+                    save_rules(staging, rules)
+                version = publish(args.model_dir, write_artifacts)
+                print(f"✓ Published {source} with {RULES_FILENAME} as {version}")
+            else:
+                save_rules(source, rules)
+                print(f"✓ Saved {RULES_FILENAME} to {source}")
+        else:
+            rules = load_rules(source)
+
+        print(f"Mode: {rules.mode}")
+        if rules.mode == 'fallback':
+            print_fallback_report(rules)
+        for name, coefficient in zip(TERM_NAMES, rules.coefficients):
+            print(f"  {name:22s} {coefficient:10.3f}")
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import sys
+import os
+import time
+import argparse
+from typing import Callable, List, Optional, Tuple
+
+from lazy_imports import lazy_import
+from prediction_cache import MODEL_SUFFIXES, model_artifact_hash
+from business_rules import RULES_FILENAME
+from model_router import ROUTER_FILENAME
+from distillation import STUDENT_FILENAME
+
+np = lazy_import('numpy')
+
+
+# Prebuilt index, written next to the models
+INDEX_FILENAME = 'case_index.npz'
+
+# Known trips averaged into the neighbour correction
+NEIGHBOURS = 10
+
+# Neighbours farther than this (in standard deviations of each input) are
+# ignored; trips with none in range get no correction
+RADIUS = 1.0
+
+# Added to neighbour distances before inverse-distance weighting, so one
+# very close neighbour cannot take all the weight
+DISTANCE_EPSILON = 0.05
+
+# Recorded outputs of one trip that disagree by more than this are not
+# served as exact answers
+CONFLICT_TOLERANCE = 0.01
+
+# Folds of the build-time check that the neighbour correction lowers MAE
+CHECK_FOLDS = 5
+
+# Artifacts each source's residuals depend on; the index records their hash
+SOURCE_SUFFIXES = {
+    'ensemble': MODEL_SUFFIXES + (RULES_FILENAME, ROUTER_FILENAME),
+    'student': (STUDENT_FILENAME, RULES_FILENAME),
+}
+
+
+def _key(trip_duration_days, miles_traveled, total_receipts_amount) -> Tuple[int, int, int]:
+    """Exact-match key: every input to the cent."""
+    return (round(trip_duration_days * 100), round(miles_traveled * 100),
+            round(total_receipts_amount * 100))
+
+
+class CaseIndex:
+    """
+    Historical cases indexed for instant answers.
+
+    Trips seen before are answered with their recorded reimbursement from a
+    hash table. Other trips keep the ensemble's prediction, corrected by the
+    ensemble's error on their nearest known trips (a KD-tree over the
+    standardized inputs) if ``build_index`` found that this lowers the MAE.
+    """
+
+    def __init__(self, days: np.ndarray, miles: np.ndarray, receipts: np.ndarray,
+                 expected: np.ndarray, residuals: np.ndarray, source: str = 'ensemble',
+                 model_hash: str = None, check: dict = None):
+        """
+        Args:
+            days, miles, receipts: Inputs of the known trips
+            expected: Their recorded reimbursements
+            residuals: ``expected`` minus the served model's prediction
+            source: Which model the residuals belong to ('ensemble' or 'student')
+            model_hash: ``served_model_hash`` of the artifacts behind the residuals
+            check: Held-out result of the neighbour correction (see
+                ``check_correction``); without it, misses are not corrected
+        """
+        from scipy.spatial import cKDTree
+
+        self.days = np.asarray(days, dtype=float)
+        self.miles = np.asarray(miles, dtype=float)
+        self.receipts = np.asarray(receipts, dtype=float)
+        self.expected = np.asarray(expected, dtype=float)
+        self.residuals = np.asarray(residuals, dtype=float)
+        self.source = source
+        self.model_hash = model_hash
+        self.check = check
+        self.use_correction = bool(check and check['corrected_mae'] < check['mae'])
+
+        answers = {}
+        for key, value in zip(map(_key, self.days.tolist(), self.miles.tolist(),
+                                  self.receipts.tolist()), self.expected.tolist()):
+            answers.setdefault(key, []).append(value)
+        # Plain floats, so exact lookups stay pure Python
+        self.exact = {key: values[0] for key, values in answers.items()
+                      if max(values) - min(values) <= CONFLICT_TOLERANCE}
+
+        points = np.column_stack([self.days, self.miles, self.receipts])
+        self.scale = np.where(points.std(axis=0) > 0, points.std(axis=0), 1.0)
+        self.tree = cKDTree(points / self.scale)
+
+        self.lookups = 0
+        self.exact_hits = 0
+        self.corrected = 0
+        self.lookup_seconds = 0.0
+
+    def __len__(self):
+        return len(self.expected)
+
+    def lookup(self, days: np.ndarray, miles: np.ndarray,
+               receipts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Recorded reimbursements of known trips.
+
+        Returns:
+            Tuple of (values, hit mask); values are NaN where there is no hit
+        """
+        start_time = time.perf_counter()
+        values = np.array([self.exact.get(key, np.nan) for key in
+                           map(_key, np.asarray(days, dtype=float).tolist(),
+                               np.asarray(miles, dtype=float).tolist(),
+                               np.asarray(receipts, dtype=float).tolist())], dtype=float)
+        hits = ~np.isnan(values)
+        self.lookups += len(values)
+        self.exact_hits += int(hits.sum())
+        self.lookup_seconds += time.perf_counter() - start_time
+        return values, hits
+
+    def lookup_one(self, trip_duration_days, miles_traveled,
+                   total_receipts_amount) -> Optional[float]:
+        """Recorded reimbursement of one trip, or None if it is not known."""
+        start_time = time.perf_counter()
+        value = self.exact.get(_key(trip_duration_days, miles_traveled, total_receipts_amount))
+        self.lookups += 1
+        self.exact_hits += value is not None
+        self.lookup_seconds += time.perf_counter() - start_time
+        return value
+
+    def correction(self, days: np.ndarray, miles: np.ndarray,
+                   receipts: np.ndarray) -> np.ndarray:
+        """
+        Inverse-distance weighted mean residual of each trip's nearest known trips.
+
+        Returns:
+            Amount to add to the served prediction (0 with no neighbour in ``RADIUS``)
+        """
+        if not self.use_correction:
+            return np.zeros(len(days))
+        return self._correction(days, miles, receipts)
+
+    def _correction(self, days: np.ndarray, miles: np.ndarray,
+                    receipts: np.ndarray) -> np.ndarray:
+        """``correction`` whether or not it was found to help."""
+        start_time = time.perf_counter()
+        queries = np.column_stack([days, miles, receipts]).astype(float) / self.scale
+        k = min(NEIGHBOURS, len(self))
+        distances, neighbours = self.tree.query(queries, k=k, distance_upper_bound=RADIUS)
+        distances = distances.reshape(len(queries), k)
+        neighbours = neighbours.reshape(len(queries), k)
+
+        # Missing neighbours come back with infinite distance and index len(self)
+        in_range = np.isfinite(distances)
+        weights = np.where(in_range, 1.0 / (np.where(in_range, distances, 0) + DISTANCE_EPSILON), 0)
+        residuals = np.append(self.residuals, 0.0)[neighbours]
+        total = weights.sum(axis=1)
+        corrections = np.where(total > 0, (weights * residuals).sum(axis=1)
+                               / np.where(total > 0, total, 1), 0.0)
+
+        self.corrected += int((total > 0).sum())
+        self.lookup_seconds += time.perf_counter() - start_time
+        return corrections
+
+    def apply(self, days: np.ndarray, miles: np.ndarray, receipts: np.ndarray,
+              ensemble: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+        """
+        Answer known trips exactly, the rest with the corrected ensemble.
+
+        Args:
+            days, miles, receipts: Trip inputs
+            ensemble: Maps a row mask to the served model's predictions for those rows
+        """
+        predictions, hits = self.lookup(days, miles, receipts)
+        misses = ~hits
+        if misses.any():
+            predictions[misses] = ensemble(misses) + self.correction(
+                days[misses], miles[misses], receipts[misses])
+        return predictions
+
+    def apply_one(self, trip_duration_days, miles_traveled, total_receipts_amount,
+                  ensemble: Callable[[], float]) -> float:
+        """Single-trip ``apply``: the exact hit is a dict lookup."""
+        value = self.lookup_one(trip_duration_days, miles_traveled, total_receipts_amount)
+        if value is not None:
+            return value
+        if not self.use_correction:
+            return ensemble()
+        return ensemble() + float(self.correction([trip_duration_days], [miles_traveled],
+                                                  [total_receipts_amount])[0])
+
+    def stats(self) -> dict:
+        """
+        Lookup counters since the index was loaded.
+
+        Returns:
+            Dictionary with ``cases``, ``lookups``, ``exact_hits``, ``hit_rate``,
+            ``corrected`` (misses with a neighbour in range) and
+            ``mean_lookup_us`` (hash lookup plus neighbour search, per trip)
+        """
+        return {
+            'cases': len(self),
+            'exact_answers': len(self.exact),
+            'lookups': self.lookups,
+            'exact_hits': self.exact_hits,
+            'hit_rate': self.exact_hits / self.lookups if self.lookups else 0.0,
+            'corrected': self.corrected,
+            'mean_lookup_us': self.lookup_seconds / self.lookups * 1e6 if self.lookups else 0.0,
+        }
+
+
+def served_model_hash(model_dir: str, source: str) -> str:
+    """Hash of the artifacts in ``model_dir`` that ``source``'s predictions depend on."""
+    return model_artifact_hash(model_dir, SOURCE_SUFFIXES[source])
+
+
+def check_correction(index: CaseIndex, n_folds: int = CHECK_FOLDS,
+                     random_state: int = 42) -> dict:
+    """
+    Measure the neighbour correction on cases left out of the neighbour search.
+
+    Each fold of the known cases is corrected from the residuals of the
+    other folds only, so no case corrects itself.
+
+    Returns:
+        Dictionary with the ``folds`` and the served model's ``mae`` on the
+        known cases without and with (``corrected_mae``) the correction
+    """
+    predictions = index.expected - index.residuals
+    corrected = predictions.copy()
+    n_folds = min(n_folds, len(index))
+    fold = np.random.default_rng(random_state).permutation(len(index)) % n_folds
+    for k in range(n_folds):
+        held_out = fold == k
+        rest = CaseIndex(index.days[~held_out], index.miles[~held_out],
+                         index.receipts[~held_out], index.expected[~held_out],
+                         index.residuals[~held_out])
+        corrected[held_out] += rest._correction(index.days[held_out], index.miles[held_out],
+                                                index.receipts[held_out])
+    return {
+        'folds': int(n_folds),
+        'mae': float(np.abs(index.residuals).mean()),
+        'corrected_mae': float(np.abs(index.expected - corrected).mean()),
+    }
+
+
+def build_index(predict: Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray],
+                days: np.ndarray, miles: np.ndarray, receipts: np.ndarray,
+                expected: np.ndarray, source: str = 'ensemble',
+                model_hash: str = None) -> CaseIndex:
+    """
+    Index known cases against the model that will serve the other trips.
+
+    The neighbour correction is only enabled if ``check_correction`` finds
+    that it lowers the held-out MAE.
+
+    Args:
+        predict: Maps (days, miles, receipts) arrays to the served model's predictions
+        days, miles, receipts, expected: Known cases
+        source: Label of the model behind ``predict``
+        model_hash: ``served_model_hash`` of the artifacts behind ``predict``
+    """
+    expected = np.asarray(expected, dtype=float)
+    residuals = expected - predict(days, miles, receipts)
+    unchecked = CaseIndex(days, miles, receipts, expected, residuals, source, model_hash)
+    if len(unchecked) < 2:
+        return unchecked
+    return CaseIndex(days, miles, receipts, expected, residuals, source, model_hash,
+                     check_correction(unchecked))
+
+
+def save_index(model_dir: str, index: CaseIndex):
+    """Write ``case_index.npz``."""
+    check = index.check or {'folds': 0, 'mae': np.nan, 'corrected_mae': np.nan}
+    np.savez(os.path.join(model_dir, INDEX_FILENAME), days=index.days, miles=index.miles,
+             receipts=index.receipts, expected=index.expected, residuals=index.residuals,
+             source=np.array(index.source), model_hash=np.array(index.model_hash or ''),
+             check=np.array([check['folds'], check['mae'], check['corrected_mae']]))
+
+
+def load_index(model_dir: str) -> CaseIndex:
+    """Read ``case_index.npz``."""
+    with np.load(os.path.join(model_dir, INDEX_FILENAME)) as data:
+        # Indexes written before the hash and the check have neither
+        model_hash = str(data['model_hash']) if 'model_hash' in data else ''
+        check = None
+        if 'check' in data and data['check'][0] > 0:
+            folds, mae, corrected_mae = data['check'].tolist()
+            check = {'folds': int(folds), 'mae': mae, 'corrected_mae': corrected_mae}
+        return CaseIndex(data['days'], data['miles'], data['receipts'], data['expected'],
+                         data['residuals'], str(data['source']), model_hash or None, check)
+
+
+def load_cases(paths: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Concatenate labeled case files (see dataset_cache.py)."""
+    from dataset_cache import load_labeled
+
+    columns = list(zip(*(load_labeled(path) for path in paths)))
+    return tuple(np.concatenate(column) for column in columns)
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python case_index.py build [--model-dir models] [--cases public_cases.json ...]
+        python case_index.py query <days> <miles> <receipts> [--model-dir models]
+
+    ``build`` writes ``case_index.npz`` (for a registry root, as a new
+    version). Serve it with ``REIMBURSEMENT_CASE_INDEX=1``.
+    """
+    from predict_reimbursement import (MODEL_DIR, BACKEND, load_models, preprocess_batch,
+                                       ensemble_predict_batch)
+    from model_registry import is_registry, resolve_model_dir, publish, _copy_files
+
+    parser = argparse.ArgumentParser(description="Exact-match and nearest-neighbour case index")
+    parser.add_argument('command', choices=['build', 'query'])
+    parser.add_argument('trip', nargs='*', type=float)
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--cases', nargs='+', default=['public_cases.json'],
+                        help="Labeled case files (e.g. the settled-case archive)")
+    args = parser.parse_args()
+
+    try:
+        source = resolve_model_dir(args.model_dir)
+        if args.command == 'query':
+            if len(args.trip) != 3:
+                raise ValueError("query takes <days> <miles> <receipts>")
+            index = load_index(source)
+            value = index.lookup_one(*args.trip)
+            if value is None:
+                correction = float(index.correction(*([x] for x in args.trip))[0])
+                print(f"Not a known trip; neighbour correction {correction:+.2f}")
+            else:
+                print(f"Known trip: {value:.2f}")
+            return
+
+        # Residuals against the ensemble as served, without an older index
+        models = load_models(source, use_lookup_table=False, case_index='')
+        predict = lambda d, m, r: ensemble_predict_batch(
+            models, preprocess_batch(d, m, r, models['feature_names']))
+        label = 'student' if BACKEND == 'student' else 'ensemble'
+        index = build_index(predict, *load_cases(args.cases), label,
+                            served_model_hash(source, label))
+
+        if is_registry(args.model_dir):
+            def write_artifacts(staging):
+                _copy_files(source, staging)
+                save_index(staging, index)
+            version = publish(args.model_dir, write_artifacts)
+            print(f"✓ Published {source} with {INDEX_FILENAME} as {version}")
+        else:
+            save_index(source, index)
+            print(f"✓ Saved {INDEX_FILENAME} to {source}")
+        print(f"  {len(index)} cases, {len(index.exact)} exact answers, residual MAE "
+              f"${np.abs(index.residuals).mean():.2f}")
+        if index.check is not None:
+            print(f"  Held-out MAE ${index.check['mae']:.2f} uncorrected, "
+                  f"${index.check['corrected_mae']:.2f} with the neighbour correction "
+                  f"({'enabled' if index.use_correction else 'disabled'})")
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+from __future__ import annotations
+
+import sys
+import os
+import json
+import mmap
+import struct
+from array import array
+from typing import List
+
+from lazy_imports import lazy_import
+
+# Only the batch path needs NumPy; predict_one runs on the raw buffer
+np = lazy_import('numpy')
+
+
+# File written next to the pickles by ModelTrainer.save_models
+COMPILED_FILENAME = 'ensemble.bin'
+
+# File layout: MAGIC, uint64 header length, JSON header (space-padded), then
+# the raw little-endian arrays, each starting on an 8-byte boundary
+MAGIC = b'ENSMBL01'
+
+LINEAR_MODELS = {'linear_regression', 'ridge', 'lasso'}
+
+# Rows scored per tree-traversal pass, bounding the (rows x trees) node matrix
+TREE_CHUNK_SIZE = 4096
+
+
+def compile_ensemble(models: dict, feature_names: List[str]) -> dict:
+    """
+    Compile a trained ensemble into flat NumPy arrays.
+
+    The linear models are folded into a single weighted coefficient vector,
+    every tree of the decision tree, random forest and gradient boosting
+    models is concatenated into one node table (leaf values pre-multiplied
+    by the tree's share of the ensemble weight), and the MLP is stored as
+    its scaler statistics and layer weights.
+
+    Args:
+        models: Dictionary of trained models, ``nn_scaler`` and (optionally)
+            ``ensemble_weights``, as produced by ``ModelTrainer``
+        feature_names: Feature columns the models were trained on
+
+    Returns:
+        Dictionary of arrays, ready for ``write_compiled``
+    """
+    weights = models.get('ensemble_weights')
+    if weights is None:
+        names = [name for name, model in models.items()
+                 if hasattr(model, 'predict') and not name.endswith('_scaler')]
+        weights = {name: 1.0 / len(names) for name in names}
+
+    n_features = len(feature_names)
+    linear_coef = np.zeros(n_features)
+    constant = 0.0
+    trees = []  # (sklearn tree, weight applied to its leaf values)
+    arrays = {'feature_names': np.array(feature_names)}
+
+    for name, weight in weights.items():
+        model = models[name]
+
+        if name in LINEAR_MODELS:
+            linear_coef += weight * np.ravel(model.coef_)
+            constant += weight * float(np.ravel(model.intercept_)[0])
+
+        elif name == 'decision_tree':
+            trees.append((model.tree_, weight))
+
+        elif name == 'random_forest':
+            trees += [(estimator.tree_, weight / len(model.estimators_))
+                      for estimator in model.estimators_]
+
+        elif name == 'gradient_boosting':
+            constant += weight * float(np.ravel(model.init_.constant_)[0])
+            trees += [(estimator.tree_, weight * model.learning_rate)
+                      for estimator in model.estimators_[:, 0]]
+
+        elif name == 'neural_network':
+            if model.activation != 'relu' or model.out_activation_ != 'identity':
+                raise ValueError(f"Unsupported MLP activation: {model.activation}")
+            scaler = models['nn_scaler']
+            arrays['mlp_mean'] = scaler.mean_
+            arrays['mlp_scale'] = scaler.scale_
+            arrays['mlp_weight'] = np.array(weight)
+            arrays['mlp_layers'] = np.array(len(model.coefs_))
+            for i, (coef, intercept) in enumerate(zip(model.coefs_, model.intercepts_)):
+                arrays[f'mlp_coef_{i}'] = coef
+                arrays[f'mlp_intercept_{i}'] = intercept
+
+        else:
+            raise ValueError(f"Don't know how to compile model '{name}'")
+
+    arrays['linear_coef'] = linear_coef
+    arrays['constant'] = np.array(constant)
+    arrays.update(_flatten_trees(trees))
+
+    return arrays
+
+
+def _flatten_trees(trees: list) -> dict:
+    """Concatenate sklearn trees into one node table with global child indices."""
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset, max_depth = 0, 0
+
+    for tree, weight in trees:
+        n_nodes = tree.node_count
+        is_leaf = tree.children_left == -1
+        node_ids = np.arange(n_nodes) + offset
+
+        # Leaves point at themselves, so extra traversal steps are no-ops
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        # Interleaved (left, right) pairs: the next node is children[2n + went_right]
+        children.append(np.column_stack([
+            np.where(is_leaf, node_ids, tree.children_left + offset),
+            np.where(is_leaf, node_ids, tree.children_right + offset),
+        ]).ravel().astype(np.int32))
+        values.append(weight * tree.value[:, 0, 0])
+        roots.append(offset)
+
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    if not trees:
+        return {'tree_roots': np.zeros(0, dtype=np.int32)}
+
+    return {
+        'tree_feature': np.concatenate(features),
+        'tree_threshold': np.concatenate(thresholds),
+        'tree_children': np.concatenate(children),
+        'tree_value': np.concatenate(values),
+        'tree_roots': np.array(roots, dtype=np.int32),
+        'tree_depth': np.array(max_depth),
+    }
+
+
+class CompiledEnsemble:
+    """
+    Evaluator for an ensemble written by ``save_compiled``.
+
+    The arrays stay in the memory-mapped file. ``predict`` scores feature
+    matrices with NumPy views over it; ``predict_one`` scores a single row
+    in pure Python, so a one-off prediction never imports NumPy.
+    """
+
+    def __init__(self, header: dict, buffer):
+        """
+        Args:
+            header: Parsed JSON header of the compiled file
+            buffer: Buffer holding the whole file (usually an ``mmap``)
+        """
+        self.header = header
+        self.buffer = buffer
+        self.feature_names = header['feature_names']
+
+        scalars = header['scalars']
+        self.constant = scalars['constant']
+        self.tree_depth = scalars.get('tree_depth', 0)
+        self.mlp_weight = scalars.get('mlp_weight', 0.0)
+        self.n_mlp_layers = scalars.get('mlp_layers', 0)
+        self.n_trees = header['arrays']['tree_roots']['shape'][0]
+
+        self._arrays = None
+        self._views = None
+
+    def array(self, name: str):
+        """Zero-copy NumPy view of a stored array."""
+        spec = self.header['arrays'][name]
+        count = 1
+        for size in spec['shape']:
+            count *= size
+        return np.frombuffer(self.buffer, dtype=spec['dtype'], count=count,
+                             offset=spec['offset']).reshape(spec['shape'])
+
+    def view(self, name: str) -> memoryview:
+        """Flat typed ``memoryview`` of a stored array (row-major)."""
+        spec = self.header['arrays'][name]
+        nbytes = spec['itemsize']
+        for size in spec['shape']:
+            nbytes *= size
+        raw = memoryview(self.buffer)[spec['offset']:spec['offset'] + nbytes]
+        return raw.cast('d' if spec['dtype'] == '<f8' else 'i')
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Score a feature matrix.
+
+        Args:
+            features: Array of shape (n_trips, n_features)
+
+        Returns:
+            Array of n_trips ensemble predictions
+        """
+        if self._arrays is None:
+            self._arrays = {name: self.array(name) for name in self.header['arrays']}
+
+        features = np.asarray(features, dtype=float)
+        predictions = features @ self._arrays['linear_coef'] + self.constant
+
+        if self.n_trees:
+            predictions += self._predict_trees(features)
+
+        if self.n_mlp_layers:
+            predictions += self.mlp_weight * self._predict_mlp(features)
+
+        return predictions
+
+    def _predict_trees(self, features: np.ndarray) -> np.ndarray:
+        """Walk every tree for every row in lock-step, one level per pass."""
+        arrays = self._arrays
+        tree_feature, tree_threshold = arrays['tree_feature'], arrays['tree_threshold']
+        tree_children, tree_value = arrays['tree_children'], arrays['tree_value']
+
+        # sklearn trees compare float32 inputs against their thresholds
+        features = features.astype(np.float32).astype(float)
+        totals = np.empty(len(features))
+
+        n_features = features.shape[1]
+        for start in range(0, len(features), TREE_CHUNK_SIZE):
+            chunk = features[start:start + TREE_CHUNK_SIZE]
+            flat = chunk.ravel()
+            row_offsets = (np.arange(len(chunk)) * n_features)[:, None]
+            nodes = np.repeat(arrays['tree_roots'][None, :], len(chunk), axis=0)
+
+            for _ in range(self.tree_depth):
+                values = flat.take(row_offsets + tree_feature.take(nodes))
+                go_right = values > tree_threshold.take(nodes)
+                nodes = tree_children.take(2 * nodes + go_right)
+
+            totals[start:start + len(chunk)] = tree_value.take(nodes).sum(axis=1)
+
+        return totals
+
+    def _predict_mlp(self, features: np.ndarray) -> np.ndarray:
+        """Forward pass of the scaled-input ReLU MLP."""
+        arrays = self._arrays
+        activations = (features - arrays['mlp_mean']) / arrays['mlp_scale']
+        for i in range(self.n_mlp_layers):
+            activations = activations @ arrays[f'mlp_coef_{i}'] + arrays[f'mlp_intercept_{i}']
+            if i < self.n_mlp_layers - 1:
+                np.maximum(activations, 0, out=activations)
+        return activations[:, 0]
+
+    def predict_one(self, row: List[float]) -> float:
+        """
+        Score a single feature row in pure Python.
+
+        Args:
+            row: Feature values in ``feature_names`` order
+
+        Returns:
+            Ensemble prediction
+        """
+        if self._views is None:
+            self._views = {name: self.view(name) for name in self.header['arrays']}
+        views = self._views
+
+        prediction = self.constant + sum(c * x for c, x in zip(views['linear_coef'], row))
+
+        if self.n_trees:
+            # sklearn trees compare float32 inputs against their thresholds
+            row32 = array('f', row).tolist()
+            feature, threshold = views['tree_feature'], views['tree_threshold']
+            children, value = views['tree_children'], views['tree_value']
+            for node in views['tree_roots']:
+                while True:
+                    child = children[2 * node + (row32[feature[node]] > threshold[node])]
+                    if child == node:
+                        break
+                    node = child
+                prediction += value[node]
+
+        if self.n_mlp_layers:
+            activations = [(x - m) / s for x, m, s in
+                           zip(row, views['mlp_mean'], views['mlp_scale'])]
+            for i in range(self.n_mlp_layers):
+                coef, intercept = views[f'mlp_coef_{i}'], views[f'mlp_intercept_{i}']
+                n_out = len(intercept)
+                outputs = list(intercept)
+                for j, x in enumerate(activations):
+                    if x:
+                        weights = coef[j * n_out:(j + 1) * n_out]
+                        outputs = [o + x * w for o, w in zip(outputs, weights)]
+                if i < self.n_mlp_layers - 1:
+                    outputs = [o if o > 0 else 0.0 for o in outputs]
+                activations = outputs
+            prediction += self.mlp_weight * activations[0]
+
+        return prediction
+
+
+def write_compiled(arrays: dict, path: str):
+    """
+    Write compiled arrays as one memory-mappable file.
+
+    Args:
+        arrays: Output of ``compile_ensemble``
+        path: Output file path
+    """
+    header = {'feature_names': [str(name) for name in arrays['feature_names']],
+              'scalars': {}, 'arrays': {}}
+    blobs = []
+    offset = 0
+
+    for name, value in arrays.items():
+        if name == 'feature_names':
+            continue
+        value = np.asarray(value)
+        if value.ndim == 0:
+            header['scalars'][name] = value.item()
+            continue
+
+        value = np.ascontiguousarray(value, dtype='<i4' if value.dtype.kind in 'iu' else '<f8')
+        header['arrays'][name] = {'dtype': value.dtype.str, 'itemsize': value.itemsize,
+                                  'shape': list(value.shape), 'offset': offset}
+        blobs.append(value.tobytes())
+        offset += -(-len(blobs[-1]) // 8) * 8
+
+    # Offsets in the header are relative to the (8-byte aligned) data section
+    encoded = json.dumps(header).encode()
+    encoded += b' ' * (-(len(MAGIC) + 8 + len(encoded)) % 8)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(encoded)) + encoded)
+        for blob in blobs:
+            f.write(blob + b'\0' * (-len(blob) % 8))
+    os.replace(tmp_path, path)
+
+
+def save_compiled(models: dict, feature_names: List[str], path: str):
+    """
+    Compile the ensemble and write it as a single memory-mappable file.
+
+    Args:
+        models: Dictionary of trained models (see ``compile_ensemble``)
+        feature_names: Feature columns the models were trained on
+        path: Output file path
+    """
+    write_compiled(compile_ensemble(models, feature_names), path)
+
+
+def load_compiled(path: str) -> CompiledEnsemble:
+    """
+    Memory-map a compiled ensemble (no sklearn or NumPy import needed).
+
+    Args:
+        path: File written by ``save_compiled``
+
+    Returns:
+        CompiledEnsemble ready for ``predict`` / ``predict_one``
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a compiled ensemble")
+    (header_length,) = struct.unpack_from('<Q', buffer, len(MAGIC))
+    start = len(MAGIC) + 8
+    header = json.loads(bytes(buffer[start:start + header_length]))
+
+    data_start = start + header_length
+    for spec in header['arrays'].values():
+        spec['offset'] += data_start
+
+    return CompiledEnsemble(header, buffer)
+
+
+def main():
+    """
+    Compile the pickled models in a model directory.
+
+    Usage:
+        python compiled_ensemble.py [model_dir]
+
+    For a registry root, the current version's models are published with
+    the compiled artifact as a new version.
+    """
+    from predict_reimbursement import MODEL_DIR, load_models
+    from model_registry import is_registry, resolve_model_dir, publish, _copy_files
+
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else MODEL_DIR
+    try:
+        source = resolve_model_dir(model_dir)
+        models = load_models(source, backend='sklearn', use_lookup_table=False, case_index='')
+
+        if is_registry(model_dir):
+            # Published versions are immutable
+            def write_artifacts(staging):
+                _copy_files(source, staging)
+                save_compiled(models, models['feature_names'],
+                              os.path.join(staging, COMPILED_FILENAME))
+            version = publish(model_dir, write_artifacts)
+            print(f"✓ Published {source} with {COMPILED_FILENAME} as {version}")
+        else:
+            path = os.path.join(source, COMPILED_FILENAME)
+            save_compiled(models, models['feature_names'], path)
+            print(f"✓ Saved {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
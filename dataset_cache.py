@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import sys
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+from typing import Dict, List
+
+from lazy_imports import lazy_import
+from instrumentation import TIMING_REPEATS, span, best_time
+
+np = lazy_import('numpy')
+
+
+# Parsed case files are kept here as one .npy per column, in a directory
+# named after the source file and its content hash. 'off' disables caching
+CACHE_DIR = os.environ.get(
+    'REIMBURSEMENT_DATASET_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.dataset_cache')
+)
+
+# Bumped when the cached layout changes, so stale entries are never read
+FORMAT_VERSION = 1
+
+# Columns read from a cases file; expected_output is optional (private cases)
+INPUT_COLUMNS = ['trip_duration_days', 'miles_traveled', 'total_receipts_amount']
+LABEL_COLUMN = 'expected_output'
+
+# Written last, so an entry without it is incomplete
+META_FILENAME = 'meta.json'
+
+
+def source_hash(path: str) -> str:
+    """SHA-256 of a file's contents (hex)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(path: str, digest: str = None, cache_dir: str = None) -> str:
+    """Directory that holds (or would hold) the columns of ``path``."""
+    digest = digest or source_hash(path)
+    name = os.path.basename(path).replace('.', '_')
+    return os.path.join(cache_dir or CACHE_DIR, f'{name}-v{FORMAT_VERSION}-{digest[:16]}')
+
+
+def parse_columns(path: str) -> Dict[str, np.ndarray]:
+    """
+    Parse a cases file into float columns.
+
+    JSON files may hold ``{"input": {...}, "expected_output": ...}`` cases
+    (``public_cases.json``) or flat trips (``private_cases.json``). CSV
+    columns may carry the ``input/`` prefix (``public_cases.csv``).
+
+    Returns:
+        Dictionary of ``INPUT_COLUMNS`` arrays, plus ``expected_output``
+        when every case has one
+    """
+    if path.endswith('.csv'):
+        import csv
+
+        with open(path, newline='') as f:
+            rows = [{key.replace('input/', ''): value for key, value in row.items()}
+                    for row in csv.DictReader(f)]
+    else:
+        with open(path) as f:
+            rows = [{**case.get('input', case), **({LABEL_COLUMN: case[LABEL_COLUMN]}
+                                                   if LABEL_COLUMN in case else {})}
+                    for case in json.load(f)]
+
+    names = list(INPUT_COLUMNS)
+    if rows and all(row.get(LABEL_COLUMN) not in (None, '') for row in rows):
+        names.append(LABEL_COLUMN)
+    table = np.array([[row[name] for name in names] for row in rows],
+                     dtype=float).reshape(-1, len(names))
+    return {name: np.ascontiguousarray(table[:, i]) for i, name in enumerate(names)}
+
+
+def _write_entry(entry: str, path: str, columns: Dict[str, np.ndarray]):
+    """Write ``columns`` to ``entry`` atomically and drop older entries of ``path``."""
+    parent = os.path.dirname(entry)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix='.staging-')
+    try:
+        for name, values in columns.items():
+            np.save(os.path.join(staging, f'{name}.npy'), values)
+        with open(os.path.join(staging, META_FILENAME), 'w') as f:
+            json.dump({'source': os.path.abspath(path),
+                       'rows': int(len(columns[INPUT_COLUMNS[0]])),
+                       'columns': list(columns),
+                       'created': time.strftime('%Y-%m-%dT%H:%M:%S%z')}, f, indent=2)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # Another process finished the same entry first
+            return
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    # Earlier contents of the same file; readers holding them keep their mappings
+    prefix = os.path.basename(entry).rsplit('-', 1)[0] + '-'
+    for other in os.listdir(parent):
+        if other.startswith(prefix) and other != os.path.basename(entry):
+            shutil.rmtree(os.path.join(parent, other), ignore_errors=True)
+
+
+def load_columns(path: str, cache_dir: str = None) -> Dict[str, np.ndarray]:
+    """
+    Load a cases file's columns, parsing it only the first time.
+
+    The first load parses the file and writes each column as a ``.npy``
+    under ``CACHE_DIR``, keyed by the file's content hash. Later loads
+    memory-map those arrays read-only, so they cost one hash of the source
+    file plus opening the maps. An edited file gets a new entry. If the
+    cache cannot be written, the parsed arrays are returned as they are.
+
+    Args:
+        path: Path to a ``.json`` or ``.csv`` cases file
+        cache_dir: Overrides ``CACHE_DIR`` ('off' parses every time)
+
+    Returns:
+        Dictionary of float64 columns (see ``parse_columns``)
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    if cache_dir == 'off':
+        with span('dataset.parse'):
+            return parse_columns(path)
+
+    entry = cache_path(path, cache_dir=cache_dir)
+    if not os.path.exists(os.path.join(entry, META_FILENAME)):
+        with span('dataset.parse'):
+            columns = parse_columns(path)
+        try:
+            _write_entry(entry, path, columns)
+        except OSError as e:
+            print(f"Warning: dataset cache not written ({e})", file=sys.stderr)
+            return columns
+
+    with span('dataset.load_cached'):
+        with open(os.path.join(entry, META_FILENAME)) as f:
+            names = json.load(f)['columns']
+        # Plain read-only ndarray views over the mapped files
+        return {name: np.load(os.path.join(entry, f'{name}.npy'), mmap_mode='r').view(np.ndarray)
+                for name in names}
+
+
+def load_labeled(path: str) -> tuple:
+    """
+    Load a labeled cases file.
+
+    Returns:
+        Tuple of (days, miles, receipts, expected_output) arrays
+
+    Raises:
+        ValueError: If the file has no ``expected_output`` for every case
+    """
+    columns = load_columns(path)
+    if LABEL_COLUMN not in columns:
+        raise ValueError(f"{path} has no {LABEL_COLUMN} for every case")
+    return tuple(columns[name] for name in INPUT_COLUMNS + [LABEL_COLUMN])
+
+
+def clear(cache_dir: str = None):
+    """Delete every cached dataset."""
+    shutil.rmtree(cache_dir or CACHE_DIR, ignore_errors=True)
+
+
+def benchmark(paths: List[str], repeats: int = TIMING_REPEATS) -> List[dict]:
+    """
+    Time the cached load of each file against parsing it.
+
+    Parsing is timed both with pandas (as training used to read
+    ``public_cases.csv``) and with ``parse_columns``.
+
+    Returns:
+        One dictionary per file with ``rows`` and the best ``parse_ms``,
+        ``pandas_ms`` and ``cached_ms``
+    """
+    import pandas as pd
+
+    def read_pandas(path):
+        if path.endswith('.csv'):
+            return pd.read_csv(path)
+        with open(path) as f:
+            return pd.json_normalize(json.load(f))
+
+    results = []
+    for path in paths:
+        columns = load_columns(path)
+        results.append({
+            'path': path,
+            'rows': int(len(columns[INPUT_COLUMNS[0]])),
+            'pandas_ms': best_time(lambda: read_pandas(path), repeats) * 1000,
+            'parse_ms': best_time(lambda: parse_columns(path), repeats) * 1000,
+            'cached_ms': best_time(lambda: load_columns(path), repeats) * 1000,
+        })
+    return results
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python dataset_cache.py build <cases files...>
+        python dataset_cache.py bench <cases files...> [--repeats 5]
+        python dataset_cache.py clear
+    """
+    parser = argparse.ArgumentParser(description="Columnar cache of the case files")
+    parser.add_argument('command', choices=['build', 'bench', 'clear'])
+    parser.add_argument('paths', nargs='*',
+                        default=['public_cases.json', 'public_cases.csv', 'private_cases.json'])
+    parser.add_argument('--repeats', type=int, default=TIMING_REPEATS)
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'clear':
+            clear()
+            print(f"✓ Cleared {CACHE_DIR}")
+        elif args.command == 'build':
+            for path in args.paths:
+                columns = load_columns(path)
+                print(f"✓ {path}: {len(columns[INPUT_COLUMNS[0]])} rows, "
+                      f"columns {', '.join(columns)} -> {cache_path(path)}")
+        else:
+            print(f"{'file':24s} {'rows':>7s} {'pandas (ms)':>12s} {'parse (ms)':>11s} "
+                  f"{'cached (ms)':>12s} {'speedup':>8s}")
+            for result in benchmark(args.paths, args.repeats):
+                print(f"{result['path']:24s} {result['rows']:7d} {result['pandas_ms']:12.2f} "
+                      f"{result['parse_ms']:11.2f} {result['cached_ms']:12.2f} "
+                      f"{result['pandas_ms'] / result['cached_ms']:7.1f}x")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
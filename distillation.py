@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import sys
+import os
+import json
+import argparse
+from typing import Callable, Tuple
+
+from lazy_imports import lazy_import
+from features import build_features
+from compiled_ensemble import save_compiled
+from instrumentation import best_time
+
+np = lazy_import('numpy')
+
+
+# Compiled student, loaded instead of ensemble.bin by the 'student' backend
+STUDENT_FILENAME = 'student.bin'
+# Accuracy gap and speedup measured when the student is saved
+REPORT_FILENAME = 'distill_report.json'
+
+# Teacher-labelled synthetic trips the student is fitted to
+DISTILL_SAMPLES = 40_000
+
+# Half the samples are known trips perturbed by up to this fraction (days by
+# up to one), the other half are uniform over the known input ranges
+JITTER = 0.1
+
+# Shallow boosted trees: on public_cases, 100 depth-6 stages track the
+# ensemble within a few dollars at a fraction of its cost
+STUDENT_PARAMS = {'n_estimators': 100, 'max_depth': 6, 'learning_rate': 0.1}
+
+
+def synthetic_inputs(days: np.ndarray, miles: np.ndarray, receipts: np.ndarray,
+                     n_samples: int = DISTILL_SAMPLES,
+                     random_state: int = 42) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sample dense synthetic trips around and between known ones.
+
+    Args:
+        days, miles, receipts: Inputs of the known trips
+        n_samples: Synthetic trips to draw (the known trips are added on top)
+        random_state: Seed of the sampler
+
+    Returns:
+        Tuple of (days, miles, receipts) arrays
+    """
+    rng = np.random.default_rng(random_state)
+    n_uniform = n_samples // 2
+    n_jittered = n_samples - n_uniform
+    source = rng.integers(0, len(days), n_jittered)
+
+    sampled_days = np.concatenate([
+        days,
+        rng.integers(1, int(days.max()) + 1, n_uniform),
+        np.maximum(days[source] + rng.integers(-1, 2, n_jittered), 1),
+    ])
+    sampled_miles = np.concatenate([
+        miles,
+        rng.uniform(0, miles.max(), n_uniform),
+        miles[source] * rng.uniform(1 - JITTER, 1 + JITTER, n_jittered),
+    ])
+    sampled_receipts = np.concatenate([
+        receipts,
+        np.round(rng.uniform(0, receipts.max(), n_uniform), 2),
+        np.round(receipts[source] * rng.uniform(1 - JITTER, 1 + JITTER, n_jittered), 2),
+    ])
+    return sampled_days.astype(float), sampled_miles, sampled_receipts
+
+
+def distill(teacher: Callable[[np.ndarray], np.ndarray], feature_names, days: np.ndarray,
+            miles: np.ndarray, receipts: np.ndarray, n_samples: int = DISTILL_SAMPLES,
+            random_state: int = 42, params: dict = None):
+    """
+    Fit a compact student model to a teacher's predictions.
+
+    Args:
+        teacher: Maps a feature matrix to the ensemble's predictions
+        feature_names: Feature columns of the teacher (the student uses the same)
+        days, miles, receipts: Known trips the synthetic samples are drawn around
+        n_samples: Synthetic trips to label with the teacher
+        random_state: Seed of the sampler and the student
+        params: Overrides of ``STUDENT_PARAMS``
+
+    Returns:
+        Fitted GradientBoostingRegressor
+    """
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    features = build_features(*synthetic_inputs(days, miles, receipts, n_samples, random_state),
+                              feature_names)
+    student = GradientBoostingRegressor(**{**STUDENT_PARAMS, **(params or {})},
+                                        random_state=random_state)
+    return student.fit(features, teacher(features))
+
+
+def save_student(model_dir: str, student, feature_names):
+    """Compile the student into ``student.bin``."""
+    # Compiled like a one-member ensemble, so CompiledEnsemble scores it
+    save_compiled({'gradient_boosting': student,
+                   'ensemble_weights': {'gradient_boosting': 1.0}},
+                  list(feature_names), os.path.join(model_dir, STUDENT_FILENAME))
+
+
+def evaluate_student(model_dir: str, cases_path: str = 'public_cases.json') -> dict:
+    """
+    Compare the deployed student with the full ensemble on known cases.
+
+    The report is also written to ``distill_report.json``.
+
+    Returns:
+        Dictionary with both models' MAE, the ``accuracy_gap`` between them,
+        the student's ``fidelity_mae`` to the ensemble, and its batch and
+        single-trip ``speedup``
+    """
+    from predict_reimbursement import load_models, ensemble_predict_batch
+    from incremental_training import load_labeled_cases
+
+    days, miles, receipts, expected = load_labeled_cases(cases_path)
+    teacher = load_models(model_dir, backend='compiled', use_lookup_table=False,
+                          case_index='')
+    student = load_models(model_dir, backend='student', use_lookup_table=False,
+                          case_index='')
+    features = build_features(days, miles, receipts, teacher['feature_names'])
+
+    teacher_predictions = ensemble_predict_batch(teacher, features)
+    student_predictions = ensemble_predict_batch(student, features)
+    rows = features[:200].tolist()
+
+    report = {
+        'cases': int(len(expected)),
+        'ensemble_mae': float(np.abs(teacher_predictions - expected).mean()),
+        'student_mae': float(np.abs(student_predictions - expected).mean()),
+        'fidelity_mae': float(np.abs(student_predictions - teacher_predictions).mean()),
+        'batch_speedup': (best_time(lambda: teacher['compiled'].predict(features))
+                          / best_time(lambda: student['compiled'].predict(features))),
+        'single_speedup': (best_time(lambda: [teacher['compiled'].predict_one(row) for row in rows])
+                           / best_time(lambda: [student['compiled'].predict_one(row) for row in rows])),
+    }
+    report['accuracy_gap'] = report['student_mae'] - report['ensemble_mae']
+
+    with open(os.path.join(model_dir, REPORT_FILENAME), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def print_distill_report(report: dict):
+    """Print the accuracy gap and speedup of a student."""
+    print(f"Student MAE ${report['student_mae']:.2f} vs ensemble ${report['ensemble_mae']:.2f} "
+          f"on {report['cases']} cases (gap ${report['accuracy_gap']:+.2f}, "
+          f"${report['fidelity_mae']:.2f} from the ensemble on average)")
+    print(f"Speedup: {report['batch_speedup']:.1f}x batch, "
+          f"{report['single_speedup']:.1f}x single trip")
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python distillation.py [--model-dir models] [--data public_cases.csv]
+                               [--samples 40000] [--cases public_cases.json]
+
+    Distills an existing model directory (for a registry root, the result
+    is published as a new version). Serve the student with
+    ``REIMBURSEMENT_BACKEND=student``.
+    """
+    from predict_reimbursement import MODEL_DIR, load_models, ensemble_predict_batch
+    from incremental_training import load_labeled_cases
+    from model_registry import is_registry, resolve_model_dir, publish, _copy_files
+
+    parser = argparse.ArgumentParser(description="Distill the ensemble into a small student")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--data', default='public_cases.csv',
+                        help="Known trips to draw synthetic samples around")
+    parser.add_argument('--samples', type=int, default=DISTILL_SAMPLES)
+    parser.add_argument('--cases', default='public_cases.json',
+                        help="Labeled cases for the accuracy report")
+    args = parser.parse_args()
+
+    try:
+        source = resolve_model_dir(args.model_dir)
+        models = load_models(source, backend='compiled', use_lookup_table=False,
+                             case_index='')
+        # Distill the ensemble itself; rules and routing stay in front of it
+        teacher = {name: model for name, model in models.items()
+                   if name not in ('rules', 'router')}
+        days, miles, receipts, _ = load_labeled_cases(args.data)
+        student = distill(lambda X: ensemble_predict_batch(teacher, X), models['feature_names'],
+                          days, miles, receipts, args.samples)
+
+        if is_registry(args.model_dir):
+            reports = []
+            def write_artifacts(staging):
+                _copy_files(source, staging)
+                for name in (STUDENT_FILENAME, REPORT_FILENAME):
+                    if os.path.exists(os.path.join(staging, name)):
+                        os.remove(os.path.join(staging, name))
+                save_student(staging, student, models['feature_names'])
+                reports.append(evaluate_student(staging, args.cases))
+            version = publish(args.model_dir, write_artifacts)
+            report = reports[0]
+            print(f"✓ Published {source} with {STUDENT_FILENAME} as {version}")
+        else:
+            save_student(source, student, models['feature_names'])
+            report = evaluate_student(source, args.cases)
+            print(f"✓ Saved {STUDENT_FILENAME} to {source}")
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    print_distill_report(report)
+
+
+if __name__ == '__main__':
+    main()
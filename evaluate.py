@@ -0,0 +1,329 @@
+import sys
+import re
+import json
+import argparse
+import subprocess
+import numpy as np
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from predict_reimbursement import _predict_arrays
+
+
+# run.sh output accepted by eval.sh
+NUMBER_PATTERN = re.compile(r'^-?[0-9]+\.?[0-9]*$')
+
+# eval.sh reports progress before every this many cases
+PROGRESS_EVERY = 100
+
+# Closing block eval.sh prints after every run
+NEXT_STEPS = [
+    "📝 Next steps:",
+    "  1. Fix any script errors shown above",
+    "  2. Ensure your run.sh outputs only a number",
+    "  3. Analyze the patterns in the interviews and public cases",
+    "  4. Test edge cases around trip length and receipt amounts",
+    "  5. Submit your solution via the Google Form when ready!",
+]
+
+
+def load_cases(path: str = 'public_cases.json') -> List[Tuple[str, str, str, str]]:
+    """
+    Load evaluation cases, keeping every number exactly as written in the file.
+
+    Args:
+        path: Path to a ``public_cases.json``-style file
+
+    Returns:
+        List of (trip_duration_days, miles_traveled, total_receipts_amount,
+        expected_output) strings, as ``jq -r`` prints them in ``eval.sh``
+    """
+    with open(path) as f:
+        cases = json.load(f, parse_float=str, parse_int=str)
+
+    return [(case['input']['trip_duration_days'], case['input']['miles_traveled'],
+             case['input']['total_receipts_amount'], case['expected_output'])
+            for case in cases]
+
+
+def score_in_process(cases: List[Tuple[str, str, str, str]]) -> List[Tuple[bool, str]]:
+    """
+    Score every case with one vectorized ensemble pass.
+
+    Returns:
+        One (succeeded, output or error message) pair per case, as the
+        command-line predictor would have printed it
+    """
+    inputs = np.array([case[:3] for case in cases], dtype=float).reshape(-1, 3)
+    valid = np.all(inputs >= 0, axis=1)
+
+    results = [(False, "Error: Inputs cannot be negative")] * len(cases)
+    if valid.any():
+        predictions = _predict_arrays(inputs[valid, 0], inputs[valid, 1], inputs[valid, 2])
+        for i, prediction in zip(np.flatnonzero(valid), predictions.tolist()):
+            results[i] = (True, str(prediction))
+
+    return results
+
+
+def score_with_command(cases: List[Tuple[str, str, str, str]], command: str = './run.sh',
+                       workers: int = 8) -> List[Tuple[bool, str]]:
+    """
+    Score every case by running ``command`` once per case, ``workers`` at a time.
+
+    Unlike ``eval.sh``, stderr is captured on the first run, so failing cases
+    aren't run twice.
+
+    Returns:
+        One (succeeded, stdout or stderr) pair per case
+    """
+    def run(case):
+        try:
+            completed = subprocess.run([command, *case[:3]], capture_output=True, text=True)
+        except OSError as e:
+            return False, str(e)
+        if completed.returncode != 0:
+            return False, completed.stderr.replace('\n', '')
+        return True, completed.stdout
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, cases))
+
+
+def _decimals(number: str) -> int:
+    """Number of digits after the decimal point, i.e. the bc scale of a literal."""
+    return len(number.split('.')[1]) if '.' in number else 0
+
+
+def _bc_format(value: Decimal, scale: int) -> str:
+    """Format a value the way bc prints it at the given scale (truncated, no leading 0)."""
+    value = value.quantize(Decimal(1).scaleb(-scale), rounding='ROUND_DOWN')
+    if value == 0:
+        return '0'
+    text = f"{value:f}"
+    if text.startswith('0.'):
+        return text[1:]
+    if text.startswith('-0.'):
+        return '-' + text[2:]
+    return text
+
+
+def summarize(cases: List[Tuple[str, str, str, str]],
+              results: List[Tuple[bool, str]]) -> dict:
+    """
+    Compute the ``eval.sh`` metrics with exact decimal arithmetic.
+
+    All amounts are scaled to integers of the finest decimal place present,
+    so the ±$0.01 / ±$1.00 thresholds, the error total and the average are
+    exact, matching ``bc`` rather than suffering float rounding.
+
+    Returns:
+        Dictionary of counts, formatted bc-style values, per-case results and
+        error messages
+    """
+    successes, errors = [], []
+    for i, ((ok, output), case) in enumerate(zip(results, cases)):
+        if not ok:
+            errors.append(f"Case {i + 1}: Script failed with error: {output}")
+            continue
+        output = re.sub(r'\s', '', output)
+        if NUMBER_PATTERN.match(output):
+            successes.append((i, output))
+        else:
+            errors.append(f"Case {i + 1}: Invalid output format: {output}")
+
+    summary = {
+        'num_cases': len(cases),
+        'successful_runs': len(successes),
+        'exact_matches': 0,
+        'close_matches': 0,
+        'results': [],
+        'errors': errors,
+    }
+    if not successes:
+        return summary
+
+    indices = np.array([i for i, _ in successes])
+    actual = [output for _, output in successes]
+    expected = [cases[i][3] for i in indices]
+
+    # Scale everything to integers of the finest decimal place in play
+    digits = max(2, max(_decimals(n) for n in actual + expected))
+    dtype = np.int64 if digits <= 8 else object
+    actual_units = np.array([int(Decimal(n).scaleb(digits)) for n in actual], dtype=dtype)
+    expected_units = np.array([int(Decimal(n).scaleb(digits)) for n in expected], dtype=dtype)
+    error_units = np.abs(actual_units - expected_units)
+
+    unit = 10 ** digits
+    exact_matches = int(np.count_nonzero(error_units < unit // 100))
+    close_matches = int(np.count_nonzero(error_units < unit))
+    total_units = int(error_units.sum())
+
+    # bc: scale=2 division truncates
+    avg_error = _bc_format(Decimal(total_units * 100 // (len(actual) * unit)) / 100, 2)
+
+    # Each case's error is printed by bc at the larger scale of its operands
+    error_strings = [
+        _bc_format(Decimal(int(units)).scaleb(-digits), max(_decimals(a), _decimals(e)))
+        for units, a, e in zip(error_units, actual, expected)
+    ]
+
+    max_error, max_error_case = '0', ''
+    if total_units > 0:
+        worst = int(np.argmax(error_units))
+        max_error = error_strings[worst]
+        days, miles, receipts, _ = cases[indices[worst]]
+        max_error_case = (f"Case {indices[worst] + 1}: {days} days, {miles} miles, "
+                          f"${receipts} receipts")
+
+    num_cases = len(cases)
+    avg_scale = _decimals(avg_error)
+    score = Decimal(avg_error if avg_error != '0' else 0) * 100 \
+        + (num_cases - exact_matches) * Decimal('0.1')
+
+    summary.update({
+        'exact_matches': exact_matches,
+        'close_matches': close_matches,
+        'exact_pct': _bc_format(Decimal(exact_matches * 1000 // len(actual)) / 10, 1),
+        'close_pct': _bc_format(Decimal(close_matches * 1000 // len(actual)) / 10, 1),
+        'avg_error': avg_error,
+        'max_error': max_error,
+        'max_error_case': max_error_case,
+        'score': _bc_format(score, max(avg_scale, 1)),
+        'results': [
+            (i + 1, exp, act, err, *cases[i][:3])
+            for i, exp, act, err in zip(indices.tolist(), expected, actual, error_strings)
+        ],
+    })
+    return summary
+
+
+def format_report(summary: dict) -> str:
+    """Render the summary exactly as the tail of ``eval.sh`` prints it."""
+    lines = []
+    num_cases = summary['num_cases']
+    exact_matches = summary['exact_matches']
+
+    if summary['successful_runs'] == 0:
+        lines += [
+            "❌ No successful test cases!",
+            "",
+            "Your script either:",
+            "  - Failed to run properly",
+            "  - Produced invalid output format",
+            "  - Timed out on all cases",
+            "",
+            "Check the errors below for details.",
+        ]
+    else:
+        lines += [
+            "✅ Evaluation Complete!",
+            "",
+            "📈 Results Summary:",
+            f"  Total test cases: {num_cases}",
+            f"  Successful runs: {summary['successful_runs']}",
+            f"  Exact matches (±$0.01): {exact_matches} ({summary['exact_pct']}%)",
+            f"  Close matches (±$1.00): {summary['close_matches']} ({summary['close_pct']}%)",
+            f"  Average error: ${summary['avg_error']}",
+            f"  Maximum error: ${summary['max_error']}",
+            "",
+            f"🎯 Your Score: {summary['score']} (lower is better)",
+            "",
+        ]
+
+        if exact_matches == num_cases:
+            lines.append("🏆 PERFECT SCORE! You have reverse-engineered the system completely!")
+        elif exact_matches > 950:
+            lines.append("🥇 Excellent! You are very close to the perfect solution.")
+        elif exact_matches > 800:
+            lines.append("🥈 Great work! You have captured most of the system behavior.")
+        elif exact_matches > 500:
+            lines.append("🥉 Good progress! You understand some key patterns.")
+        else:
+            lines.append("📚 Keep analyzing the patterns in the interviews and test cases.")
+
+        lines += ["", "💡 Tips for improvement:"]
+        if exact_matches < num_cases:
+            lines.append("  Check these high-error cases:")
+
+            # sort -t: -k4 -nr: by error, ties broken by the whole line (also reversed)
+            rows = sorted(summary['results'],
+                          key=lambda r: (Decimal(r[3]), ':'.join(map(str, r))),
+                          reverse=True)
+            for case_num, expected, actual, error, days, miles, receipts in rows[:5]:
+                lines.append(f"    Case {case_num}: {days} days, {miles} miles, ${receipts} receipts")
+                lines.append(f"      Expected: ${float(expected):.2f}, Got: ${float(actual):.2f}, "
+                             f"Error: ${float(error):.2f}")
+
+    errors = summary['errors']
+    if errors:
+        lines += ["", "⚠️  Errors encountered:"]
+        lines += [f"  {error}" for error in errors[:10]]
+        if len(errors) > 10:
+            lines.append(f"  ... and {len(errors) - 10} more errors")
+
+    lines += ["", *NEXT_STEPS]
+    return '\n'.join(lines) + '\n'
+
+
+def evaluate(cases_path: str = 'public_cases.json', command: str = None,
+             workers: int = 8, out=sys.stdout):
+    """
+    Run the full evaluation and print the ``eval.sh`` report.
+
+    Args:
+        cases_path: Path to the cases file
+        command: Score by running this script per case (e.g. ``./run.sh``)
+            instead of in-process
+        workers: Concurrent ``command`` processes
+        out: Stream the report is written to
+
+    Returns:
+        The metrics dictionary from ``summarize``
+    """
+    out.write("🧾 Black Box Challenge - Reimbursement System Evaluation\n")
+    out.write("=======================================================\n\n")
+    out.write("📊 Running evaluation against 1,000 test cases...\n\n")
+    out.write("Extracting test data...\n")
+
+    cases = load_cases(cases_path)
+    results = []
+    # Score in progress-sized chunks so each line is printed as its cases are reached
+    for start in range(0, len(cases), PROGRESS_EVERY):
+        print(f"Progress: {start}/{len(cases)} cases processed...", file=sys.stderr)
+        chunk = cases[start:start + PROGRESS_EVERY]
+        if command:
+            results += score_with_command(chunk, command, workers)
+        else:
+            results += score_in_process(chunk)
+
+    summary = summarize(cases, results)
+    out.write(format_report(summary))
+    return summary
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python evaluate.py [--cases public_cases.json] [--command ./run.sh] [--workers 8]
+    """
+    parser = argparse.ArgumentParser(description="Fast drop-in replacement for eval.sh")
+    parser.add_argument('--cases', default='public_cases.json', help="Cases file to evaluate")
+    parser.add_argument('--command', default=None,
+                        help="Score by running this script per case instead of in-process")
+    parser.add_argument('--workers', type=int, default=8,
+                        help="Concurrent processes for --command")
+    args = parser.parse_args()
+
+    try:
+        evaluate(args.cases, args.command, args.workers)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
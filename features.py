@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from typing import List, Sequence
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+
+# Raw inputs, in the order every feature matrix starts with
+RAW_FEATURES = ['trip_duration_days', 'miles_traveled', 'total_receipts_amount']
+
+# Offset that keeps the ratio features finite for zero-day / zero-mile trips
+EPSILON = 0.01
+
+# Derived features: name -> function of the (days, miles, receipts) arrays
+DERIVED_FEATURES = {
+    'cost_per_day': lambda days, miles, receipts: receipts / (days + EPSILON),
+    'cost_per_mile': lambda days, miles, receipts: receipts / (miles + EPSILON),
+    'miles_per_day': lambda days, miles, receipts: miles / (days + EPSILON),
+}
+
+# Default feature set used for training (saved to models/feature_names.json)
+FEATURE_NAMES = RAW_FEATURES + list(DERIVED_FEATURES)
+
+
+def build_features(trip_duration_days, miles_traveled, total_receipts_amount,
+                   feature_names: Sequence[str] = None) -> np.ndarray:
+    """
+    Build the model feature matrix from the raw trip inputs.
+
+    This is the single feature pipeline shared by training
+    (``ModelTrainer.load_and_prepare_data``) and inference
+    (``predict_reimbursement.preprocess_features``), so both always see the
+    same columns in the same order.
+
+    Args:
+        trip_duration_days: Scalar or array of trip durations
+        miles_traveled: Scalar or array of miles traveled
+        total_receipts_amount: Scalar or array of receipt totals
+        feature_names: Columns to produce, in order (defaults to ``FEATURE_NAMES``,
+            usually the contents of ``feature_names.json``)
+
+    Returns:
+        Numpy array of shape (n_trips, len(feature_names))
+    """
+    feature_names = FEATURE_NAMES if feature_names is None else feature_names
+    check_feature_names(feature_names)
+
+    inputs = {
+        'trip_duration_days': np.atleast_1d(np.asarray(trip_duration_days, dtype=float)),
+        'miles_traveled': np.atleast_1d(np.asarray(miles_traveled, dtype=float)),
+        'total_receipts_amount': np.atleast_1d(np.asarray(total_receipts_amount, dtype=float)),
+    }
+    days, miles, receipts = (inputs[name] for name in RAW_FEATURES)
+
+    features = np.empty((len(days), len(feature_names)))
+    for i, name in enumerate(feature_names):
+        if name in inputs:
+            features[:, i] = inputs[name]
+        else:
+            features[:, i] = DERIVED_FEATURES[name](days, miles, receipts)
+
+    return features
+
+
+def build_feature_row(trip_duration_days: float, miles_traveled: float,
+                      total_receipts_amount: float,
+                      feature_names: Sequence[str] = None) -> List[float]:
+    """
+    Build the features of a single trip as a plain list (no NumPy needed).
+
+    Args:
+        trip_duration_days: Number of days spent traveling
+        miles_traveled: Total miles traveled
+        total_receipts_amount: Total dollar amount of receipts
+        feature_names: Columns to produce, in order (defaults to ``FEATURE_NAMES``)
+
+    Returns:
+        List of feature values, equal to one row of ``build_features``
+    """
+    feature_names = FEATURE_NAMES if feature_names is None else feature_names
+    check_feature_names(feature_names)
+
+    inputs = {
+        'trip_duration_days': float(trip_duration_days),
+        'miles_traveled': float(miles_traveled),
+        'total_receipts_amount': float(total_receipts_amount),
+    }
+    days, miles, receipts = (inputs[name] for name in RAW_FEATURES)
+
+    return [inputs[name] if name in inputs else DERIVED_FEATURES[name](days, miles, receipts)
+            for name in feature_names]
+
+
+def check_feature_names(feature_names: Sequence[str]):
+    """
+    Check that every feature name can be produced by ``build_features``.
+
+    Args:
+        feature_names: Feature names to check
+
+    Raises:
+        ValueError: If a name is neither a raw input nor a derived feature
+    """
+    unknown = [name for name in feature_names
+               if name not in RAW_FEATURES and name not in DERIVED_FEATURES]
+    if unknown:
+        raise ValueError(f"Unknown features: {', '.join(unknown)}")
+
+
+def check_feature_schema(feature_names: List[str], models: dict):
+    """
+    Check that saved models were trained on the given feature set.
+
+    Args:
+        feature_names: Contents of ``feature_names.json``
+        models: Dictionary of loaded models and scalers
+
+    Raises:
+        ValueError: If a feature is unknown or a model expects a different
+            number or order of features
+    """
+    check_feature_names(feature_names)
+
+    for name, model in models.items():
+        n_features = getattr(model, 'n_features_in_', None)
+        if n_features is not None and n_features != len(feature_names):
+            raise ValueError(
+                f"{name} expects {n_features} features but feature_names.json "
+                f"lists {len(feature_names)}"
+            )
+
+        trained_names = getattr(model, 'feature_names_in_', None)
+        if trained_names is not None and list(trained_names) != list(feature_names):
+            raise ValueError(
+                f"{name} was trained on features {list(trained_names)}, "
+                f"not {list(feature_names)}"
+            )
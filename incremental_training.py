@@ -0,0 +1,350 @@
+import sys
+import os
+import copy
+import json
+import time
+import argparse
+import numpy as np
+from typing import Tuple
+
+from features import build_features
+from dataset_cache import load_labeled
+
+
+# Written next to the models by ModelTrainer.save_models
+STATS_FILENAME = 'linear_stats.npz'
+VERSION_FILENAME = 'version.json'
+
+# Largest standardized shift of a feature mean (|new mean - old mean| / old std)
+# tolerated before the tree models are refit
+DRIFT_THRESHOLD = 0.25
+
+# Boosting stages added per update, fitted to the new rows
+BOOST_STAGES = 10
+
+# Passes of MLP partial_fit over the new rows per update
+MLP_EPOCHS = 10
+
+
+def sufficient_stats(X: np.ndarray, y: np.ndarray) -> dict:
+    """
+    Compute the sufficient statistics of a linear least-squares fit.
+
+    Returns:
+        Dictionary of ``n``, ``sum_x``, ``sum_y``, ``xtx`` (X'X) and ``xty`` (X'y)
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    return {'n': np.array(len(y)), 'sum_x': X.sum(axis=0), 'sum_y': np.array(y.sum()),
+            'xtx': X.T @ X, 'xty': X.T @ y}
+
+
+def merge_stats(stats: dict, other: dict) -> dict:
+    """Combine the statistics of two disjoint sets of rows."""
+    return {key: stats[key] + other[key] for key in stats}
+
+
+def save_stats(path: str, stats: dict):
+    """Write sufficient statistics to an ``.npz`` file."""
+    np.savez(path, **stats)
+
+
+def load_stats(path: str) -> dict:
+    """Read sufficient statistics written by ``save_stats``."""
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def _centered(stats: dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+    """Return (centered X'X, centered X'y, x mean, y mean) as used with an intercept."""
+    n = float(stats['n'])
+    x_mean = stats['sum_x'] / n
+    y_mean = float(stats['sum_y']) / n
+    gram = stats['xtx'] - n * np.outer(x_mean, x_mean)
+    xy = stats['xty'] - n * x_mean * y_mean
+    return gram, xy, x_mean, y_mean
+
+
+def solve_linear(stats: dict, alpha: float = 0.0) -> Tuple[np.ndarray, float]:
+    """
+    Solve ordinary least squares (``alpha=0``) or ridge regression from statistics.
+
+    Matches ``LinearRegression`` / ``Ridge(alpha)`` fitted with an intercept
+    on every row the statistics were accumulated from.
+
+    Returns:
+        Tuple of (coef, intercept)
+    """
+    gram, xy, x_mean, y_mean = _centered(stats)
+    if alpha:
+        coef = np.linalg.solve(gram + alpha * np.eye(len(xy)), xy)
+    else:
+        coef = np.linalg.lstsq(gram, xy, rcond=None)[0]
+    return coef, y_mean - x_mean @ coef
+
+
+def solve_lasso(stats: dict, alpha: float, coef: np.ndarray = None, max_iter: int = 1000,
+                tol: float = 1e-4) -> Tuple[np.ndarray, float]:
+    """
+    Solve ``Lasso(alpha)`` from statistics by coordinate descent on the Gram matrix.
+
+    Minimizes ``(1 / 2n) ||y - Xw - b||² + alpha ||w||₁`` like sklearn.
+
+    Args:
+        stats: Sufficient statistics (see ``sufficient_stats``)
+        alpha: L1 penalty
+        coef: Starting point, usually the previous model's coefficients
+        max_iter: Maximum passes over the coefficients
+        tol: Stop once no coefficient moves by more than ``tol`` times the largest one
+
+    Returns:
+        Tuple of (coef, intercept)
+    """
+    gram, xy, x_mean, y_mean = _centered(stats)
+    penalty = alpha * float(stats['n'])
+    coef = np.zeros(len(xy)) if coef is None else np.array(coef, dtype=float)
+
+    for _ in range(max_iter):
+        largest_step = 0.0
+        for j in range(len(coef)):
+            if gram[j, j] <= 0:
+                continue
+            rho = xy[j] - gram[j] @ coef + gram[j, j] * coef[j]
+            updated = np.sign(rho) * max(abs(rho) - penalty, 0.0) / gram[j, j]
+            largest_step = max(largest_step, abs(updated - coef[j]))
+            coef[j] = updated
+        if largest_step <= tol * max(np.abs(coef).max(), 1e-12):
+            break
+
+    return coef, y_mean - x_mean @ coef
+
+
+def feature_drift(stats: dict, X_new: np.ndarray) -> float:
+    """
+    Largest standardized shift between the training and new feature means.
+
+    Returns:
+        ``max_j |mean_new_j - mean_j| / std_j`` over the features
+    """
+    gram, _, x_mean, _ = _centered(stats)
+    std = np.sqrt(np.maximum(np.diag(gram) / float(stats['n']), 1e-12))
+    return float(np.max(np.abs(np.asarray(X_new).mean(axis=0) - x_mean) / std))
+
+
+def load_labeled_cases(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Read cases with expected outputs from a CSV or ``public_cases.json``-style file.
+
+    Parsed once, then loaded from the columnar cache (see dataset_cache.py).
+
+    Returns:
+        Tuple of (days, miles, receipts, expected_output) arrays
+    """
+    return load_labeled(path)
+
+
+def read_version(model_dir: str) -> dict:
+    """Return a model directory's ``version.json`` (version 1 if it predates versioning)."""
+    try:
+        with open(os.path.join(model_dir, VERSION_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'version': 1, 'parent': None, 'updates': []}
+
+
+def update_models(model_dir: str, new_data_path: str, output_dir: str = None,
+                  history_path: str = None, drift_threshold: float = DRIFT_THRESHOLD,
+                  boost_stages: int = BOOST_STAGES, mlp_epochs: int = MLP_EPOCHS) -> dict:
+    """
+    Update a trained model directory with new cases, without a full refit.
+
+    - Linear Regression, Ridge and Lasso are re-solved exactly from the
+      stored sufficient statistics plus those of the new rows.
+    - The MLP takes ``mlp_epochs`` ``partial_fit`` passes over the new rows.
+    - Gradient Boosting gets ``boost_stages`` extra stages fitted to the new rows.
+    - The Decision Tree and Random Forest are kept, unless the new rows'
+      feature drift exceeds ``drift_threshold``; then they are refit on
+      ``history_path`` plus the new rows.
+
+    The source directory is left untouched; the result is written as a new
+    version to ``output_dir``. A router (see model_router.py) and fallback-mode
+    rules (see business_rules.py) are not carried over, since their routes
+    and trusted regions were chosen against the old models; refit them on
+    the new version with ``model_router.py fit`` and ``business_rules.py fit``.
+    Residual-mode rules are kept, as the models keep learning their residual.
+
+    Args:
+        model_dir: Directory written by ``ModelTrainer.save_models``, or a
+            registry root (its current version is updated)
+        new_data_path: CSV or JSON cases with ``expected_output``
+        output_dir: Where to write the new version (defaults to
+            ``<model_dir>_v<version>``)
+        history_path: Earlier cases to refit the trees on together with the new ones
+        drift_threshold: Drift above which the trees are refit
+        boost_stages: Boosting stages to add
+        mlp_epochs: ``partial_fit`` passes for the MLP
+
+    Returns:
+        Summary of the update (also recorded in ``version.json``)
+    """
+    from train_models import ModelTrainer
+    from predict_reimbursement import load_models
+    from model_registry import resolve_model_dir
+
+    start_time = time.perf_counter()
+    # Models, statistics and lineage all come from the same version
+    source = resolve_model_dir(model_dir)
+    models = load_models(source, backend='sklearn', use_lookup_table=False,
+                         case_index='')
+    feature_names = models.pop('feature_names')
+    weights = models.pop('ensemble_weights', None)
+    rules = models.pop('rules', None)
+    if rules is not None and rules.mode != 'residual':
+        # Fallback regions were trusted by comparison with the old ensemble
+        rules = None
+    # Routes are compiled from the old members (and mmap'd, so they cannot be
+    # copied); the new version is written unrouted until the router is refit
+    models.pop('router', None)
+    scalers = {name: models.pop(name) for name in list(models) if name.endswith('_scaler')}
+    # Never modify the loaded objects of the source version in place
+    models = copy.deepcopy(models)
+
+    stats_path = os.path.join(source, STATS_FILENAME)
+    if not os.path.exists(stats_path):
+        raise FileNotFoundError(f"{stats_path} missing; retrain once with train_models.py "
+                                f"to enable incremental updates")
+    stats = load_stats(stats_path)
+
+    days, miles, receipts, y_new = load_labeled_cases(new_data_path)
+    # Models trained on the business rules' residual keep learning the residual
+    residual = rules is not None and rules.mode == 'residual'
+    if residual:
+        y_new = y_new - rules.predict(days, miles, receipts)
+    X_new = build_features(days, miles, receipts, feature_names)
+    drift = feature_drift(stats, X_new)
+
+    previous = read_version(source)
+    summary = {'new_rows': int(len(y_new)), 'drift': drift, 'updated': [], 'refit': [],
+               'kept': []}
+
+    stats = merge_stats(stats, sufficient_stats(X_new, y_new))
+    for name, model in models.items():
+        if name in ('linear_regression', 'ridge'):
+            model.coef_, model.intercept_ = solve_linear(
+                stats, model.alpha if name == 'ridge' else 0.0)
+            summary['updated'].append(name)
+        elif name == 'lasso':
+            model.coef_, model.intercept_ = solve_lasso(stats, model.alpha, model.coef_,
+                                                        model.max_iter, model.tol)
+            summary['updated'].append(name)
+        elif name == 'neural_network':
+            # partial_fit has no held-out set to stop early on, and then tracks
+            # the training loss that early stopping never recorded
+            model.set_params(early_stopping=False)
+            if getattr(model, 'best_loss_', None) is None:
+                model.best_loss_ = np.inf
+            X_scaled = scalers['nn_scaler'].transform(X_new)
+            for _ in range(mlp_epochs):
+                model.partial_fit(X_scaled, y_new)
+            summary['updated'].append(name)
+        elif name == 'gradient_boosting':
+            model.set_params(warm_start=True, n_estimators=model.n_estimators_ + boost_stages)
+            model.fit(X_new, y_new)
+            summary['updated'].append(name)
+
+    trees = [name for name in ('decision_tree', 'random_forest') if name in models]
+    if drift > drift_threshold and trees:
+        if history_path is None:
+            raise ValueError(f"Feature drift {drift:.3f} exceeds {drift_threshold}; "
+                             f"pass the training history to refit {', '.join(trees)}")
+        h_days, h_miles, h_receipts, h_y = load_labeled_cases(history_path)
+        X_all = np.vstack([build_features(h_days, h_miles, h_receipts, feature_names), X_new])
+        if residual:
+            h_y = h_y - rules.predict(h_days, h_miles, h_receipts)
+        y_all = np.concatenate([h_y, y_new])
+        for name in trees:
+            model = models[name]
+            models[name] = model.__class__(**model.get_params()).fit(X_all, y_all)
+            summary['refit'].append(name)
+    else:
+        summary['kept'].extend(trees)
+
+    summary['seconds'] = time.perf_counter() - start_time
+
+    trainer = ModelTrainer()
+    trainer.models = dict(models)
+    if weights is not None:
+        trainer.models['ensemble_weights'] = weights
+    trainer.scalers = scalers
+    trainer.feature_names = list(feature_names)
+    trainer.train_stats = stats
+    trainer.rules = rules
+    trainer.version_info = {
+        'version': previous['version'] + 1,
+        'parent': previous['version'],
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'n_samples': int(stats['n']),
+        'updates': previous.get('updates', []) + [summary],
+    }
+
+    output_dir = output_dir or f"{model_dir.rstrip(os.sep)}_v{trainer.version_info['version']}"
+    trainer.save_models(output_dir)
+    summary['output_dir'] = output_dir
+    return summary
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python incremental_training.py <new_cases.csv|json> [--model-dir models]
+                                       [--output-dir models_v2 | --registry models]
+                                       [--history public_cases.csv]
+                                       [--drift-threshold 0.25] [--boost-stages 10]
+                                       [--mlp-epochs 10]
+    """
+    from predict_reimbursement import MODEL_DIR
+
+    parser = argparse.ArgumentParser(description="Update trained models with new cases")
+    parser.add_argument('new_data', help="CSV or JSON cases with expected_output")
+    parser.add_argument('--model-dir', default=MODEL_DIR, help="Version to update")
+    parser.add_argument('--output-dir', default=None,
+                        help="Where to write the new version (default: <model-dir>_v<N>)")
+    parser.add_argument('--history', default='public_cases.csv',
+                        help="Cases the models were trained on (used for tree refits)")
+    parser.add_argument('--drift-threshold', type=float, default=DRIFT_THRESHOLD)
+    parser.add_argument('--boost-stages', type=int, default=BOOST_STAGES)
+    parser.add_argument('--mlp-epochs', type=int, default=MLP_EPOCHS)
+    parser.add_argument('--registry', default=None,
+                        help="Publish the new version to this registry root and make it current")
+    args = parser.parse_args()
+
+    try:
+        if args.registry:
+            from model_registry import publish, resolve_model_dir
+
+            summary = {}
+            source = resolve_model_dir(args.model_dir)
+            version = publish(args.registry, lambda staging: summary.update(update_models(
+                source, args.new_data, staging, args.history, args.drift_threshold,
+                args.boost_stages, args.mlp_epochs)))
+            summary['output_dir'] = f"{args.registry} ({version})"
+        else:
+            summary = update_models(args.model_dir, args.new_data, args.output_dir,
+                                    args.history, args.drift_threshold, args.boost_stages,
+                                    args.mlp_epochs)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"\nUpdated with {summary['new_rows']} new cases in {summary['seconds']:.2f}s "
+          f"(feature drift {summary['drift']:.3f})")
+    print(f"  updated: {', '.join(summary['updated']) or '-'}")
+    print(f"  refit:   {', '.join(summary['refit']) or '-'}")
+    print(f"  kept:    {', '.join(summary['kept']) or '-'}")
+    print(f"✓ Saved to {summary['output_dir']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+
+# Span timing is off unless REIMBURSEMENT_METRICS=1 (or enable() is called)
+ENABLED = os.environ.get('REIMBURSEMENT_METRICS') == '1'
+
+# Where entry points write the metrics on exit: *.json for JSON, anything
+# else for Prometheus text (unset: not written)
+METRICS_FILE = os.environ.get('REIMBURSEMENT_METRICS_FILE')
+
+# cProfile output of entry points run under profiled() (unset: no profiling).
+# "{name}" is replaced by the entry point, e.g. profile-{name}.prof
+PROFILE_PATH = os.environ.get('REIMBURSEMENT_PROFILE')
+
+# Prefix of every exported Prometheus metric
+METRIC_PREFIX = 'reimbursement_span'
+
+# Calls best_time() makes by default (the fastest one is kept)
+TIMING_REPEATS = 5
+
+# span name -> [count, total seconds, max seconds]
+_SPANS: Dict[str, list] = {}
+_LOCK = threading.Lock()
+
+
+class _NullSpan:
+    """Shared no-op context manager handed out while instrumentation is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Times one ``with`` block and adds it to its span's totals."""
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name: str):
+    """
+    Time a block of code under ``name``.
+
+    Usage:
+        with span('predict.features'):
+            features = preprocess_features(...)
+
+    While disabled this returns a shared no-op object, so instrumented hot
+    paths only pay for one function call and a global lookup.
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def record(name: str, seconds: float):
+    """Add one timed occurrence of ``name`` (for durations measured elsewhere)."""
+    if not ENABLED:
+        return
+    with _LOCK:
+        totals = _SPANS.get(name)
+        if totals is None:
+            _SPANS[name] = [1, seconds, seconds]
+        else:
+            totals[0] += 1
+            totals[1] += seconds
+            if seconds > totals[2]:
+                totals[2] = seconds
+
+
+def best_time(function: Callable[[], object], repeats: int = TIMING_REPEATS) -> float:
+    """Fastest wall-clock seconds of ``repeats`` calls to ``function`` (for benchmarks)."""
+    best = float('inf')
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def enable(enabled: bool = True):
+    """Switch span timing on or off for this process."""
+    global ENABLED
+    ENABLED = enabled
+
+
+def reset():
+    """Forget every recorded span."""
+    with _LOCK:
+        _SPANS.clear()
+
+
+def snapshot() -> Dict[str, dict]:
+    """
+    Return the recorded spans.
+
+    Returns:
+        Dictionary mapping span name to ``count``, ``total_seconds``,
+        ``mean_seconds`` and ``max_seconds``
+    """
+    with _LOCK:
+        spans = {name: list(totals) for name, totals in _SPANS.items()}
+    return {name: {'count': count, 'total_seconds': total, 'mean_seconds': total / count,
+                   'max_seconds': peak}
+            for name, (count, total, peak) in sorted(spans.items())}
+
+
+def to_json() -> str:
+    """Recorded spans as a JSON document."""
+    import json
+
+    return json.dumps({'spans': snapshot()}, indent=2)
+
+
+def to_prometheus() -> str:
+    """Recorded spans in the Prometheus text exposition format."""
+    lines = []
+    for suffix, kind, key, help_text in (
+            ('seconds_total', 'counter', 'total_seconds', 'Total time spent in the span'),
+            ('count', 'counter', 'count', 'Number of times the span ran'),
+            ('max_seconds', 'gauge', 'max_seconds', 'Longest single run of the span')):
+        metric = f'{METRIC_PREFIX}_{suffix}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, values in snapshot().items():
+            lines.append(f'{metric}{{span="{name}"}} {values[key]:.9g}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(path: str = None):
+    """Write the recorded spans to ``path`` (defaults to ``METRICS_FILE``)."""
+    path = path or METRICS_FILE
+    if not path:
+        return
+    with open(path, 'w') as f:
+        f.write(to_json() if path.endswith('.json') else to_prometheus())
+
+
+@contextmanager
+def profiled(name: str):
+    """
+    Run an entry point under cProfile when ``REIMBURSEMENT_PROFILE`` is set.
+
+    The stats file opens with ``python -m pstats``, snakeviz, or flameprof /
+    gprof2dot for a flame graph. Metrics are written to ``METRICS_FILE`` on
+    the way out either way.
+
+    Args:
+        name: Entry point name, substituted for ``{name}`` in the profile path
+    """
+    if not PROFILE_PATH:
+        try:
+            yield
+        finally:
+            write_metrics()
+        return
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = PROFILE_PATH.replace('{name}', name)
+        profiler.dump_stats(path)
+        print(f"Profile written to {path}", file=sys.stderr)
+        write_metrics()
@@ -0,0 +1,32 @@
+import sys
+import importlib.util
+
+
+def lazy_import(name: str):
+    """
+    Import a module without executing it until an attribute is first used.
+
+    The prediction path binds ``np = lazy_import('numpy')`` so a single-trip
+    prediction from the compiled artifact, which is pure Python, never pays
+    for importing NumPy. Batch code paths trigger the real import on their
+    first ``np.`` access.
+
+    Args:
+        name: Fully qualified module name
+
+    Returns:
+        The (possibly not yet executed) module object
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'")
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
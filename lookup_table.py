@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import sys
+import os
+import json
+import time
+import argparse
+from typing import Tuple
+
+from lazy_imports import lazy_import
+from prediction_cache import MODEL_SUFFIXES, model_artifact_hash
+from business_rules import RULES_FILENAME
+from model_router import ROUTER_FILENAME
+
+np = lazy_import('numpy')
+
+
+# Files written next to the other model artifacts
+TABLE_FILENAME = 'lookup_table.npy'
+TABLE_META_FILENAME = 'lookup_table.json'
+
+# Default grid: every integer day and mile seen in the cases, receipts
+# sampled every $10 up to just past the largest receipt total
+DEFAULT_GRID = {
+    'max_days': 14,
+    'max_miles': 1500,
+    'miles_step': 1,
+    'max_receipts': 2600.0,
+    'receipt_step': 10.0,
+}
+
+# Artifacts the tabulated predictions depend on; the table records their hash
+SOURCE_SUFFIXES = MODEL_SUFFIXES + (RULES_FILENAME, ROUTER_FILENAME)
+
+
+class LookupTable:
+    """
+    Precomputed ensemble output over a (days, miles, receipts) grid.
+
+    Days index the table exactly, miles and receipts are interpolated
+    linearly between grid points, so each query is a constant number of
+    array reads from the memory-mapped table.
+    """
+
+    def __init__(self, table: np.ndarray, meta: dict):
+        """
+        Args:
+            table: Array of shape (days, miles points, receipt points)
+            meta: Grid description and measured error (see ``build_table``)
+        """
+        self.table = table
+        self.meta = meta
+        self.max_days = meta['max_days']
+        self.max_miles = meta['max_miles']
+        self.miles_step = meta['miles_step']
+        self.max_receipts = meta['max_receipts']
+        self.receipt_step = meta['receipt_step']
+
+    def in_range(self, trip_duration_days, miles_traveled, total_receipts_amount) -> np.ndarray:
+        """Mask of trips the table can answer (integer days/miles inside the grid)."""
+        days = np.asarray(trip_duration_days, dtype=float)
+        miles = np.asarray(miles_traveled, dtype=float)
+        receipts = np.asarray(total_receipts_amount, dtype=float)
+        return ((days >= 1) & (days <= self.max_days) & (days == np.round(days))
+                & (miles >= 0) & (miles <= self.max_miles) & (miles == np.round(miles))
+                & (receipts >= 0) & (receipts <= self.max_receipts))
+
+    def predict(self, trip_duration_days, miles_traveled,
+                total_receipts_amount) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Look up predictions for many trips.
+
+        Args:
+            trip_duration_days: Array of trip durations
+            miles_traveled: Array of miles traveled
+            total_receipts_amount: Array of receipt totals
+
+        Returns:
+            Tuple of (predictions, in_range mask). Predictions for trips
+            outside the grid are NaN and must be scored by the ensemble.
+        """
+        days = np.atleast_1d(np.asarray(trip_duration_days, dtype=float))
+        miles = np.atleast_1d(np.asarray(miles_traveled, dtype=float))
+        receipts = np.atleast_1d(np.asarray(total_receipts_amount, dtype=float))
+        mask = self.in_range(days, miles, receipts)
+
+        predictions = np.full(len(days), np.nan)
+        if not mask.any():
+            return predictions, mask
+
+        day_index = days[mask].astype(np.intp) - 1
+        miles_index, miles_t = self._grid_position(miles[mask] / self.miles_step,
+                                                   self.table.shape[1])
+        receipt_index, receipt_t = self._grid_position(receipts[mask] / self.receipt_step,
+                                                       self.table.shape[2])
+
+        def corner(dm, dr):
+            return self.table[day_index, miles_index + dm, receipt_index + dr]
+
+        predictions[mask] = (
+            (1 - miles_t) * ((1 - receipt_t) * corner(0, 0) + receipt_t * corner(0, 1))
+            + miles_t * ((1 - receipt_t) * corner(1, 0) + receipt_t * corner(1, 1))
+        )
+        return predictions, mask
+
+    @staticmethod
+    def _grid_position(position: np.ndarray, n_points: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Split fractional grid positions into (lower index, weight of the upper point)."""
+        index = np.clip(np.floor(position).astype(np.intp), 0, n_points - 2)
+        return index, position - index
+
+
+def build_table(models: dict, max_days: int = DEFAULT_GRID['max_days'],
+                max_miles: int = DEFAULT_GRID['max_miles'],
+                miles_step: int = DEFAULT_GRID['miles_step'],
+                max_receipts: float = DEFAULT_GRID['max_receipts'],
+                receipt_step: float = DEFAULT_GRID['receipt_step']) -> np.ndarray:
+    """
+    Evaluate the ensemble over the full grid.
+
+    Args:
+        models: Loaded models (see ``predict_reimbursement.load_models``)
+        max_days: Largest trip duration in the grid (days start at 1)
+        max_miles: Largest mileage in the grid (miles start at 0)
+        miles_step: Spacing of the mileage grid
+        max_receipts: Largest receipt total in the grid (receipts start at 0)
+        receipt_step: Spacing of the receipt grid
+
+    Returns:
+        float32 array of shape (max_days, max_miles / miles_step + 1,
+        max_receipts / receipt_step + 1)
+    """
+    from predict_reimbursement import preprocess_batch, ensemble_predict_batch
+
+    miles_points = np.arange(0, max_miles + miles_step, miles_step, dtype=float)
+    receipt_points = np.arange(0, max_receipts + receipt_step / 2, receipt_step)
+    table = np.empty((max_days, len(miles_points), len(receipt_points)), dtype=np.float32)
+
+    miles_grid, receipt_grid = np.meshgrid(miles_points, receipt_points, indexing='ij')
+    for day in range(1, max_days + 1):
+        features = preprocess_batch(np.full(miles_grid.size, float(day)), miles_grid.ravel(),
+                                    receipt_grid.ravel(), models['feature_names'])
+        table[day - 1] = ensemble_predict_batch(models, features).reshape(miles_grid.shape)
+        print(f"  day {day}/{max_days}", file=sys.stderr)
+
+    return table
+
+
+def measure_error(table: LookupTable, models: dict,
+                  cases_path: str = 'public_cases.json') -> dict:
+    """
+    Compare table lookups with the full ensemble on a cases file.
+
+    Returns:
+        Dictionary with the number of cases covered and the max/mean
+        absolute difference from the ensemble
+    """
+    from predict_reimbursement import load_trips, preprocess_batch, ensemble_predict_batch
+
+    days, miles, receipts = load_trips(cases_path)
+    looked_up, mask = table.predict(days, miles, receipts)
+    features = preprocess_batch(days[mask], miles[mask], receipts[mask], models['feature_names'])
+    errors = np.abs(looked_up[mask] - ensemble_predict_batch(models, features))
+
+    return {
+        'cases': cases_path,
+        'covered': int(mask.sum()),
+        'total': int(len(days)),
+        'max_error': float(errors.max()) if errors.size else 0.0,
+        'mean_error': float(errors.mean()) if errors.size else 0.0,
+    }
+
+
+def save_table(model_dir: str, models: dict, cases_path: str = 'public_cases.json',
+               max_error: float = None, **grid) -> dict:
+    """
+    Build the table for ``model_dir``, measure its error and write both files.
+
+    The measured error against the ensemble is always declared in
+    ``lookup_table.json``; ``max_error`` optionally turns it into a limit.
+
+    Args:
+        model_dir: Model directory to read the ensemble from and write into
+        models: Loaded models for ``model_dir``
+        cases_path: Cases used to declare the error bound
+        max_error: If given, refuse a table that differs from the ensemble by
+            more than this on any covered case (0.01 for exact matches)
+        **grid: Overrides for ``DEFAULT_GRID``
+
+    Returns:
+        The metadata written to ``lookup_table.json``
+
+    Raises:
+        ValueError: If the table's error exceeds ``max_error`` (nothing is written)
+    """
+    meta = {**DEFAULT_GRID, **grid}
+    table = build_table(models, **meta)
+
+    meta['error_bound'] = measure_error(LookupTable(table, meta), models, cases_path)
+    if max_error is not None and meta['error_bound']['max_error'] > max_error:
+        raise ValueError(f"lookup table differs from the ensemble by up to "
+                         f"${meta['error_bound']['max_error']:.2f} on {cases_path} "
+                         f"(limit ${max_error:.2f}); use a finer --receipt-step or "
+                         f"drop --max-error")
+    meta['error_limit'] = max_error
+    meta['model_hash'] = model_artifact_hash(model_dir, SOURCE_SUFFIXES)
+
+    table_path = os.path.join(model_dir, TABLE_FILENAME)
+    np.save(table_path + '.tmp.npy', table)
+    os.replace(table_path + '.tmp.npy', table_path)
+    with open(os.path.join(model_dir, TABLE_META_FILENAME), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    return meta
+
+
+def load_table(model_dir: str) -> LookupTable:
+    """
+    Memory-map the lookup table of a model directory.
+
+    Args:
+        model_dir: Directory holding ``lookup_table.npy`` and ``lookup_table.json``
+
+    Returns:
+        LookupTable backed by the memory-mapped file
+
+    Raises:
+        ValueError: If the table was built from other models, rules or router
+    """
+    with open(os.path.join(model_dir, TABLE_META_FILENAME)) as f:
+        meta = json.load(f)
+    if meta.get('model_hash') != model_artifact_hash(model_dir, SOURCE_SUFFIXES):
+        raise ValueError(f"{TABLE_FILENAME} in {model_dir} was built from other models; "
+                         f"rebuild it with lookup_table.py build")
+    table = np.load(os.path.join(model_dir, TABLE_FILENAME), mmap_mode='r')
+    return LookupTable(table, meta)
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python lookup_table.py build [--model-dir models] [--max-days 14] [--max-miles 1500]
+                                     [--miles-step 1] [--max-receipts 2600] [--receipt-step 10]
+                                     [--max-error 0.01]
+
+    ``build`` declares the table's measured error in ``lookup_table.json``;
+    with ``--max-error`` it refuses a table beyond that error instead. For a
+    registry root the table is published with the current version's models
+    as a new version.
+        python lookup_table.py check [--model-dir models]
+    """
+    from predict_reimbursement import MODEL_DIR, load_models
+    from model_registry import is_registry, resolve_model_dir, publish, _copy_files
+
+    parser = argparse.ArgumentParser(description="Precomputed lookup table for the ensemble")
+    parser.add_argument('command', choices=['build', 'check'])
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--cases', default='public_cases.json',
+                        help="Cases used to measure the table's error")
+    parser.add_argument('--max-days', type=int, default=DEFAULT_GRID['max_days'])
+    parser.add_argument('--max-miles', type=int, default=DEFAULT_GRID['max_miles'])
+    parser.add_argument('--miles-step', type=int, default=DEFAULT_GRID['miles_step'])
+    parser.add_argument('--max-receipts', type=float, default=DEFAULT_GRID['max_receipts'])
+    parser.add_argument('--receipt-step', type=float, default=DEFAULT_GRID['receipt_step'])
+    parser.add_argument('--max-error', type=float, default=None,
+                        help="Refuse a table further than this from the ensemble on --cases "
+                             "(default: accept it and declare the measured error)")
+    args = parser.parse_args()
+
+    try:
+        source = resolve_model_dir(args.model_dir)
+        # Build and check against the ensemble itself, never a previous table
+        models = load_models(source, use_lookup_table=False, case_index='')
+
+        if args.command == 'build':
+            start_time = time.perf_counter()
+            written = {}
+
+            def write_table(model_dir):
+                written['meta'] = save_table(
+                    model_dir, models, args.cases, args.max_error, max_days=args.max_days,
+                    max_miles=args.max_miles, miles_step=args.miles_step,
+                    max_receipts=args.max_receipts, receipt_step=args.receipt_step)
+                written['size_mb'] = os.path.getsize(os.path.join(model_dir, TABLE_FILENAME)) / 2**20
+
+            if is_registry(args.model_dir):
+                # Published versions are immutable
+                def write_artifacts(staging):
+                    _copy_files(source, staging)
+                    write_table(staging)
+                version = publish(args.model_dir, write_artifacts)
+                print(f"✓ Published {source} with {TABLE_FILENAME} ({written['size_mb']:.1f} MB) "
+                      f"as {version} in {time.perf_counter() - start_time:.1f}s")
+            else:
+                write_table(source)
+                print(f"✓ Built {TABLE_FILENAME} ({written['size_mb']:.1f} MB) in "
+                      f"{time.perf_counter() - start_time:.1f}s")
+            meta = written['meta']
+        else:
+            table = load_table(source)
+            meta = table.meta
+            meta['error_bound'] = measure_error(table, models, args.cases)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    bound = meta['error_bound']
+    print(f"Covers {bound['covered']}/{bound['total']} cases in {bound['cases']}; "
+          f"max error vs ensemble ${bound['max_error']:.4f}, mean ${bound['mean_error']:.4f}")
+
+
+if __name__ == '__main__':
+    main()
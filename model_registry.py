@@ -0,0 +1,307 @@
+import sys
+import os
+import json
+import time
+import argparse
+from typing import Callable, Dict, List, Optional
+
+
+# Registry layout:
+#   <root>/CURRENT            name of the version being served, e.g. "v0003"
+#   <root>/versions/v0003/    immutable artifacts written by one training run
+#   <root>/versions/v0003/manifest.json
+POINTER_FILENAME = 'CURRENT'
+VERSIONS_DIRNAME = 'versions'
+MANIFEST_FILENAME = 'manifest.json'
+
+# How often long-running processes re-read CURRENT to pick up a new version
+POLL_SECONDS = float(os.environ.get('REIMBURSEMENT_REGISTRY_POLL', 1.0))
+
+# root -> (monotonic time checked, resolved version directory)
+_RESOLVED = {}
+
+
+def is_registry(path: str) -> bool:
+    """Check whether ``path`` is a registry root rather than a flat model directory."""
+    return os.path.isfile(os.path.join(path, POINTER_FILENAME))
+
+
+def current_version(root: str) -> Optional[str]:
+    """Return the name of the version ``CURRENT`` points at (None if unset)."""
+    try:
+        with open(os.path.join(root, POINTER_FILENAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_dir(root: str, version: str) -> str:
+    """Return the artifact directory of a version."""
+    return os.path.join(root, VERSIONS_DIRNAME, version)
+
+
+def resolve_model_dir(path: str, poll_seconds: float = None) -> str:
+    """
+    Map a registry root to its current version directory.
+
+    Plain model directories are returned unchanged. The pointer is re-read
+    at most every ``poll_seconds``, so calling this per prediction is cheap.
+
+    Args:
+        path: Registry root or flat model directory
+        poll_seconds: Pointer refresh interval (defaults to ``POLL_SECONDS``)
+
+    Returns:
+        Directory holding the model artifacts to load
+    """
+    poll_seconds = POLL_SECONDS if poll_seconds is None else poll_seconds
+    now = time.monotonic()
+    checked = _RESOLVED.get(path)
+    if checked is not None and now - checked[0] < poll_seconds:
+        return checked[1]
+
+    version = current_version(path)
+    resolved = version_dir(path, version) if version else path
+    _RESOLVED[path] = (now, resolved)
+    return resolved
+
+
+def list_versions(root: str) -> List[str]:
+    """Return the published version names, oldest first."""
+    try:
+        names = os.listdir(os.path.join(root, VERSIONS_DIRNAME))
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if name.startswith('v') and name[1:].isdigit())
+
+
+def read_manifest(root: str, version: str) -> dict:
+    """Return a version's ``manifest.json``."""
+    with open(os.path.join(version_dir(root, version), MANIFEST_FILENAME)) as f:
+        return json.load(f)
+
+
+def file_checksums(directory: str) -> Dict[str, dict]:
+    """
+    Checksum every artifact in a directory (except the manifest itself).
+
+    Returns:
+        Dictionary mapping file name to its SHA-256 and size in bytes
+    """
+    import hashlib
+
+    checksums = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name == MANIFEST_FILENAME or not os.path.isfile(path):
+            continue
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        checksums[name] = {'sha256': digest.hexdigest(), 'bytes': os.path.getsize(path)}
+    return checksums
+
+
+def _read_json(path: str):
+    """Load a JSON file, or return None if it doesn't exist."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def publish(root: str, write_artifacts: Callable[[str], object], metrics: dict = None,
+            activate: bool = True) -> str:
+    """
+    Publish a new immutable version.
+
+    ``write_artifacts`` fills a private staging directory, the manifest is
+    written next to the artifacts, and the directory is renamed into
+    ``versions/`` in one step, so readers never see a partial version.
+
+    Args:
+        root: Registry root (created if missing)
+        write_artifacts: Called with the staging directory, e.g.
+            ``trainer.save_models``
+        metrics: Evaluation metrics to record in the manifest
+        activate: Point ``CURRENT`` at the new version
+
+    Returns:
+        Name of the new version
+    """
+    import shutil
+
+    versions_root = os.path.join(root, VERSIONS_DIRNAME)
+    os.makedirs(versions_root, exist_ok=True)
+    staging = os.path.join(versions_root, f'.staging-{os.getpid()}-{time.time_ns()}')
+    os.makedirs(staging)
+
+    try:
+        write_artifacts(staging)
+
+        parent = current_version(root)
+        manifest = {
+            'parent': parent,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'feature_names': _read_json(os.path.join(staging, 'feature_names.json')),
+            'ensemble_weights': _read_json(os.path.join(staging, 'ensemble_weights.json')),
+            'metrics': metrics or {},
+            'files': file_checksums(staging),
+        }
+
+        # Artifacts are never modified after publishing
+        for name in os.listdir(staging):
+            os.chmod(os.path.join(staging, name), 0o444)
+
+        # Another publisher may claim the same number first; take the next one
+        while True:
+            existing = list_versions(root)
+            version = f"v{int(existing[-1][1:]) + 1 if existing else 1:04d}"
+            manifest['version'] = version
+            manifest_path = os.path.join(staging, MANIFEST_FILENAME)
+            if os.path.exists(manifest_path):
+                os.chmod(manifest_path, 0o644)
+            with open(manifest_path, 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.chmod(manifest_path, 0o444)
+            try:
+                os.rename(staging, version_dir(root, version))
+                break
+            except OSError:
+                if not os.path.exists(version_dir(root, version)):
+                    raise
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if activate:
+        set_current(root, version, check=False)
+    return version
+
+
+def verify(root: str, version: str) -> List[str]:
+    """
+    Compare a version's files with the checksums in its manifest.
+
+    Returns:
+        Names of missing, modified or unexpected files (empty if intact)
+    """
+    expected = read_manifest(root, version)['files']
+    actual = file_checksums(version_dir(root, version))
+    return sorted(name for name in set(expected) | set(actual)
+                  if expected.get(name) != actual.get(name))
+
+
+def set_current(root: str, version: str, check: bool = True):
+    """
+    Atomically point ``CURRENT`` at a published version.
+
+    Args:
+        root: Registry root
+        version: Version name, e.g. ``v0003``
+        check: Verify the version's checksums first
+
+    Raises:
+        ValueError: If the version doesn't exist or fails verification
+    """
+    if version not in list_versions(root):
+        raise ValueError(f"Unknown model version: {version}")
+    if check:
+        mismatched = verify(root, version)
+        if mismatched:
+            raise ValueError(f"Version {version} failed verification: {', '.join(mismatched)}")
+
+    pointer = os.path.join(root, POINTER_FILENAME)
+    staging = f'{pointer}.{os.getpid()}.tmp'
+    with open(staging, 'w') as f:
+        f.write(version + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(staging, pointer)
+    _RESOLVED.pop(root, None)
+
+
+def rollback(root: str) -> str:
+    """
+    Point ``CURRENT`` back at the parent of the current version.
+
+    Returns:
+        The version now current
+
+    Raises:
+        ValueError: If the current version has no parent
+    """
+    version = current_version(root)
+    parent = read_manifest(root, version)['parent'] if version else None
+    if parent is None:
+        raise ValueError(f"Version {version} has no parent to roll back to")
+    set_current(root, parent)
+    return parent
+
+
+def _copy_files(source: str, destination: str):
+    """Copy the files (not subdirectories) of a flat model directory."""
+    import shutil
+
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if os.path.isfile(path) and name != POINTER_FILENAME:
+            shutil.copy2(path, destination)
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python model_registry.py list [--root models]
+        python model_registry.py publish <model_dir> [--root models] [--no-activate]
+        python model_registry.py promote <version> [--root models]
+        python model_registry.py rollback [--root models]
+        python model_registry.py verify <version> [--root models]
+    """
+    from predict_reimbursement import MODEL_DIR
+
+    parser = argparse.ArgumentParser(description="Versioned model registry")
+    parser.add_argument('command', choices=['list', 'publish', 'promote', 'rollback', 'verify'])
+    parser.add_argument('target', nargs='?', help="Model directory (publish) or version")
+    parser.add_argument('--root', default=MODEL_DIR, help="Registry root")
+    parser.add_argument('--no-activate', action='store_true',
+                        help="Publish without pointing CURRENT at the new version")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'list':
+            current = current_version(args.root)
+            for version in list_versions(args.root):
+                manifest = read_manifest(args.root, version)
+                metrics = ', '.join(f"{key} {value:.4g}"
+                                    for key, value in manifest['metrics'].items())
+                marker = '*' if version == current else ' '
+                print(f"{marker} {version}  {manifest['created']}  parent {manifest['parent']}  "
+                      f"{metrics}")
+        elif args.command == 'publish':
+            if not args.target:
+                raise ValueError("publish needs the model directory to copy")
+            version = publish(args.root, lambda staging: _copy_files(args.target, staging),
+                              activate=not args.no_activate)
+            print(f"✓ Published {args.target} as {version}")
+        elif args.command == 'promote':
+            set_current(args.root, args.target)
+            print(f"✓ {args.target} is now current")
+        elif args.command == 'rollback':
+            print(f"✓ Rolled back to {rollback(args.root)}")
+        else:
+            mismatched = verify(args.root, args.target)
+            if mismatched:
+                raise ValueError(f"{args.target} failed verification: {', '.join(mismatched)}")
+            print(f"✓ {args.target} matches its manifest")
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
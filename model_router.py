@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import sys
+import os
+import json
+import argparse
+from bisect import bisect_right
+from typing import Callable, Dict, List
+
+from lazy_imports import lazy_import
+from features import EPSILON, RAW_FEATURES
+from compiled_ensemble import COMPILED_FILENAME, load_compiled
+from prediction_cache import MODEL_SUFFIXES, model_artifact_hash
+from instrumentation import best_time
+
+np = lazy_import('numpy')
+
+
+# Routing table, with the fit-time report, next to the other model artifacts
+ROUTER_FILENAME = 'router.json'
+# Each routable model is compiled on its own as route_<model>.bin
+ROUTE_PREFIX = 'route_'
+# Route name of the full ensemble, used wherever no cheaper model qualifies
+ENSEMBLE = 'ensemble'
+
+# Segment grid: lower edges along each routing input
+SEGMENT_EDGES = {
+    'trip_duration_days': [0, 3, 7],
+    'miles_per_day': [0, 100, 250],
+    'total_receipts_amount': [0, 300, 800, 1500],
+}
+
+# A model qualifies for a segment if its MAE there is at most the
+# ensemble's MAE times (1 + TOLERANCE)
+TOLERANCE = 0.05
+
+# Segments with fewer held-out cases than this always use the ensemble
+MIN_SEGMENT_CASES = 10
+
+
+def segment_index(days, miles, receipts) -> np.ndarray:
+    """Flat ``SEGMENT_EDGES`` grid index of each trip."""
+    days = np.atleast_1d(np.asarray(days, dtype=float))
+    miles = np.atleast_1d(np.asarray(miles, dtype=float))
+    receipts = np.atleast_1d(np.asarray(receipts, dtype=float))
+    index = np.zeros(len(days), dtype=np.intp)
+    for name, values in (('trip_duration_days', days),
+                         ('miles_per_day', miles / (days + EPSILON)),
+                         ('total_receipts_amount', receipts)):
+        edges = SEGMENT_EDGES[name]
+        position = np.searchsorted(edges, values, side='right') - 1
+        index = index * len(edges) + np.clip(position, 0, len(edges) - 1)
+    return index
+
+
+def segment_index_one(days: float, miles: float, receipts: float) -> int:
+    """Pure-Python ``segment_index`` for a single trip."""
+    index = 0
+    for name, value in (('trip_duration_days', days),
+                        ('miles_per_day', miles / (days + EPSILON)),
+                        ('total_receipts_amount', receipts)):
+        edges = SEGMENT_EDGES[name]
+        index = index * len(edges) + min(max(bisect_right(edges, value) - 1, 0), len(edges) - 1)
+    return index
+
+
+def segment_label(segment: int) -> str:
+    """Readable bounds of a segment, e.g. ``days 3-7, miles/day 0-100, receipts 800+``."""
+    labels = []
+    for (name, edges), short in zip(reversed(list(SEGMENT_EDGES.items())),
+                                    ('receipts', 'miles/day', 'days')):
+        position = segment % len(edges)
+        segment //= len(edges)
+        upper = f"-{edges[position + 1]:g}" if position + 1 < len(edges) else '+'
+        labels.append(f"{short} {edges[position]:g}{upper}")
+    return ', '.join(reversed(labels))
+
+
+class ModelRouter:
+    """
+    Dispatch each trip to the cheapest model that is accurate enough for its segment.
+
+    Routed models are single-model compiled artifacts, so routing works the
+    same for every backend and the single-trip path needs no NumPy.
+    """
+
+    def __init__(self, routes: List[str], costs: Dict[str, float], models: dict,
+                 report: dict = None):
+        """
+        Args:
+            routes: Model name per ``SEGMENT_EDGES`` segment (``ENSEMBLE`` for the full ensemble)
+            costs: Measured seconds per prediction of each route
+            models: Compiled single-model ensembles by name
+            report: Fit-time accuracy report (see ``fit_router``)
+        """
+        self.routes = list(routes)
+        self.costs = dict(costs)
+        self.models = models
+        self.report = report or {}
+        self.names = sorted(set(self.routes))
+        self._route_ids = None
+        # Predictions answered per route since loading
+        self.counts = dict.fromkeys(self.names, 0)
+
+    def apply(self, days, miles, receipts, features: np.ndarray,
+              ensemble: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+        """
+        Predict many trips, each with its segment's model.
+
+        Args:
+            days, miles, receipts: Raw input arrays
+            features: Feature matrix of the same trips
+            ensemble: Called with a row mask, returns the full ensemble's
+                predictions for those rows
+
+        Returns:
+            Array of predictions
+        """
+        if self._route_ids is None:
+            self._route_ids = np.array([self.names.index(name) for name in self.routes])
+        route_ids = self._route_ids[segment_index(days, miles, receipts)]
+
+        predictions = np.empty(len(route_ids))
+        for i, name in enumerate(self.names):
+            rows = route_ids == i
+            n_rows = int(rows.sum())
+            if not n_rows:
+                continue
+            self.counts[name] += n_rows
+            if name == ENSEMBLE:
+                predictions[rows] = ensemble(rows)
+            else:
+                predictions[rows] = self.models[name].predict(features[rows])
+        return predictions
+
+    def apply_one(self, days: float, miles: float, receipts: float, row: List[float],
+                  ensemble: Callable[[], float]) -> float:
+        """Pure-Python ``apply`` for a single trip; ``ensemble`` takes no arguments."""
+        name = self.routes[segment_index_one(days, miles, receipts)]
+        self.counts[name] += 1
+        if name == ENSEMBLE:
+            return ensemble()
+        return self.models[name].predict_one(row)
+
+    def stats(self) -> dict:
+        """
+        Return how predictions were routed since loading.
+
+        Returns:
+            Dictionary with ``predictions``, per-route ``counts`` and
+            ``compute_saved``, the fraction of the full ensemble's compute
+            avoided per prediction on average
+        """
+        total = sum(self.counts.values())
+        spent = sum(count * self.costs[name] for name, count in self.counts.items())
+        saved = 1.0 - spent / (total * self.costs[ENSEMBLE]) if total else 0.0
+        return {'predictions': total, 'counts': dict(self.counts), 'compute_saved': saved}
+
+
+def _route_path(model_dir: str, name: str) -> str:
+    return os.path.join(model_dir, f'{ROUTE_PREFIX}{name}.bin')
+
+
+def fit_router(model_dir: str, features: np.ndarray, expected: np.ndarray,
+               tolerance: float = TOLERANCE,
+               min_cases: int = MIN_SEGMENT_CASES) -> ModelRouter:
+    """
+    Choose a model per segment from held-out cases and save the router.
+
+    Every ensemble member is compiled on its own (``route_<model>.bin``) and
+    timed. Per segment, the cheapest member whose MAE is within
+    ``tolerance`` of the full ensemble's is chosen. The router records the
+    hash of the pickles it was fitted on, so a retrain invalidates it.
+
+    Args:
+        model_dir: Directory written by ``ModelTrainer.save_models``
+        features: Feature matrix of cases the models were not trained on
+        expected: Their targets (the rules' residual for residual-mode models)
+        tolerance: Allowed relative MAE increase over the ensemble per segment
+        min_cases: Segments with fewer cases keep the ensemble
+
+    Returns:
+        The fitted ModelRouter (also written to ``router.json``)
+    """
+    from predict_reimbursement import load_models
+    from compiled_ensemble import save_compiled
+
+    models = load_models(model_dir, backend='sklearn', use_lookup_table=False,
+                         case_index='')
+    feature_names = models['feature_names']
+    weights = models.get('ensemble_weights') or {
+        name: None for name, model in models.items()
+        if hasattr(model, 'predict') and not name.endswith('_scaler') and name != 'rules'}
+    scalers = {name: model for name, model in models.items() if name.endswith('_scaler')}
+
+    candidates = {}
+    for name in weights:
+        save_compiled({name: models[name], **scalers, 'ensemble_weights': {name: 1.0}},
+                      feature_names, _route_path(model_dir, name))
+        candidates[name] = load_compiled(_route_path(model_dir, name))
+    candidates[ENSEMBLE] = load_compiled(os.path.join(model_dir, COMPILED_FILENAME))
+
+    # Fastest batch pass, per row
+    costs = {name: best_time(lambda model=model: model.predict(features)) / len(features)
+             for name, model in candidates.items()}
+    errors = {name: np.abs(model.predict(features) - expected)
+              for name, model in candidates.items()}
+    by_cost = sorted(candidates, key=costs.get)
+
+    raw = [feature_names.index(name) for name in RAW_FEATURES]
+    segments = segment_index(*features[:, raw].T)
+    n_segments = int(np.prod([len(edges) for edges in SEGMENT_EDGES.values()]))
+    routes, segment_report = [], []
+    for segment in range(n_segments):
+        rows = segments == segment
+        route = ENSEMBLE
+        if rows.sum() >= min_cases:
+            target = errors[ENSEMBLE][rows].mean() * (1 + tolerance)
+            route = next(name for name in by_cost if errors[name][rows].mean() <= target)
+        routes.append(route)
+        if rows.any():
+            segment_report.append({
+                'segment': segment_label(segment),
+                'cases': int(rows.sum()),
+                'model': route,
+                'mae': float(errors[route][rows].mean()),
+                'ensemble_mae': float(errors[ENSEMBLE][rows].mean()),
+            })
+
+    route_rows = np.array([by_cost.index(route) for route in routes])[segments]
+    routed_errors = np.stack([errors[name] for name in by_cost])[route_rows,
+                                                                 np.arange(len(segments))]
+    report = {
+        'cases': int(len(expected)),
+        'mae': float(routed_errors.mean()),
+        'ensemble_mae': float(errors[ENSEMBLE].mean()),
+        'compute_saved': float(1.0 - np.array([costs[name] for name in by_cost])[route_rows].mean()
+                               / costs[ENSEMBLE]),
+        'segments': segment_report,
+    }
+
+    # Members no segment uses don't need their artifact
+    for name in weights:
+        if name not in routes:
+            os.remove(_route_path(model_dir, name))
+            del candidates[name]
+
+    with open(os.path.join(model_dir, ROUTER_FILENAME), 'w') as f:
+        json.dump({'model_hash': model_artifact_hash(model_dir, MODEL_SUFFIXES),
+                   'segment_edges': SEGMENT_EDGES, 'routes': routes, 'costs': costs,
+                   'report': report}, f, indent=2)
+
+    return ModelRouter(routes, costs,
+                       {name: model for name, model in candidates.items() if name != ENSEMBLE},
+                       report)
+
+
+def load_router(model_dir: str) -> ModelRouter:
+    """
+    Read the ``router.json`` of a model directory and map its route artifacts.
+
+    Raises:
+        ValueError: If the router was fitted on other models than the ones
+            in ``model_dir``
+    """
+    with open(os.path.join(model_dir, ROUTER_FILENAME)) as f:
+        data = json.load(f)
+    if data.get('model_hash') != model_artifact_hash(model_dir, MODEL_SUFFIXES):
+        raise ValueError(f"{ROUTER_FILENAME} in {model_dir} was fitted on other models; "
+                         f"refit it with model_router.py fit")
+    models = {name: load_compiled(_route_path(model_dir, name))
+              for name in set(data['routes']) if name != ENSEMBLE}
+    return ModelRouter(data['routes'], data['costs'], models, data.get('report'))
+
+
+def print_router_report(report: dict):
+    """Print the per-segment accuracy and compute saving of a fitted router."""
+    print(f"{'Segment':45s} {'Cases':>5s}  {'Model':20s} {'MAE':>9s} {'Ensemble':>9s}")
+    for row in report['segments']:
+        print(f"{row['segment']:45s} {row['cases']:5d}  {row['model']:20s} "
+              f"${row['mae']:8.2f} ${row['ensemble_mae']:8.2f}")
+    print(f"\nHeld-out MAE: ${report['mae']:.2f} routed vs ${report['ensemble_mae']:.2f} "
+          f"ensemble on {report['cases']} cases")
+    print(f"Average compute saved per prediction: {report['compute_saved']:.1%}")
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python model_router.py fit [--model-dir models] [--tolerance 0.05]
+        python model_router.py report [--model-dir models]
+
+    ``fit`` scores the models on the hold-out split of ``public_cases.csv``
+    that ``train_models.py`` sets aside (for a registry root, the result is
+    published as a new version). Refit after every retrain or update.
+    """
+    from predict_reimbursement import MODEL_DIR
+    from model_registry import is_registry, resolve_model_dir, publish, _copy_files
+
+    parser = argparse.ArgumentParser(description="Per-segment model router")
+    parser.add_argument('command', choices=['fit', 'report'])
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--data', default='public_cases.csv')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--min-cases', type=int, default=MIN_SEGMENT_CASES)
+    args = parser.parse_args()
+
+    try:
+        model_dir = resolve_model_dir(args.model_dir)
+        if args.command == 'fit':
+            import contextlib
+            from train_models import ModelTrainer
+            from business_rules import RULES_FILENAME, load_rules
+
+            rules_path = os.path.join(model_dir, RULES_FILENAME)
+            use_rules = os.path.exists(rules_path) and load_rules(model_dir).mode == 'residual'
+            trainer = ModelTrainer(data_path=args.data, use_rules=use_rules)
+            with contextlib.redirect_stdout(sys.stderr):
+                _, X_test, _, y_test = trainer.load_and_prepare_data()
+
+            if is_registry(args.model_dir):
+                # Published versions are immutable
+                fitted = []
+                def write_artifacts(staging):
+                    _copy_files(model_dir, staging)
+                    for name in os.listdir(staging):
+                        if name == ROUTER_FILENAME or name.startswith(ROUTE_PREFIX):
+                            os.remove(os.path.join(staging, name))
+                    fitted.append(fit_router(staging, X_test, y_test, args.tolerance,
+                                             args.min_cases))
+                version = publish(args.model_dir, write_artifacts)
+                router = fitted[0]
+                print(f"✓ Published {model_dir} with {ROUTER_FILENAME} as {version}\n")
+            else:
+                router = fit_router(model_dir, X_test, y_test, args.tolerance, args.min_cases)
+                print(f"✓ Saved {ROUTER_FILENAME} to {model_dir}\n")
+        else:
+            router = load_router(model_dir)
+        print_router_report(router.report)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+import sys
+import os
+import json
+import time
+import hashlib
+import argparse
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Tuple
+
+from sklearn.model_selection import KFold
+from sklearn.metrics import mean_absolute_error
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from train_models import ModelTrainer
+
+
+# Candidate values per hyperparameter; every combination is one trial
+SEARCH_SPACE = {
+    'ridge': {'alpha': [0.01, 0.1, 1.0, 10.0, 100.0]},
+    'lasso': {'alpha': [0.01, 0.1, 1.0, 10.0]},
+    'decision_tree': {'max_depth': [5, 8, 10, 15, None], 'min_samples_leaf': [1, 5, 10]},
+    'random_forest': {'n_estimators': [100, 200], 'max_depth': [10, 15, None]},
+    'gradient_boosting': {'n_estimators': [100, 300], 'max_depth': [3, 5],
+                          'learning_rate': [0.05, 0.1]},
+    'neural_network': {'hidden_layer_sizes': [[100, 50, 25], [64, 32]],
+                       'alpha': [0.0001, 0.01]},
+}
+
+# A trial is pruned once its running mean fold MAE exceeds the best finished
+# trial of the same model by this factor
+PRUNE_RATIO = 1.5
+
+DEFAULT_CHECKPOINT = 'search_checkpoint.jsonl'
+
+
+def make_folds(n_samples: int, n_splits: int = 5,
+               random_state: int = 42) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Split sample indices into shuffled k-fold (train, validation) pairs.
+
+    The same folds are used for every candidate so their scores are
+    directly comparable.
+    """
+    splitter = KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    return list(splitter.split(np.arange(n_samples)))
+
+
+def iter_candidates(space: dict) -> Iterator[Tuple[str, dict]]:
+    """Yield (model name, params) for every grid point of every model."""
+    for name, grid in space.items():
+        keys = list(grid)
+        for values in itertools.product(*(grid[key] for key in keys)):
+            yield name, dict(zip(keys, values))
+
+
+def trial_key(name: str, params: dict) -> str:
+    """Stable identifier of a candidate, used to match checkpointed trials."""
+    return json.dumps([name, params], sort_keys=True)
+
+
+def evaluate_candidate(name: str, params: dict, X: np.ndarray, y: np.ndarray,
+                       folds: List[Tuple[np.ndarray, np.ndarray]], random_state: int = 42,
+                       best_mae: float = None, prune_ratio: float = PRUNE_RATIO) -> dict:
+    """
+    Cross-validate one candidate, stopping early if it can't compete.
+
+    Args:
+        name: Model name (key of ``train_models.MODEL_CLASSES``)
+        params: Hyperparameters to try, on top of ``DEFAULT_PARAMS[name]``
+        X, y: Training data
+        folds: Shared (train, validation) index pairs from ``make_folds``
+        random_state: Seed passed to the model
+        best_mae: Best finished mean MAE for this model so far, if any
+        prune_ratio: Prune once the running mean exceeds ``best_mae * prune_ratio``
+
+    Returns:
+        Trial record with the per-fold MAEs, their mean and a status of
+        'complete' or 'pruned'
+    """
+    trainer = ModelTrainer(random_state=random_state, n_jobs=1)
+    start_time = time.perf_counter()
+
+    fold_mae = []
+    status = 'complete'
+    for train_index, val_index in folds:
+        model = trainer.build_model(name, **params)
+        if name == 'neural_network':
+            # The MLP is trained on scaled inputs (see ModelTrainer.train_neural_network)
+            model = make_pipeline(StandardScaler(), model)
+        model.fit(X[train_index], y[train_index])
+        fold_mae.append(float(mean_absolute_error(y[val_index], model.predict(X[val_index]))))
+
+        if (best_mae is not None and len(fold_mae) < len(folds)
+                and np.mean(fold_mae) > best_mae * prune_ratio):
+            status = 'pruned'
+            break
+
+    return {
+        'model': name,
+        'params': params,
+        'fold_mae': fold_mae,
+        'mean_mae': float(np.mean(fold_mae)),
+        'status': status,
+        'seconds': time.perf_counter() - start_time,
+    }
+
+
+_WORKER_DATA = {}
+
+
+def _init_worker(X, y, folds, random_state):
+    """Worker-process initializer: receive the shared data and folds once."""
+    from threadpoolctl import threadpool_limits
+
+    _WORKER_DATA.update(X=X, y=y, folds=folds, random_state=random_state,
+                        # One core per worker; the pool provides the parallelism
+                        limits=threadpool_limits(1))
+
+
+def _evaluate_in_worker(name, params, best_mae, prune_ratio):
+    """Worker-process entry point for ``evaluate_candidate``."""
+    data = _WORKER_DATA
+    return evaluate_candidate(name, params, data['X'], data['y'], data['folds'],
+                              data['random_state'], best_mae, prune_ratio)
+
+
+def _search_config(X: np.ndarray, y: np.ndarray, n_splits: int, random_state: int) -> dict:
+    """Describe the data and folds a checkpoint is only valid for."""
+    digest = hashlib.sha256(np.ascontiguousarray(X, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=float).tobytes())
+    return {'n_samples': int(len(y)), 'n_splits': n_splits, 'random_state': random_state,
+            'data_hash': digest.hexdigest()}
+
+
+def load_checkpoint(path: str, config: dict) -> Dict[str, dict]:
+    """
+    Read finished trials from a checkpoint file.
+
+    Args:
+        path: JSON Lines checkpoint written by ``run_search``
+        config: Expected search configuration (see ``_search_config``)
+
+    Returns:
+        Trials keyed by ``trial_key`` (empty if the file doesn't exist)
+
+    Raises:
+        ValueError: If the checkpoint was written for other data or folds
+    """
+    trials = {}
+    try:
+        f = open(path)
+    except FileNotFoundError:
+        return trials
+
+    with f:
+        for line_number, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A partial last line from an interrupted write
+                continue
+            if line_number == 0:
+                if record.get('config') != config:
+                    raise ValueError(f"Checkpoint {path} was written for different data or "
+                                     f"folds; delete it to start a new search")
+                continue
+            trials[trial_key(record['model'], record['params'])] = record
+
+    return trials
+
+
+def _ends_with_newline(path: str) -> bool:
+    """Check whether a non-empty file's last byte is a newline."""
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def run_search(X: np.ndarray, y: np.ndarray, space: dict = None, n_splits: int = 5,
+               n_workers: int = None, checkpoint_path: str = None, random_state: int = 42,
+               prune_ratio: float = PRUNE_RATIO, params: dict = None) -> dict:
+    """
+    Grid-search every model's hyperparameters with shared k-fold CV.
+
+    Candidates are cross-validated in worker processes. Each finished trial
+    is appended to the checkpoint immediately, so rerunning after an
+    interruption only evaluates the candidates that are still missing.
+
+    Args:
+        X, y: Training data
+        space: Parameter grid per model (defaults to ``SEARCH_SPACE``)
+        n_splits: Number of folds
+        n_workers: Worker processes (defaults to one per core; 1 runs in-process)
+        checkpoint_path: JSON Lines file to record trials in and resume from
+        random_state: Seed for the folds and the models
+        prune_ratio: Early-stopping factor (see ``evaluate_candidate``)
+        params: Per-model overrides every candidate is layered on; trials are
+            scored and recorded with them merged in, so the best params are
+            the full configuration that was cross-validated
+
+    Returns:
+        Dictionary with every trial and the best params per model
+    """
+    space = space or SEARCH_SPACE
+    params = params or {}
+    folds = make_folds(len(y), n_splits, random_state)
+    config = _search_config(X, y, n_splits, random_state)
+
+    trials = load_checkpoint(checkpoint_path, config) if checkpoint_path else {}
+    candidates = [(name, {**params.get(name, {}), **candidate})
+                  for name, candidate in iter_candidates(space)]
+    pending = [(name, candidate) for name, candidate in candidates
+               if trial_key(name, candidate) not in trials]
+    print(f"Hyperparameter search: {len(trials) + len(pending)} candidates, {n_splits} folds "
+          f"({len(trials)} already in checkpoint)")
+
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = open(checkpoint_path, 'a')
+        if checkpoint.tell() == 0:
+            checkpoint.write(json.dumps({'config': config}) + '\n')
+        elif not _ends_with_newline(checkpoint_path):
+            # Terminate a partial line left by an interrupted write
+            checkpoint.write('\n')
+
+    def best_mae(name):
+        scores = [trial['mean_mae'] for trial in trials.values()
+                  if trial['model'] == name and trial['status'] == 'complete']
+        return min(scores) if scores else None
+
+    def record(trial):
+        trials[trial_key(trial['model'], trial['params'])] = trial
+        if checkpoint:
+            checkpoint.write(json.dumps(trial) + '\n')
+            checkpoint.flush()
+        print(f"  {trial['model']:18s} {json.dumps(trial['params']):55s} "
+              f"MAE ${trial['mean_mae']:8.2f}  {trial['status']}")
+
+    try:
+        n_workers = n_workers or os.cpu_count()
+        if n_workers == 1:
+            for name, candidate in pending:
+                record(evaluate_candidate(name, candidate, X, y, folds, random_state,
+                                          best_mae(name), prune_ratio))
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                     initargs=(X, y, folds, random_state)) as pool:
+                # Submit lazily so each trial is pruned against the latest best score
+                queue = iter(pending)
+                running = set()
+                while True:
+                    for name, candidate in itertools.islice(queue, n_workers - len(running)):
+                        running.add(pool.submit(_evaluate_in_worker, name, candidate,
+                                                best_mae(name), prune_ratio))
+                    if not running:
+                        break
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
+    finally:
+        if checkpoint:
+            checkpoint.close()
+
+    # Ignore checkpointed trials of candidates no longer searched (e.g. other base params)
+    searched = {trial_key(name, candidate) for name, candidate in candidates}
+    best_params = {}
+    for name in space:
+        finished = [trial for key, trial in trials.items()
+                    if trial['model'] == name and trial['status'] == 'complete'
+                    and key in searched]
+        if finished:
+            best_params[name] = min(finished, key=lambda trial: trial['mean_mae'])['params']
+
+    return {'trials': list(trials.values()), 'best_params': best_params}
+
+
+def print_search_summary(result: dict):
+    """Print the best trial per model and how many were pruned."""
+    print("\n--- Best Hyperparameters (CV MAE) ---")
+    for name, params in result['best_params'].items():
+        trials = [trial for trial in result['trials'] if trial['model'] == name]
+        best = min((trial for trial in trials if trial['status'] == 'complete'),
+                   key=lambda trial: trial['mean_mae'])
+        pruned = sum(trial['status'] == 'pruned' for trial in trials)
+        print(f"{name:18s} ${best['mean_mae']:8.2f}  {json.dumps(params)}  "
+              f"({len(trials)} trials, {pruned} pruned)")
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python model_search.py [--models ridge random_forest] [--folds 5] [--workers N]
+                               [--params base_params.json]
+                               [--checkpoint search_checkpoint.jsonl] [--output best_params.json]
+
+    Train with the result via ``python train_models.py --params best_params.json``.
+    """
+    parser = argparse.ArgumentParser(description="Cross-validated hyperparameter search")
+    parser.add_argument('--data', default='public_cases.csv', help="Training data")
+    parser.add_argument('--models', nargs='+', default=list(SEARCH_SPACE),
+                        choices=list(SEARCH_SPACE), help="Models to tune")
+    parser.add_argument('--folds', type=int, default=5, help="Cross-validation folds")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes (default: one per core)")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT,
+                        help="Trial log to resume from")
+    parser.add_argument('--prune-ratio', type=float, default=PRUNE_RATIO)
+    parser.add_argument('--params', default=None,
+                        help="JSON file of per-model hyperparameters to search on top of")
+    parser.add_argument('--output', default='best_params.json',
+                        help="Where to write the best params per model")
+    args = parser.parse_args()
+
+    params = {}
+    if args.params:
+        with open(args.params) as f:
+            params = json.load(f)
+
+    trainer = ModelTrainer(data_path=args.data)
+    X_train, _, y_train, _ = trainer.load_and_prepare_data()
+
+    try:
+        result = run_search(X_train, y_train, {name: SEARCH_SPACE[name] for name in args.models},
+                            n_splits=args.folds, n_workers=args.workers,
+                            checkpoint_path=args.checkpoint, random_state=trainer.random_state,
+                            prune_ratio=args.prune_ratio, params=params)
+    except ValueError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    print_search_summary(result)
+    with open(args.output, 'w') as f:
+        # Models that weren't searched keep their base params
+        json.dump({**params, **result['best_params']}, f, indent=2)
+    print(f"\n✓ Saved best params to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,69 @@
+from __future__ import annotations
+
 import sys
-import pickle
-import numpy as np
-from typing import Tuple
+import os
+import json
+import math
+import time
+import threading
+from typing import Tuple, List, Dict
+
+from lazy_imports import lazy_import
+from features import (FEATURE_NAMES, RAW_FEATURES, build_features, build_feature_row,
+                      check_feature_schema)
+from compiled_ensemble import COMPILED_FILENAME, load_compiled
+from lookup_table import TABLE_FILENAME, load_table
+from business_rules import RULES_FILENAME, load_rules
+from model_router import ROUTER_FILENAME, load_router
+from distillation import STUDENT_FILENAME
+from case_index import INDEX_FILENAME, build_index, load_index, load_cases, served_model_hash
+from prediction_cache import LRUCache, DiskCache, cache_namespace
+from model_registry import resolve_model_dir
+from instrumentation import span, profiled
+
+# Deferred until a batch or sklearn code path needs it: a single prediction
+# from the compiled artifact runs without NumPy
+np = lazy_import('numpy')
+
+
+# Directory holding the artifacts written by train_models.py, or a registry
+# root whose CURRENT version is used (see model_registry.py)
+MODEL_DIR = os.environ.get(
+    'REIMBURSEMENT_MODEL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+)
+
+# 'compiled' scores with the NumPy-only ensemble.bin, 'sklearn' with the
+# pickled models, 'auto' prefers ensemble.bin when it exists, 'student' uses
+# the distilled student.bin (see distillation.py)
+BACKEND = os.environ.get('REIMBURSEMENT_BACKEND', 'auto')
+
+# Answer in-grid trips from the precomputed lookup table (see lookup_table.py)
+USE_LOOKUP_TABLE = os.environ.get('REIMBURSEMENT_LOOKUP_TABLE') == '1'
+
+# Answer known trips from the case index (see case_index.py): '1' loads the
+# prebuilt case_index.npz, a comma-separated list of labeled case files
+# builds the index from them at startup (unset: off)
+CASE_INDEX = os.environ.get('REIMBURSEMENT_CASE_INDEX', '')
+
+# Models loaded once per process (see get_models):
+# model_dir -> (version directory, models)
+_MODEL_CACHE = {}
+# Held while a new model version loads
+_SWAP_LOCK = threading.Lock()
+# A version that fails to load is retried after this many seconds; the old
+# version keeps serving meanwhile
+SWAP_RETRY_SECONDS = float(os.environ.get('REIMBURSEMENT_SWAP_RETRY', 30.0))
+# model_dir -> (version directory that failed to load, monotonic time)
+_FAILED_SWAPS = {}
+
+# In-process LRU of recent predictions (REIMBURSEMENT_CACHE_SIZE=0 disables)
+CACHE_SIZE = int(os.environ.get('REIMBURSEMENT_CACHE_SIZE', 4096))
+_PREDICTION_CACHE = LRUCache(CACHE_SIZE)
+
+# Optional SQLite file shared by every process (off unless set)
+CACHE_DB = os.environ.get('REIMBURSEMENT_CACHE_DB')
+_DISK_CACHES = {}
 
 
 def validate_inputs(trip_duration_days: float, miles_traveled: float, 
@@ -23,6 +85,14 @@ def validate_inputs(trip_duration_days: float, miles_traveled: float,
         miles = float(miles_traveled)
         receipts = float(total_receipts_amount)
         
+        # NaN and infinity pass the sign checks below but break batch scoring
+        if not math.isfinite(trip_days):
+            return False, "Trip duration must be a finite number"
+        if not math.isfinite(miles):
+            return False, "Miles traveled must be a finite number"
+        if not math.isfinite(receipts):
+            return False, "Receipt amount must be a finite number"
+        
         # Check for negative values
         if trip_days < 0:
             return False, "Trip duration cannot be negative"
@@ -38,68 +108,241 @@ def validate_inputs(trip_duration_days: float, miles_traveled: float,
 
 
 def preprocess_features(trip_duration_days: float, miles_traveled: float,
-                       total_receipts_amount: float) -> np.ndarray:
+                       total_receipts_amount: float, feature_names: List[str] = None) -> np.ndarray:
     """
     Preprocess input features into model-ready format.
     
-    This should match the feature engineering from the EDA phase.
+    Uses the shared pipeline in ``features.py``, so this always matches the
+    feature engineering done at training time.
     
     Args:
         trip_duration_days: Number of days spent traveling
         miles_traveled: Total miles traveled  
         total_receipts_amount: Total dollar amount of receipts
+        feature_names: Feature columns the models were trained on
+            (defaults to ``features.FEATURE_NAMES``)
     
     Returns:
         Numpy array of features ready for prediction
     """
-    # Basic features
-    features = [
-        trip_duration_days,
-        miles_traveled,
-        total_receipts_amount
-    ]
+    return build_features(trip_duration_days, miles_traveled, total_receipts_amount,
+                          feature_names)
+
+
+def preprocess_batch(trip_duration_days: np.ndarray, miles_traveled: np.ndarray,
+                     total_receipts_amount: np.ndarray, feature_names: List[str] = None) -> np.ndarray:
+    """
+    Preprocess many trips at once into a model-ready feature matrix.
     
-    # TODO: Add derived features that improve model performance
-    # Examples from project requirements:
-    # - cost_per_mile = total_receipts_amount / miles_traveled (if miles > 0)
-    # - cost_per_day = total_receipts_amount / trip_duration_days (if days > 0)
-    # - Interaction terms
-    # - Polynomial features
+    Args:
+        trip_duration_days: Array of trip durations
+        miles_traveled: Array of miles traveled
+        total_receipts_amount: Array of receipt totals
+        feature_names: Feature columns the models were trained on
+            (defaults to ``features.FEATURE_NAMES``)
     
-    return np.array(features).reshape(1, -1)
+    Returns:
+        Numpy array of shape (n_trips, n_features), one row per trip in the
+        same layout as ``preprocess_features``
+    """
+    return build_features(trip_duration_days, miles_traveled, total_receipts_amount,
+                          feature_names)
 
 
-def load_models():
+def load_models(model_dir: str = None, backend: str = None,
+                use_lookup_table: bool = None, case_index: str = None):
     """
     Load trained models from pickle files.
     
+    With the compiled backend, ``ensemble.bin`` is loaded under ``compiled``
+    and sklearn is never imported. Otherwise every ``*.pkl`` in the model
+    directory is loaded under its file name (e.g. ``random_forest``,
+    ``nn_scaler``) and ``ensemble_weights.json`` under ``ensemble_weights``.
+    ``feature_names.json`` is loaded under ``feature_names`` and the models
+    are checked against it, so a mismatched artifact set fails here instead
+    of producing bad predictions. ``rules.json`` (see business_rules.py) is
+    loaded under ``rules``; it is part of the model, since a residual-mode
+    ensemble is meaningless without it. A fitted ``router.json`` (see
+    model_router.py) is loaded under ``router``. The student backend loads
+    the distilled ``student.bin`` (see distillation.py) under ``compiled``
+    and skips the router, whose routes are ensemble members. When enabled
+    and built, the lookup table is loaded under ``lookup_table``, and the
+    case index (see case_index.py) under ``case_index``.
+    
+    Args:
+        model_dir: Directory written by ``ModelTrainer.save_models``, or a
+            registry root (defaults to ``MODEL_DIR``)
+        backend: 'auto', 'compiled', 'sklearn' or 'student'
+            (defaults to ``BACKEND``)
+        use_lookup_table: Load ``lookup_table.npy`` if present
+            (defaults to ``USE_LOOKUP_TABLE``)
+        case_index: '1' for ``case_index.npz`` if present, labeled case
+            files to index, or '' for none (defaults to ``CASE_INDEX``)
+    
     Returns:
         Dictionary of loaded models
     """
-    models = {}
-    
     try:
-        # TODO: Load your trained models
-        # Example:
-        # with open('models/linear_regression.pkl', 'rb') as f:
-        #     models['linear'] = pickle.load(f)
-        # with open('models/decision_tree.pkl', 'rb') as f:
-        #     models['tree'] = pickle.load(f)
-        # with open('models/neural_network.pkl', 'rb') as f:
-        #     models['nn'] = pickle.load(f)
-        
-        pass
-    
+        with span('predict.load_models'):
+            return _load_models(resolve_model_dir(model_dir or MODEL_DIR), backend or BACKEND,
+                                USE_LOOKUP_TABLE if use_lookup_table is None else use_lookup_table,
+                                CASE_INDEX if case_index is None else case_index)
     except FileNotFoundError as e:
         print(f"Error: Model file not found - {str(e)}", file=sys.stderr)
         sys.exit(1)
     except Exception as e:
         print(f"Error loading models: {str(e)}", file=sys.stderr)
         sys.exit(1)
+
+
+def _load_models(model_dir: str, backend: str, use_lookup_table: bool,
+                 case_index: str = '') -> dict:
+    """Body of ``load_models`` with the defaults resolved; raises instead of exiting."""
+    models = {}
+    
+    names_path = os.path.join(model_dir, 'feature_names.json')
+    if os.path.exists(names_path):
+        with open(names_path) as f:
+            feature_names = json.load(f)
+    else:
+        feature_names = FEATURE_NAMES
+    
+    compiled_name = STUDENT_FILENAME if backend == 'student' else COMPILED_FILENAME
+    compiled_path = os.path.join(model_dir, compiled_name)
+    if (backend in ('compiled', 'student')
+            or (backend == 'auto' and os.path.exists(compiled_path))):
+        compiled = load_compiled(compiled_path)
+        if compiled.feature_names != list(feature_names):
+            raise ValueError(f"{compiled_name} was compiled for features "
+                             f"{compiled.feature_names}, not {list(feature_names)}")
+        models['compiled'] = compiled
+    else:
+        # Unpickling imports sklearn, so only pay for these when needed
+        import glob
+        import pickle
+        
+        pickle_paths = sorted(glob.glob(os.path.join(model_dir, '*.pkl')))
+        if not pickle_paths:
+            raise FileNotFoundError(f"no *.pkl files in {model_dir}")
+        
+        for path in pickle_paths:
+            name = os.path.splitext(os.path.basename(path))[0]
+            with open(path, 'rb') as f:
+                models[name] = pickle.load(f)
+        
+        weights_path = os.path.join(model_dir, 'ensemble_weights.json')
+        if os.path.exists(weights_path):
+            with open(weights_path) as f:
+                models['ensemble_weights'] = json.load(f)
+        
+        check_feature_schema(feature_names, models)
+    
+    models['feature_names'] = feature_names
+    
+    if os.path.exists(os.path.join(model_dir, RULES_FILENAME)):
+        models['rules'] = load_rules(model_dir)
+    
+    if backend != 'student' and os.path.exists(os.path.join(model_dir, ROUTER_FILENAME)):
+        models['router'] = load_router(model_dir)
+    
+    if use_lookup_table and os.path.exists(os.path.join(model_dir, TABLE_FILENAME)):
+        models['lookup_table'] = load_table(model_dir)
+    
+    if case_index:
+        index = _load_case_index(model_dir, models, backend, case_index)
+        if index is not None:
+            models['case_index'] = index
     
     return models
 
 
+def _load_case_index(model_dir: str, models: dict, backend: str, setting: str):
+    """Load or build the case index, with residuals of the model being served."""
+    source = 'student' if backend == 'student' else 'ensemble'
+    model_hash = served_model_hash(model_dir, source)
+    predict = lambda days, miles, receipts: ensemble_predict_batch(
+        models, preprocess_batch(days, miles, receipts, models['feature_names']))
+    
+    if setting != '1':
+        return build_index(predict, *load_cases(setting.split(',')), source, model_hash)
+    if not os.path.exists(os.path.join(model_dir, INDEX_FILENAME)):
+        return None
+    index = load_index(model_dir)
+    if index.source != source or index.model_hash != model_hash:
+        # Prebuilt against the other backend or older models; its residuals don't apply here
+        index = build_index(predict, index.days, index.miles, index.receipts, index.expected,
+                            source, model_hash)
+    return index
+
+
+def get_models(model_dir: str = None):
+    """
+    Return the models for ``model_dir``, loading them on first use only.
+    
+    For a registry root, a new ``CURRENT`` version is picked up within
+    ``model_registry.POLL_SECONDS`` (see ``_active_models``).
+    
+    Args:
+        model_dir: Model directory or registry root (defaults to ``MODEL_DIR``)
+    
+    Returns:
+        Dictionary of loaded models, shared for the lifetime of the process
+    """
+    return _active_models(model_dir)[1]
+
+
+def served_model_dir(model_dir: str = None) -> str:
+    """Return the directory (registry version) whose models are being served."""
+    return _active_models(model_dir)[0]
+
+
+def _active_models(model_dir: str = None) -> Tuple[str, dict]:
+    """
+    Return (version directory, models) currently served for ``model_dir``.
+    
+    When the registry pointer moves, one thread loads the new version while
+    the others keep answering from the old one, so traffic never waits for
+    the swap. A version that fails to load is logged and skipped for
+    ``SWAP_RETRY_SECONDS``; the old one keeps serving. The first load of a
+    directory does block its callers, and exits on failure.
+    """
+    model_dir = model_dir or MODEL_DIR
+    target = resolve_model_dir(model_dir)
+    active = _MODEL_CACHE.get(model_dir)
+    if active is not None and active[0] == target:
+        return active
+    
+    failed = _FAILED_SWAPS.get(model_dir)
+    if (active is not None and failed is not None and failed[0] == target
+            and time.monotonic() - failed[1] < SWAP_RETRY_SECONDS):
+        # This version failed to load recently; keep serving the old one
+        return active
+    
+    if not _SWAP_LOCK.acquire(blocking=active is None):
+        # Another thread is loading the new version
+        return active
+    try:
+        active = _MODEL_CACHE.get(model_dir)
+        if active is None:
+            active = (target, load_models(target))
+            _MODEL_CACHE[model_dir] = active
+        elif active[0] != target:
+            try:
+                with span('predict.load_models'):
+                    models = _load_models(target, BACKEND, USE_LOOKUP_TABLE, CASE_INDEX)
+            except Exception as e:
+                print(f"Error loading models from {target}: {str(e)}; still serving "
+                      f"{active[0]}, retrying in {SWAP_RETRY_SECONDS:g}s", file=sys.stderr)
+                _FAILED_SWAPS[model_dir] = (target, time.monotonic())
+                return active
+            _FAILED_SWAPS.pop(model_dir, None)
+            active = (target, models)
+            _MODEL_CACHE[model_dir] = active
+        return active
+    finally:
+        _SWAP_LOCK.release()
+
+
 def ensemble_predict(models: dict, features: np.ndarray) -> float:
     """
     Make prediction using ensemble of models.
@@ -111,36 +354,95 @@ def ensemble_predict(models: dict, features: np.ndarray) -> float:
     Returns:
         Final prediction as float
     """
-    predictions = []
-    
-    # TODO: Implement ensemble logic
-    # Options:
-    # 1. Simple averaging
-    # 2. Weighted averaging (based on model performance)
-    # 3. Stacking
-    # 4. Voting
-    # 5. Model selection based on input characteristics
-    
-    # Example simple ensemble:
-    # if 'linear' in models:
-    #     predictions.append(models['linear'].predict(features)[0])
-    # if 'tree' in models:
-    #     predictions.append(models['tree'].predict(features)[0])
-    # if 'nn' in models:
-    #     predictions.append(models['nn'].predict(features)[0])
-    
-    # if predictions:
-    #     final_prediction = np.mean(predictions)
-    # else:
-    #     # Fallback prediction logic
-    #     final_prediction = 0.0
-    
-    # TODO: Replace this placeholder with actual ensemble logic
-    final_prediction = 0.0
+    return float(ensemble_predict_batch(models, features)[0])
+
+
+def ensemble_predict_batch(models: dict, features: np.ndarray) -> np.ndarray:
+    """
+    Make predictions for a whole feature matrix, calling each model once.
+    
+    Args:
+        models: Dictionary of trained models
+        features: Feature matrix of shape (n_trips, n_features)
+    
+    Returns:
+        Array of n_trips predictions
+    """
+    if 'case_index' in models:
+        return _predict_with_index(models, features)
+    
+    if 'lookup_table' in models:
+        return _predict_with_table(models, features)
+    
+    if 'rules' in models:
+        return _predict_with_rules(models, features)
+    
+    if 'router' in models:
+        return _predict_with_router(models, features)
+    
+    if 'compiled' in models:
+        with span('predict.model.compiled'):
+            return models['compiled'].predict(features)
+    
+    # Weighted sum using the weights from create_ensemble() (R²-based or stacked);
+    # fall back to a simple average if the weights file is missing
+    weights = models.get('ensemble_weights')
+    if weights is None:
+        names = [name for name, model in models.items()
+                 if hasattr(model, 'predict') and not name.endswith('_scaler')]
+        weights = {name: 1.0 / len(names) for name in names}
+    
+    final_prediction = np.zeros(features.shape[0])
+    for name, weight in weights.items():
+        model = models[name]
+        with span(f'predict.model.{name}'):
+            if name == 'neural_network':
+                prediction = model.predict(models['nn_scaler'].transform(features))
+            else:
+                prediction = model.predict(features)
+        with span('predict.combine'):
+            final_prediction += weight * prediction
     
     return final_prediction
 
 
+def _predict_with_index(models: dict, features: np.ndarray) -> np.ndarray:
+    """Answer known trips exactly, the rest corrected by their neighbours (see CaseIndex.apply)."""
+    columns = [models['feature_names'].index(name) for name in RAW_FEATURES]
+    ensemble = {name: model for name, model in models.items() if name != 'case_index'}
+    with span('predict.case_index'):
+        return models['case_index'].apply(
+            *features[:, columns].T, lambda rows: ensemble_predict_batch(ensemble, features[rows]))
+
+
+def _predict_with_table(models: dict, features: np.ndarray) -> np.ndarray:
+    """Answer in-grid trips from the lookup table and the rest from the ensemble."""
+    columns = [models['feature_names'].index(name) for name in RAW_FEATURES]
+    predictions, in_range = models['lookup_table'].predict(*features[:, columns].T)
+    
+    if not in_range.all():
+        ensemble = {name: model for name, model in models.items() if name != 'lookup_table'}
+        predictions[~in_range] = ensemble_predict_batch(ensemble, features[~in_range])
+    
+    return predictions
+
+
+def _predict_with_rules(models: dict, features: np.ndarray) -> np.ndarray:
+    """Combine the closed-form business rules with the ensemble (see RuleEngine.apply)."""
+    columns = [models['feature_names'].index(name) for name in RAW_FEATURES]
+    ensemble = {name: model for name, model in models.items() if name != 'rules'}
+    return models['rules'].apply(*features[:, columns].T,
+                                 lambda rows: ensemble_predict_batch(ensemble, features[rows]))
+
+
+def _predict_with_router(models: dict, features: np.ndarray) -> np.ndarray:
+    """Answer each trip with its segment's model (see ModelRouter.apply)."""
+    columns = [models['feature_names'].index(name) for name in RAW_FEATURES]
+    ensemble = {name: model for name, model in models.items() if name != 'router'}
+    return models['router'].apply(*features[:, columns].T, features,
+                                  lambda rows: ensemble_predict_batch(ensemble, features[rows]))
+
+
 def predict_reimbursement(trip_duration_days: float, miles_traveled: float,
                          total_receipts_amount: float) -> float:
     """
@@ -155,24 +457,204 @@ def predict_reimbursement(trip_duration_days: float, miles_traveled: float,
         Predicted reimbursement amount rounded to 2 decimal places
     """
     # Validate inputs
-    is_valid, error_msg = validate_inputs(trip_duration_days, miles_traveled, 
-                                         total_receipts_amount)
+    with span('predict.validate'):
+        is_valid, error_msg = validate_inputs(trip_duration_days, miles_traveled, 
+                                             total_receipts_amount)
     if not is_valid:
         print(f"Error: {error_msg}", file=sys.stderr)
         sys.exit(1)
     
-    # Preprocess features
-    features = preprocess_features(trip_duration_days, miles_traveled, 
-                                  total_receipts_amount)
+    # Repeated trips skip feature engineering and the ensemble entirely.
+    # Entries are keyed by model version, so a hot swap never serves stale ones
+    model_dir = resolve_model_dir(MODEL_DIR)
+    key = (float(trip_duration_days), float(miles_traveled), float(total_receipts_amount))
+    cached = _PREDICTION_CACHE.get((model_dir, *key))
+    if cached is not None:
+        return cached
+    
+    disk_cache = _get_disk_cache(model_dir)
+    if disk_cache is not None:
+        cached = disk_cache.get(key)
+        if cached is not None:
+            _PREDICTION_CACHE.put((model_dir, *key), cached)
+            return cached
     
-    # Load models (in production, this would be done once at startup)
-    models = load_models()
+    # Load models (cached, so this only hits disk on the first call)
+    served_dir, models = _active_models(MODEL_DIR)
     
-    # Make prediction
-    prediction = ensemble_predict(models, features)
+    if 'compiled' in models and 'lookup_table' not in models:
+        # Pure-Python fast path: no NumPy import for a one-off prediction
+        with span('predict.features'):
+            row = build_feature_row(trip_duration_days, miles_traveled,
+                                    total_receipts_amount, models['feature_names'])
+        trip = (trip_duration_days, miles_traveled, total_receipts_amount)
+        
+        def ensemble():
+            with span('predict.model.compiled'):
+                return models['compiled'].predict_one(row)
+        
+        if 'router' in models:
+            full_ensemble = ensemble
+            ensemble = lambda: models['router'].apply_one(*trip, row, full_ensemble)
+        if 'rules' in models:
+            ruled_ensemble = ensemble
+            ensemble = lambda: models['rules'].apply_one(*trip, ruled_ensemble)
+        if 'case_index' in models:
+            prediction = models['case_index'].apply_one(*trip, ensemble)
+        else:
+            prediction = ensemble()
+    else:
+        # Preprocess features
+        with span('predict.features'):
+            features = preprocess_features(trip_duration_days, miles_traveled, 
+                                          total_receipts_amount, models['feature_names'])
+        
+        # Make prediction
+        prediction = ensemble_predict(models, features)
     
     # Round to 2 decimal places as required
-    return round(prediction, 2)
+    result = round(prediction, 2)
+    
+    # Mid-swap, the previous version answered; don't file it under the new one
+    if served_dir == model_dir:
+        _PREDICTION_CACHE.put((model_dir, *key), result)
+        if disk_cache is not None:
+            disk_cache.put(key, result)
+    
+    return result
+
+
+def _get_disk_cache(model_dir: str):
+    """Return the shared on-disk cache for ``model_dir`` (None unless CACHE_DB is set)."""
+    if not CACHE_DB:
+        return None
+    if model_dir not in _DISK_CACHES:
+        _DISK_CACHES[model_dir] = DiskCache(CACHE_DB, cache_namespace(model_dir, serving_config()))
+    return _DISK_CACHES[model_dir]
+
+
+def serving_config() -> dict:
+    """Settings besides the model artifacts that change this process's predictions."""
+    config = {'backend': BACKEND, 'lookup_table': USE_LOOKUP_TABLE, 'case_index': CASE_INDEX}
+    if CASE_INDEX and CASE_INDEX != '1':
+        from dataset_cache import source_hash
+        
+        # An index built at startup answers from the case files' contents
+        config['case_files'] = [source_hash(path) for path in CASE_INDEX.split(',')]
+    return config
+
+
+def cache_stats() -> dict:
+    """
+    Return hit/miss counters of the prediction caches.
+    
+    Returns:
+        Dictionary with ``memory`` (LRU) and, when enabled, ``disk`` statistics
+    """
+    stats = {'memory': _PREDICTION_CACHE.stats()}
+    model_dir = resolve_model_dir(MODEL_DIR)
+    if CACHE_DB and model_dir in _DISK_CACHES:
+        stats['disk'] = _DISK_CACHES[model_dir].stats()
+    return stats
+
+
+def load_trips(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Read trips from a JSON or CSV file into input arrays.
+    
+    JSON files may hold a list of flat trip objects (``private_cases.json``)
+    or of ``{"input": {...}}`` cases (``public_cases.json``). CSV columns may
+    be named with or without the ``input/`` prefix (``public_cases.csv``).
+    The file is parsed once; later calls memory-map its cached columns
+    (see dataset_cache.py).
+    
+    Args:
+        path: Path to a ``.json`` or ``.csv`` file
+    
+    Returns:
+        Tuple of (trip_duration_days, miles_traveled, total_receipts_amount) arrays
+    """
+    # Not needed by single predictions, so kept off the startup path
+    from dataset_cache import INPUT_COLUMNS, load_columns
+    
+    columns = load_columns(path)
+    return tuple(columns[name] for name in INPUT_COLUMNS)
+
+
+def predict_batch(trips: List[Dict[str, float]]) -> np.ndarray:
+    """
+    Vectorized prediction for many trips.
+    
+    Builds one feature matrix and runs each model's ``predict`` once over it,
+    instead of one ensemble call per trip.
+    
+    Args:
+        trips: List of dicts with ``trip_duration_days``, ``miles_traveled``
+            and ``total_receipts_amount``
+    
+    Returns:
+        Array of predicted reimbursements rounded to 2 decimal places
+    
+    Raises:
+        ValueError: If any trip has a missing, non-numeric or negative input
+    """
+    names = ['trip_duration_days', 'miles_traveled', 'total_receipts_amount']
+    try:
+        columns = np.array([[trip[name] for name in names] for trip in trips],
+                           dtype=float).reshape(-1, 3)
+    except (KeyError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid input type: {str(e)}")
+    
+    return _predict_arrays(columns[:, 0], columns[:, 1], columns[:, 2])
+
+
+def _predict_arrays(trip_duration_days: np.ndarray, miles_traveled: np.ndarray,
+                    total_receipts_amount: np.ndarray, model_dir: str = None) -> np.ndarray:
+    """Validate, preprocess and score input arrays in one pass (models from ``get_models``)."""
+    for name, values in zip(['Trip duration', 'Miles traveled', 'Receipt amount'],
+                            [trip_duration_days, miles_traveled, total_receipts_amount]):
+        bad = np.flatnonzero(~((values >= 0) & np.isfinite(values)))
+        if bad.size:
+            raise ValueError(f"{name} must be a finite non-negative number (trip {bad[0]})")
+    
+    if len(trip_duration_days) == 0:
+        return np.zeros(0)
+    
+    models = get_models(model_dir)
+    with span('predict.features'):
+        features = preprocess_batch(trip_duration_days, miles_traveled, total_receipts_amount,
+                                    models['feature_names'])
+    predictions = ensemble_predict_batch(models, features)
+    
+    return np.round(predictions, 2)
+
+
+def run_batch(path: str, out=sys.stdout):
+    """
+    Score every trip in ``path``, writing one prediction per line.
+    
+    Throughput is reported on stderr so stdout stays machine-readable.
+    
+    Args:
+        path: JSON or CSV file of trips (see ``load_trips``)
+        out: Stream the predictions are written to
+    """
+    start_time = time.perf_counter()
+    
+    days, miles, receipts = load_trips(path)
+    get_models()
+    load_time = time.perf_counter() - start_time
+    
+    predictions = _predict_arrays(days, miles, receipts)
+    out.write(''.join(f"{prediction}\n" for prediction in predictions.tolist()))
+    out.flush()
+    
+    total_time = time.perf_counter() - start_time
+    score_time = total_time - load_time
+    print(f"Scored {len(predictions)} trips in {total_time:.3f}s "
+          f"(load {load_time:.3f}s, predict {score_time:.3f}s, "
+          f"{len(predictions) / max(score_time, 1e-9):,.0f} trips/second)",
+          file=sys.stderr)
 
 
 def main():
@@ -182,13 +664,26 @@ def main():
     Usage:
         python predict_reimbursement.py <trip_duration_days> <miles_traveled> <total_receipts_amount>
     
+        python predict_reimbursement.py --batch <trips.json|trips.csv>
+    
     Example:
         python predict_reimbursement.py 5 250 450.50
+        python predict_reimbursement.py --batch private_cases.json
     """
+    if len(sys.argv) == 3 and sys.argv[1] == '--batch':
+        try:
+            run_batch(sys.argv[2])
+        except Exception as e:
+            print(f"Error: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        return
+    
     if len(sys.argv) != 4:
         print("Usage: python predict_reimbursement.py <trip_duration_days> <miles_traveled> <total_receipts_amount>")
+        print("       python predict_reimbursement.py --batch <trips.json|trips.csv>")
         print("\nExample:")
         print("  python predict_reimbursement.py 5 250 450.50")
+        print("  python predict_reimbursement.py --batch private_cases.json")
         sys.exit(1)
     
     try:
@@ -211,4 +706,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with profiled('predict'):
+        main()
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+
+# Files that determine what a model directory predicts
+ARTIFACT_SUFFIXES = ('.pkl', '.bin', '.json', '.npy', '.npz')
+# Files holding the trained models themselves; artifacts derived from them
+# (router, lookup table, case index) record these files' hash
+MODEL_SUFFIXES = ('.pkl', 'ensemble_weights.json')
+
+# Disk cache bounds: entries beyond DISK_MAX_ENTRIES or older than
+# DISK_MAX_AGE seconds are evicted, oldest first
+DISK_MAX_ENTRIES = int(os.environ.get('REIMBURSEMENT_CACHE_DB_ENTRIES', 1_000_000))
+DISK_MAX_AGE = float(os.environ.get('REIMBURSEMENT_CACHE_DB_AGE', 30 * 24 * 3600))
+
+# Writes between evictions
+EVICT_EVERY = 1000
+
+
+class LRUCache:
+    """Bounded in-process LRU cache with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 4096):
+        """
+        Args:
+            maxsize: Maximum number of entries (0 disables caching)
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # The prediction server calls in from several threads
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[float]:
+        """Return the cached value (marking it recently used), or None."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: float):
+        """Store a value, evicting the least recently used entry if full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Return size and hit/miss counters."""
+        return {'size': len(self._entries), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
+
+
+class DiskCache:
+    """
+    SQLite-backed prediction cache shared by every process on the machine.
+
+    Entries are tagged with a hash of the model artifacts and the serving
+    configuration (see ``cache_namespace``), so a retrain or a process with
+    another backend never reads them. Entries of every namespace share the
+    file and are evicted by age and count, so processes serving different
+    versions don't wipe each other's entries.
+    """
+
+    def __init__(self, path: str, model_hash: str, max_entries: int = DISK_MAX_ENTRIES,
+                 max_age: float = DISK_MAX_AGE):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+            model_hash: Namespace of the entries (see ``cache_namespace``)
+            max_entries: Most entries kept in the file, across namespaces
+            max_age: Seconds an entry is kept
+        """
+        import sqlite3
+
+        self.path = path
+        self.model_hash = model_hash
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS predictions ('
+            ' model_hash TEXT, trip_duration_days REAL, miles_traveled REAL,'
+            ' total_receipts_amount REAL, prediction REAL,'
+            ' PRIMARY KEY (model_hash, trip_duration_days, miles_traveled, total_receipts_amount))'
+        )
+        columns = [row[1] for row in self._connection.execute('PRAGMA table_info(predictions)')]
+        if 'created' not in columns:
+            # Files written before eviction; their entries count as oldest
+            self._connection.execute('ALTER TABLE predictions ADD COLUMN created REAL DEFAULT 0')
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS predictions_created ON predictions (created)')
+        self.evict()
+
+    def get(self, key: Tuple[float, float, float]) -> Optional[float]:
+        """Return the cached prediction for (days, miles, receipts), or None."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT prediction FROM predictions WHERE model_hash = ? AND trip_duration_days = ?'
+                ' AND miles_traveled = ? AND total_receipts_amount = ?',
+                (self.model_hash, *key)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: Tuple[float, float, float], value: float):
+        """Store the prediction for (days, miles, receipts)."""
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)',
+                (self.model_hash, *key, value, time.time()))
+            self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Delete entries older than ``max_age``, then the oldest beyond ``max_entries``."""
+        with self._lock:
+            self._connection.execute('DELETE FROM predictions WHERE created < ?',
+                                     (time.time() - self.max_age,))
+            excess = self._connection.execute(
+                'SELECT COUNT(*) FROM predictions').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._connection.execute(
+                    'DELETE FROM predictions WHERE rowid IN'
+                    ' (SELECT rowid FROM predictions ORDER BY created LIMIT ?)', (excess,))
+
+    def stats(self) -> dict:
+        """Return hit/miss counters."""
+        return {'path': self.path, 'model_hash': self.model_hash,
+                'hits': self.hits, 'misses': self.misses}
+
+
+def cache_namespace(model_dir: str, config: dict) -> str:
+    """
+    Hash the model artifacts together with the serving configuration.
+
+    Args:
+        model_dir: Directory written by ``ModelTrainer.save_models``
+        config: JSON-serializable settings that change what is served
+            (backend, lookup table, case index)
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256(model_artifact_hash(model_dir).encode())
+    digest.update(json.dumps(config, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def model_artifact_hash(model_dir: str, suffixes: Tuple[str, ...] = ARTIFACT_SUFFIXES) -> str:
+    """
+    Hash the contents of every model artifact in a directory.
+
+    Args:
+        model_dir: Directory written by ``ModelTrainer.save_models``
+        suffixes: Hash only the files whose names end with one of these
+            (``MODEL_SUFFIXES`` for just the trained models)
+
+    Returns:
+        Hex SHA-256 digest over the artifact names and contents
+    """
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(model_dir)):
+        if not name.endswith(suffixes):
+            continue
+        digest.update(name.encode())
+        with open(os.path.join(model_dir, name), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,160 @@
+import sys
+import os
+import json
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from predict_reimbursement import (validate_inputs, get_models, served_model_dir,
+                                   predict_reimbursement, cache_stats)
+from instrumentation import to_prometheus
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = int(os.environ.get('REIMBURSEMENT_PORT', 8765))
+
+INPUT_NAMES = ['trip_duration_days', 'miles_traveled', 'total_receipts_amount']
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler answering reimbursement predictions from preloaded models.
+
+    Endpoints:
+        GET /health
+            Returns ``ok`` once the models are loaded.
+        GET /stats
+            Returns the prediction cache hit/miss counters as JSON, the case
+            index's hit rate and lookup latency when one is served, and the
+            worker pool's counters when serving from one.
+        GET /model
+            Returns the model directory being served as JSON; with a model
+            registry this changes as soon as a new version is promoted.
+            Includes the router's routing counts when one is fitted.
+        GET /metrics
+            Returns the span timings (see instrumentation.py) in the
+            Prometheus text format; empty unless REIMBURSEMENT_METRICS=1.
+        GET /predict?trip_duration_days=5&miles_traveled=250&total_receipts_amount=450.50
+            Returns the predicted reimbursement as a single number.
+    """
+
+    # PredictionPool answering /predict (None: predict in the handler thread)
+    pool = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+
+        if url.path == '/health':
+            self._reply(200, 'ok')
+        elif url.path == '/stats':
+            stats = cache_stats()
+            # Counted where predictions run: in the workers when serving from a pool
+            index = get_models().get('case_index')
+            if index is not None and self.pool is None:
+                stats['case_index'] = index.stats()
+            if self.pool is not None:
+                stats['pool'] = self.pool.stats()
+            self._reply(200, json.dumps(stats), 'application/json')
+        elif url.path == '/model':
+            model_dir = served_model_dir()
+            info = {'model_dir': model_dir, 'version': os.path.basename(model_dir)}
+            router = get_models().get('router')
+            if router is not None:
+                info['router'] = router.stats()
+            self._reply(200, json.dumps(info), 'application/json')
+        elif url.path == '/metrics':
+            self._reply(200, to_prometheus(), 'text/plain; version=0.0.4')
+        elif url.path == '/predict':
+            self._predict(parse_qs(url.query))
+        else:
+            self._reply(404, f"Unknown endpoint: {url.path}")
+
+    def _predict(self, query: dict):
+        """Validate the query parameters and reply with a prediction."""
+        missing = [name for name in INPUT_NAMES if name not in query]
+        if missing:
+            self._reply(400, f"Missing parameters: {', '.join(missing)}")
+            return
+
+        values = [query[name][0] for name in INPUT_NAMES]
+        is_valid, error_msg = validate_inputs(*values)
+        if not is_valid:
+            self._reply(400, error_msg)
+            return
+
+        try:
+            if self.pool is not None:
+                result = self.pool.predict_one(*[float(v) for v in values])
+            else:
+                result = predict_reimbursement(*[float(v) for v in values])
+        except Exception as e:
+            self._reply(500, f"Prediction failed: {str(e)}")
+            return
+
+        self._reply(200, str(result))
+
+    def _reply(self, status: int, body: str, content_type: str = 'text/plain'):
+        """Send a response (plain text unless told otherwise)."""
+        payload = (body + '\n').encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Per-request access logs would dominate the cost of a prediction
+        pass
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = 0):
+    """
+    Load the models once and serve predictions until interrupted.
+
+    Args:
+        host: Interface to bind (localhost only by default)
+        port: TCP port to listen on
+        workers: Score in a prefork pool of this many processes (see
+            worker_pool.py) instead of the handler threads (0)
+    """
+    # Load up front so the first request doesn't pay for unpickling
+    get_models()
+
+    if workers:
+        from worker_pool import PredictionPool
+
+        PredictionHandler.pool = PredictionPool(workers).start()
+
+    server = ThreadingHTTPServer((host, port), PredictionHandler)
+    print(f"Serving predictions on http://{host}:{port}", file=sys.stderr)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if PredictionHandler.pool is not None:
+            PredictionHandler.pool.close()
+            PredictionHandler.pool = None
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python prediction_server.py [--host HOST] [--port PORT] [--workers N]
+    """
+    parser = argparse.ArgumentParser(description="Persistent reimbursement prediction server")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="Interface to bind")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Prefork worker processes to score in (0 = handler threads)")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
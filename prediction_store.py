@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import sys
+import os
+import argparse
+from typing import Callable, Dict
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+
+# Written next to the models by ModelTrainer.save_models
+PREDICTIONS_FILENAME = 'predictions.npz'
+
+# Matches reported next to the MAE (same thresholds as the test framework)
+EXACT_TOLERANCE = 0.01
+CLOSE_TOLERANCE = 1.00
+
+
+class PredictionStore:
+    """
+    Every model's predictions on the held-out split, and optionally its
+    out-of-fold predictions on the training split.
+
+    Models are predicted once, when they are evaluated; ensemble weighting,
+    stacking and reports are computed from the stored arrays only.
+    """
+
+    def __init__(self, y_train: np.ndarray = None, y_holdout: np.ndarray = None):
+        """
+        Args:
+            y_train: Targets of the training split (the out-of-fold rows)
+            y_holdout: Targets of the held-out split
+        """
+        self.y_train = y_train
+        self.y_holdout = y_holdout
+        # model name -> predictions on the held-out split
+        self.holdout: Dict[str, np.ndarray] = {}
+        # model name -> out-of-fold predictions on the training split
+        self.oof: Dict[str, np.ndarray] = {}
+
+    def add(self, name: str, holdout: np.ndarray = None, oof: np.ndarray = None):
+        """Record a model's held-out and/or out-of-fold predictions."""
+        if holdout is not None:
+            self.holdout[name] = np.asarray(holdout, dtype=float)
+        if oof is not None:
+            self.oof[name] = np.asarray(oof, dtype=float)
+
+    def update(self, other: 'PredictionStore'):
+        """Merge the predictions recorded by another store (e.g. a worker's)."""
+        self.holdout.update(other.holdout)
+        self.oof.update(other.oof)
+
+    def __bool__(self):
+        return bool(self.holdout or self.oof)
+
+    def combine(self, weights: Dict[str, float], split: str = 'holdout') -> np.ndarray:
+        """Weighted sum of the stored predictions, as the ensemble computes it."""
+        predictions = self.holdout if split == 'holdout' else self.oof
+        return sum(predictions[name] * weight for name, weight in weights.items())
+
+    def save(self, path: str):
+        """Write the store to one ``.npz`` file."""
+        arrays = {f'holdout/{name}': values for name, values in self.holdout.items()}
+        arrays.update({f'oof/{name}': values for name, values in self.oof.items()})
+        if self.y_train is not None:
+            arrays['y_train'] = self.y_train
+        if self.y_holdout is not None:
+            arrays['y_holdout'] = self.y_holdout
+        np.savez(path, **arrays)
+
+
+def load_store(path: str) -> PredictionStore:
+    """Read a store written by ``PredictionStore.save``."""
+    with np.load(path) as data:
+        store = PredictionStore(data['y_train'] if 'y_train' in data else None,
+                                data['y_holdout'] if 'y_holdout' in data else None)
+        for key in data.files:
+            split, _, name = key.partition('/')
+            if split == 'holdout':
+                store.holdout[name] = data[key]
+            elif split == 'oof':
+                store.oof[name] = data[key]
+    return store
+
+
+def score(y_true: np.ndarray, y_pred: np.ndarray) -> dict:
+    """
+    Accuracy of one set of predictions.
+
+    Returns:
+        Dictionary with ``r2``, ``mae``, ``rmse``, ``exact_rate`` and ``close_rate``
+    """
+    errors = np.abs(y_pred - y_true)
+    total = np.sum((y_true - y_true.mean()) ** 2)
+    return {
+        'r2': float(1 - np.sum((y_true - y_pred) ** 2) / total) if total else 0.0,
+        'mae': float(errors.mean()),
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+        'exact_rate': float(np.mean(errors <= EXACT_TOLERANCE)),
+        'close_rate': float(np.mean(errors <= CLOSE_TOLERANCE)),
+    }
+
+
+def r2_weights(store: PredictionStore) -> Dict[str, float]:
+    """Held-out R² of each model (negative R² counts as zero), normalized to sum to one."""
+    weights = {name: max(0.0, score(store.y_holdout, pred)['r2'])
+               for name, pred in store.holdout.items()}
+    total_weight = sum(weights.values())
+    return {name: weight / total_weight for name, weight in weights.items()}
+
+
+def equal_weights(store: PredictionStore) -> Dict[str, float]:
+    """The same weight for every model."""
+    return {name: 1.0 / len(store.holdout) for name in store.holdout}
+
+
+def best_model_weights(store: PredictionStore) -> Dict[str, float]:
+    """All weight on the model with the lowest held-out MAE."""
+    best = min(store.holdout, key=lambda name: score(store.y_holdout, store.holdout[name])['mae'])
+    return {name: float(name == best) for name in store.holdout}
+
+
+def stacking_weights(store: PredictionStore) -> Dict[str, float]:
+    """
+    Linear stacking: non-negative least-squares weights fitted to the
+    out-of-fold predictions, so the held-out split stays unseen.
+
+    Raises:
+        ValueError: If a model has no out-of-fold predictions
+    """
+    from scipy.optimize import nnls
+
+    missing = sorted(set(store.holdout) - set(store.oof))
+    if missing or not store.oof:
+        raise ValueError(f"stacking needs out-of-fold predictions for every model "
+                         f"(missing: {', '.join(missing) or 'all'}); train with --oof-folds")
+    names = list(store.holdout)
+    coefficients, _ = nnls(np.column_stack([store.oof[name] for name in names]), store.y_train)
+    return {name: float(weight) for name, weight in zip(names, coefficients)}
+
+
+# Combination strategies, selected with ModelTrainer(ensemble_strategy=...)
+STRATEGIES: Dict[str, Callable[[PredictionStore], Dict[str, float]]] = {
+    'r2': r2_weights,
+    'stacking': stacking_weights,
+    'equal': equal_weights,
+    'best': best_model_weights,
+}
+
+
+def compare_strategies(store: PredictionStore) -> Dict[str, dict]:
+    """
+    Held-out accuracy of every applicable strategy, from the stored arrays only.
+
+    Returns:
+        Dictionary mapping strategy name to its ``weights`` and ``score``
+    """
+    results = {}
+    for name, strategy in STRATEGIES.items():
+        if name == 'stacking' and set(store.holdout) - set(store.oof):
+            continue
+        weights = strategy(store)
+        results[name] = {'weights': weights,
+                         'score': score(store.y_holdout, store.combine(weights))}
+    return results
+
+
+def print_report(store: PredictionStore):
+    """Print per-model and per-strategy accuracy."""
+    print(f"{'model':20s} {'holdout MAE':>12s} {'holdout R²':>11s} {'OOF MAE':>9s}")
+    for name, pred in store.holdout.items():
+        holdout = score(store.y_holdout, pred)
+        oof = (f"{score(store.y_train, store.oof[name])['mae']:9.2f}"
+               if name in store.oof else f"{'-':>9s}")
+        print(f"{name:20s} {holdout['mae']:12.2f} {holdout['r2']:11.4f} {oof}")
+
+    print(f"\n{'strategy':20s} {'holdout MAE':>12s} {'holdout R²':>11s}  weights")
+    for name, result in compare_strategies(store).items():
+        weights = ', '.join(f"{model}={weight:.2f}" for model, weight in result['weights'].items()
+                            if weight)
+        print(f"{name:20s} {result['score']['mae']:12.2f} {result['score']['r2']:11.4f}  {weights}")
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python prediction_store.py [--model-dir models]
+
+    Compares the ensemble strategies on the predictions stored at training
+    time, without loading or running any model.
+    """
+    from predict_reimbursement import MODEL_DIR
+    from model_registry import resolve_model_dir
+
+    parser = argparse.ArgumentParser(description="Compare ensemble strategies")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    args = parser.parse_args()
+
+    try:
+        store = load_store(os.path.join(resolve_model_dir(args.model_dir), PREDICTIONS_FILENAME))
+        print_report(store)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+#!/bin/bash
+
+# Black Box Challenge - Reimbursement Calculation
+# Usage: ./run.sh <trip_duration_days> <miles_traveled> <total_receipts_amount>
+#
+# Asks the persistent prediction server (python3 prediction_server.py) for the
+# reimbursement so the models are only loaded once. If the server isn't
+# running, falls back to scoring the case in a fresh Python process.
+
+PORT=${REIMBURSEMENT_PORT:-8765}
+URL="http://127.0.0.1:$PORT/predict?trip_duration_days=$1&miles_traveled=$2&total_receipts_amount=$3"
+
+if output=$(curl -sf --max-time 5 "$URL" 2>/dev/null); then
+    echo "$output"
+else
+    exec python3 "$(dirname "$0")/predict_reimbursement.py" "$1" "$2" "$3"
+fi
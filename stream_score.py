@@ -0,0 +1,201 @@
+import sys
+import csv
+import json
+import time
+import argparse
+from typing import Dict, IO, Iterator, List
+
+from predict_reimbursement import _predict_arrays, np
+
+
+INPUT_NAMES = ['trip_duration_days', 'miles_traveled', 'total_receipts_amount']
+
+# Trips scored per vectorized ensemble call
+DEFAULT_CHUNK_SIZE = 10000
+
+# Bytes read from the input per refill of the JSON parser's buffer
+READ_SIZE = 1 << 16
+
+
+def iter_json_trips(f: IO[str], read_size: int = READ_SIZE) -> Iterator[Dict]:
+    """
+    Incrementally parse trips from a JSON array or JSON Lines stream.
+
+    Only the current read buffer is held in memory, so arbitrarily large
+    files are parsed in constant space. Cases in ``public_cases.json``
+    format (``{"input": {...}}``) yield their ``input`` object.
+
+    Args:
+        f: Text stream positioned at the start of the document
+        read_size: Characters read per refill
+
+    Yields:
+        One trip dict per array element / line
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    at_eof = False
+    in_array = None
+
+    while True:
+        # Skip whitespace and the array punctuation between elements
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            if in_array is None:
+                in_array = buffer[position] == '['
+            position += 1
+
+        if position < len(buffer):
+            if in_array is None:
+                in_array = False
+            try:
+                trip, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if at_eof:
+                    raise
+                trip = None
+            if trip is not None:
+                position = end
+                yield trip.get('input', trip)
+                continue
+
+        if at_eof:
+            return
+
+        # Need more input: drop what's been parsed and refill
+        chunk = f.read(read_size)
+        at_eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_csv_trips(f: IO[str]) -> Iterator[Dict]:
+    """
+    Parse trips from a CSV stream, one row at a time.
+
+    Column names may carry the ``input/`` prefix used by ``public_cases.csv``.
+
+    Yields:
+        One trip dict per row
+    """
+    for row in csv.DictReader(f):
+        yield {key.replace('input/', ''): value for key, value in row.items()}
+
+
+def iter_chunks(trips: Iterator[Dict], chunk_size: int) -> Iterator[np.ndarray]:
+    """
+    Group trips into (n, 3) input arrays of at most ``chunk_size`` rows.
+
+    Yields:
+        Arrays with columns (trip_duration_days, miles_traveled, total_receipts_amount)
+    """
+    rows: List[List] = []
+    for trip in trips:
+        rows.append([trip[name] for name in INPUT_NAMES])
+        if len(rows) == chunk_size:
+            yield np.array(rows, dtype=float)
+            rows = []
+    if rows:
+        yield np.array(rows, dtype=float)
+
+
+def _write_chunk(out: IO[str], inputs: np.ndarray, predictions: np.ndarray, fmt: str):
+    """Append one scored chunk to the output stream."""
+    if fmt == 'jsonl':
+        out.write(''.join(
+            json.dumps(dict(zip(INPUT_NAMES, row), predicted_reimbursement=prediction)) + '\n'
+            for row, prediction in zip(inputs.tolist(), predictions.tolist())
+        ))
+    else:
+        out.write(''.join(
+            f"{days:g},{miles:g},{receipts:g},{prediction}\n"
+            for (days, miles, receipts), prediction in zip(inputs.tolist(), predictions.tolist())
+        ))
+
+
+def stream_score(input_path: str, out: IO[str], fmt: str = 'csv',
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Score a trip file chunk by chunk, writing results as they are produced.
+
+    Memory use is bounded by ``chunk_size`` rather than the input size.
+
+    Args:
+        input_path: JSON array, JSON Lines (``.jsonl``) or CSV file of trips
+        out: Stream the results are written to
+        fmt: 'csv' or 'jsonl'
+        chunk_size: Trips scored per ensemble call
+
+    Returns:
+        Dictionary with the number of trips, elapsed time, throughput and
+        peak resident memory
+    """
+    start_time = time.perf_counter()
+    n_trips = 0
+
+    if fmt == 'csv':
+        out.write(','.join(INPUT_NAMES) + ',predicted_reimbursement\n')
+
+    with open(input_path, newline='') as f:
+        trips = iter_csv_trips(f) if input_path.endswith('.csv') else iter_json_trips(f)
+        for inputs in iter_chunks(trips, chunk_size):
+            try:
+                predictions = _predict_arrays(inputs[:, 0], inputs[:, 1], inputs[:, 2])
+            except ValueError as e:
+                raise ValueError(f"{e} in chunk starting at trip {n_trips}")
+            _write_chunk(out, inputs, predictions, fmt)
+            n_trips += len(inputs)
+
+    out.flush()
+    elapsed = time.perf_counter() - start_time
+    return {
+        'trips': n_trips,
+        'seconds': elapsed,
+        'trips_per_second': n_trips / max(elapsed, 1e-9),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (0 where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python stream_score.py <trips.json|trips.jsonl|trips.csv> [-o results.csv]
+                               [--format csv|jsonl] [--chunk-size 10000]
+    """
+    parser = argparse.ArgumentParser(description="Score large trip files with bounded memory")
+    parser.add_argument('input', help="JSON array, JSON Lines or CSV file of trips")
+    parser.add_argument('-o', '--output', default=None, help="Output file (default: stdout)")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    try:
+        if args.output:
+            with open(args.output, 'w', newline='') as out:
+                stats = stream_score(args.input, out, args.format, args.chunk_size)
+        else:
+            stats = stream_score(args.input, sys.stdout, args.format, args.chunk_size)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Scored {stats['trips']} trips in {stats['seconds']:.2f}s "
+          f"({stats['trips_per_second']:,.0f} trips/second, "
+          f"peak RSS {stats['peak_rss_mb']:.0f} MB)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,75 @@
 import pickle
 import json
 import numpy as np
-import pandas as pd
 from sklearn.linear_model import LinearRegression, Ridge, Lasso
 from sklearn.tree import DecisionTreeRegressor
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.neural_network import MLPRegressor
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import train_test_split, cross_val_score, cross_val_predict, KFold
+from sklearn.base import clone
 from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
 from sklearn.preprocessing import StandardScaler, PolynomialFeatures
 import os
+import io
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+from features import FEATURE_NAMES, RAW_FEATURES, build_features
+from dataset_cache import load_labeled
+from compiled_ensemble import COMPILED_FILENAME, save_compiled
+from incremental_training import STATS_FILENAME, VERSION_FILENAME, save_stats, sufficient_stats
+from business_rules import RULES_FILENAME, fit_rules, save_rules
+from model_router import ROUTER_FILENAME, ROUTE_PREFIX, fit_router
+from distillation import (STUDENT_FILENAME, REPORT_FILENAME, DISTILL_SAMPLES, distill,
+                          save_student, evaluate_student)
+from instrumentation import span, record, profiled
+from prediction_store import PREDICTIONS_FILENAME, STRATEGIES, PredictionStore, score
+
+
+MODEL_CLASSES = {
+    'linear_regression': LinearRegression,
+    'ridge': Ridge,
+    'lasso': Lasso,
+    'decision_tree': DecisionTreeRegressor,
+    'random_forest': RandomForestRegressor,
+    'gradient_boosting': GradientBoostingRegressor,
+    'neural_network': MLPRegressor,
+}
+
+# Hand-picked hyperparameters, overridden per model by ``ModelTrainer(params=...)``
+# (see model_search.py for tuning them with cross-validation)
+DEFAULT_PARAMS = {
+    'linear_regression': {},
+    'ridge': {'alpha': 1.0},
+    'lasso': {'alpha': 1.0},
+    'decision_tree': {'max_depth': 10},
+    'random_forest': {'n_estimators': 100, 'max_depth': 15},
+    'gradient_boosting': {'n_estimators': 100, 'max_depth': 5, 'learning_rate': 0.1},
+    'neural_network': {
+        'hidden_layer_sizes': (100, 50, 25),
+        'activation': 'relu',
+        'solver': 'adam',
+        'learning_rate': 'adaptive',
+        'max_iter': 1000,
+        'early_stopping': True,
+        'validation_fraction': 0.1,
+    },
+}
 
 
 class ModelTrainer:
     """Train and evaluate multiple models for ensemble."""
     
+    # Independent model families, each trained by the named method
+    MODEL_FAMILIES = ['train_linear_models', 'train_tree_models', 'train_neural_network']
+    
     def __init__(self, data_path: str = 'public_cases.csv', test_size: float = 0.25, 
-                 random_state: int = 42):
+                 random_state: int = 42, n_jobs: int = -1, params: dict = None,
+                 use_rules: bool = False, use_router: bool = False,
+                 use_distill: bool = False, oof_folds: int = 0,
+                 ensemble_strategy: str = 'r2'):
         """
         Initialize the model trainer.
         
@@ -24,39 +77,65 @@ class ModelTrainer:
             data_path: Path to the training data
             test_size: Proportion of data to use for testing
             random_state: Random seed for reproducibility
+            n_jobs: CPU budget for training (-1 for all cores). Shared between
+                the family worker processes and the Random Forest's threads.
+            params: Per-model hyperparameter overrides of ``DEFAULT_PARAMS``,
+                e.g. ``{'ridge': {'alpha': 10.0}}``
+            use_rules: Fit the business rules (business_rules.py) first and
+                train the models on the residual they leave
+            use_router: Fit a per-segment model router (model_router.py) on
+                the test split when saving
+            use_distill: Distill the ensemble into a small student model
+                (distillation.py), served with the 'student' backend
+            oof_folds: Also record each model's k-fold out-of-fold predictions
+                on the training split (0 = hold-out predictions only)
+            ensemble_strategy: How ``create_ensemble`` weights the models, a
+                key of ``prediction_store.STRATEGIES`` ('stacking' needs
+                out-of-fold predictions and defaults ``oof_folds`` to 5)
         """
         self.data_path = data_path
         self.test_size = test_size
         self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.params = params or {}
+        self.use_rules = use_rules
+        # Fitted RuleEngine when use_rules is set, saved as rules.json
+        self.rules = None
+        self.use_router = use_router
+        # (X_test, y_test) from load_and_prepare_data, for fitting the router
+        self.holdout = None
+        self.use_distill = use_distill
+        # Student model from distill_student, saved as student.bin
+        self.student = None
+        if ensemble_strategy not in STRATEGIES:
+            raise ValueError(f"unknown ensemble strategy {ensemble_strategy!r}")
+        self.ensemble_strategy = ensemble_strategy
+        self.oof_folds = oof_folds or (5 if ensemble_strategy == 'stacking' else 0)
+        # Every model's hold-out (and out-of-fold) predictions, saved as predictions.npz
+        self.predictions = PredictionStore()
         self.models = {}
         self.scalers = {}
+        self.timings = {}
         self.feature_names = None
+        # Linear-model statistics of the training rows, for incremental updates
+        self.train_stats = None
+        # Contents of version.json (a fresh version 1 unless set by an update)
+        self.version_info = None
+        # Ensemble test-set metrics from create_ensemble
+        self.metrics = {}
         
     def load_and_prepare_data(self):
         """Load and prepare the data with feature engineering."""
         print("Loading data...")
-        df = pd.read_csv(self.data_path)
+        # Parsed once, then memory-mapped from the columnar cache
+        days, miles, receipts, y = load_labeled(self.data_path)
         
-        # Extract basic features
-        X = df[['input/trip_duration_days', 'input/miles_traveled', 
-                'input/total_receipts_amount']].copy()
-        y = df['expected_output']
-        
-        # Rename columns for easier handling
-        X.columns = ['trip_duration_days', 'miles_traveled', 'total_receipts_amount']
-        
-        # Feature engineering - add derived features
+        # Feature engineering - shared with predict_reimbursement.py so the
+        # saved models always see the same columns at inference time
+        # (new derived features are added in features.DERIVED_FEATURES)
         print("Engineering features...")
-        X['cost_per_day'] = X['total_receipts_amount'] / (X['trip_duration_days'] + 0.01)
-        X['cost_per_mile'] = X['total_receipts_amount'] / (X['miles_traveled'] + 0.01)
-        X['miles_per_day'] = X['miles_traveled'] / (X['trip_duration_days'] + 0.01)
-        
-        # TODO: Add more engineered features based on EDA insights
-        # Examples:
-        # X['duration_miles_interaction'] = X['trip_duration_days'] * X['miles_traveled']
-        # X['receipts_squared'] = X['total_receipts_amount'] ** 2
-        
-        self.feature_names = X.columns.tolist()
+        self.feature_names = list(FEATURE_NAMES)
+        X = build_features(days, miles, receipts, self.feature_names)
         
         # Split data
         print(f"Splitting data (test_size={self.test_size})...")
@@ -64,6 +143,20 @@ class ModelTrainer:
             X, y, test_size=self.test_size, random_state=self.random_state
         )
         
+        if self.use_rules:
+            # Rule amounts come from the training rows only; from here on every
+            # model (and the test metrics) sees the residual, which leaves the
+            # dollar errors unchanged but makes R² relative to the rules
+            raw = [self.feature_names.index(name) for name in RAW_FEATURES]
+            self.rules = fit_rules(*X_train[:, raw].T, y_train)
+            y_train = y_train - self.rules.predict(*X_train[:, raw].T)
+            y_test = y_test - self.rules.predict(*X_test[:, raw].T)
+            print("Fitted business rules; training on their residual")
+        
+        self.train_stats = sufficient_stats(X_train, y_train)
+        self.holdout = (X_test, y_test)
+        self.predictions.y_train, self.predictions.y_holdout = y_train, y_test
+        
         print(f"Training set: {X_train.shape[0]} samples")
         print(f"Test set: {X_test.shape[0]} samples")
         
@@ -77,24 +170,25 @@ class ModelTrainer:
         
         # Simple Linear Regression
         print("\n1. Linear Regression...")
-        lr = LinearRegression()
-        lr.fit(X_train, y_train)
+        lr = self.build_model('linear_regression')
+        self._fit('linear_regression', lr, X_train, y_train)
         self.models['linear_regression'] = lr
-        self._evaluate_model(lr, X_train, X_test, y_train, y_test, 'Linear Regression')
+        self._evaluate_model(lr, X_train, X_test, y_train, y_test,
+                             'Linear Regression', 'linear_regression')
         
         # Ridge Regression
         print("\n2. Ridge Regression...")
-        ridge = Ridge(alpha=1.0)
-        ridge.fit(X_train, y_train)
+        ridge = self.build_model('ridge')
+        self._fit('ridge', ridge, X_train, y_train)
         self.models['ridge'] = ridge
-        self._evaluate_model(ridge, X_train, X_test, y_train, y_test, 'Ridge')
+        self._evaluate_model(ridge, X_train, X_test, y_train, y_test, 'Ridge', 'ridge')
         
         # Lasso Regression
         print("\n3. Lasso Regression...")
-        lasso = Lasso(alpha=1.0)
-        lasso.fit(X_train, y_train)
+        lasso = self.build_model('lasso')
+        self._fit('lasso', lasso, X_train, y_train)
         self.models['lasso'] = lasso
-        self._evaluate_model(lasso, X_train, X_test, y_train, y_test, 'Lasso')
+        self._evaluate_model(lasso, X_train, X_test, y_train, y_test, 'Lasso', 'lasso')
         
         # TODO: Add Polynomial Regression
         # poly_features = PolynomialFeatures(degree=2)
@@ -112,26 +206,27 @@ class ModelTrainer:
         
         # Decision Tree
         print("\n1. Decision Tree...")
-        dt = DecisionTreeRegressor(random_state=self.random_state, max_depth=10)
-        dt.fit(X_train, y_train)
+        dt = self.build_model('decision_tree')
+        self._fit('decision_tree', dt, X_train, y_train)
         self.models['decision_tree'] = dt
-        self._evaluate_model(dt, X_train, X_test, y_train, y_test, 'Decision Tree')
+        self._evaluate_model(dt, X_train, X_test, y_train, y_test,
+                             'Decision Tree', 'decision_tree')
         
         # Random Forest
         print("\n2. Random Forest...")
-        rf = RandomForestRegressor(n_estimators=100, random_state=self.random_state, 
-                                   max_depth=15, n_jobs=-1)
-        rf.fit(X_train, y_train)
+        rf = self.build_model('random_forest')
+        self._fit('random_forest', rf, X_train, y_train)
         self.models['random_forest'] = rf
-        self._evaluate_model(rf, X_train, X_test, y_train, y_test, 'Random Forest')
+        self._evaluate_model(rf, X_train, X_test, y_train, y_test,
+                             'Random Forest', 'random_forest')
         
         # Gradient Boosting
         print("\n3. Gradient Boosting...")
-        gb = GradientBoostingRegressor(n_estimators=100, random_state=self.random_state,
-                                      max_depth=5, learning_rate=0.1)
-        gb.fit(X_train, y_train)
+        gb = self.build_model('gradient_boosting')
+        self._fit('gradient_boosting', gb, X_train, y_train)
         self.models['gradient_boosting'] = gb
-        self._evaluate_model(gb, X_train, X_test, y_train, y_test, 'Gradient Boosting')
+        self._evaluate_model(gb, X_train, X_test, y_train, y_test,
+                             'Gradient Boosting', 'gradient_boosting')
         
         # Feature importance for tree-based models
         print("\n--- Feature Importance (Random Forest) ---")
@@ -152,33 +247,99 @@ class ModelTrainer:
         
         # Multi-layer Perceptron
         print("\nMLP Regressor...")
-        mlp = MLPRegressor(
-            hidden_layer_sizes=(100, 50, 25),
-            activation='relu',
-            solver='adam',
-            learning_rate='adaptive',
-            max_iter=1000,
-            random_state=self.random_state,
-            early_stopping=True,
-            validation_fraction=0.1
-        )
-        mlp.fit(X_train_scaled, y_train)
+        mlp = self.build_model('neural_network')
+        self._fit('neural_network', mlp, X_train_scaled, y_train)
         self.models['neural_network'] = mlp
         
         # Evaluate with scaled data
-        y_train_pred = mlp.predict(X_train_scaled)
-        y_test_pred = mlp.predict(X_test_scaled)
+        self._evaluate_model(mlp, X_train_scaled, X_test_scaled, y_train, y_test,
+                             'Neural Network', 'neural_network')
+    
+    def build_model(self, name: str, **overrides):
+        """
+        Construct an unfitted model.
+        
+        Hyperparameters are ``DEFAULT_PARAMS[name]``, then ``self.params[name]``,
+        then ``overrides``. Models that take them also get the trainer's
+        ``random_state`` and ``n_jobs``.
+        
+        Args:
+            name: Key of ``MODEL_CLASSES``
+            **overrides: Hyperparameters for this instance only
         
-        print(f"Train R²: {r2_score(y_train, y_train_pred):.4f}")
-        print(f"Test R²: {r2_score(y_test, y_test_pred):.4f}")
-        print(f"Test MAE: ${mean_absolute_error(y_test, y_test_pred):.2f}")
-        print(f"Test RMSE: ${np.sqrt(mean_squared_error(y_test, y_test_pred)):.2f}")
+        Returns:
+            Unfitted sklearn estimator
+        """
+        model_class = MODEL_CLASSES[name]
+        params = {**DEFAULT_PARAMS[name], **self.params.get(name, {}), **overrides}
+        # JSON round-trips turn tuples like hidden_layer_sizes into lists
+        params = {key: tuple(value) if isinstance(value, list) else value
+                  for key, value in params.items()}
+        
+        accepted = model_class().get_params()
+        if 'random_state' in accepted:
+            params.setdefault('random_state', self.random_state)
+        if 'n_jobs' in accepted and name == 'random_forest':
+            params.setdefault('n_jobs', self.n_jobs)
+        return model_class(**params)
     
-    def _evaluate_model(self, model, X_train, X_test, y_train, y_test, model_name):
-        """Evaluate a single model."""
+    def search_hyperparameters(self, X_train, y_train, space: dict = None, n_splits: int = 5,
+                               n_workers: int = None, checkpoint_path: str = None) -> dict:
+        """
+        Tune hyperparameters with k-fold cross-validation on the training split.
+        
+        The best parameters found are merged into ``self.params``, so models
+        trained afterwards use them.
+        
+        Args:
+            X_train, y_train: Training split from ``load_and_prepare_data``
+            space: Parameter grid per model (defaults to ``model_search.SEARCH_SPACE``)
+            n_splits: Number of CV folds, shared by every candidate
+            n_workers: Worker processes (see ``model_search.run_search``)
+            checkpoint_path: JSON Lines file to record trials in and resume from
+        
+        Returns:
+            Search result (see ``model_search.run_search``)
+        """
+        from model_search import run_search
+        
+        result = run_search(X_train, y_train, space, n_splits=n_splits, n_workers=n_workers,
+                            checkpoint_path=checkpoint_path, random_state=self.random_state,
+                            params=self.params)
+        for name, params in result['best_params'].items():
+            self.params[name] = {**self.params.get(name, {}), **params}
+        return result
+    
+    def _fit(self, name, model, X_train, y_train):
+        """Fit a model, recording its wall-clock and CPU time."""
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        model.fit(X_train, y_train)
+        self.timings[name] = {
+            'wall_time': time.perf_counter() - wall_start,
+            'cpu_time': time.process_time() - cpu_start,
+        }
+        return model
+    
+    def _evaluate_model(self, model, X_train, X_test, y_train, y_test, model_name, name=None):
+        """
+        Evaluate a single model.
+        
+        Its test-set predictions are recorded under ``name`` in
+        ``self.predictions``, together with out-of-fold predictions on the
+        training split when ``oof_folds`` is set, so the ensemble never
+        predicts again.
+        """
         y_train_pred = model.predict(X_train)
         y_test_pred = model.predict(X_test)
         
+        if name is not None:
+            oof = None
+            if self.oof_folds:
+                # Unfitted copies of the same configuration, one per fold
+                folds = KFold(self.oof_folds, shuffle=True, random_state=self.random_state)
+                oof = cross_val_predict(clone(model), X_train, y_train, cv=folds)
+            self.predictions.add(name, holdout=y_test_pred, oof=oof)
+        
         train_r2 = r2_score(y_train, y_train_pred)
         test_r2 = r2_score(y_test, y_test_pred)
         test_mae = mean_absolute_error(y_test, y_test_pred)
@@ -208,55 +369,71 @@ class ModelTrainer:
         print("Creating Ensemble Model")
         print("="*60)
         
-        # TODO: Implement ensemble logic
-        # Options:
-        # 1. Simple averaging
-        # 2. Weighted averaging based on performance
-        # 3. Stacking
-        
-        # Example: Weighted average ensemble
-        predictions = {}
-        weights = {}
-        
+        # Weights come from the predictions recorded in _evaluate_model;
+        # models that were never evaluated here are predicted once now
+        store = PredictionStore(y_train, y_test)
         for name, model in self.models.items():
-            if name == 'neural_network':
-                scaler = self.scalers.get('nn_scaler')
-                X_test_scaled = scaler.transform(X_test)
-                pred = model.predict(X_test_scaled)
-            else:
-                pred = model.predict(X_test)
-            
-            predictions[name] = pred
-            r2 = r2_score(y_test, pred)
-            weights[name] = max(0, r2)  # Use R² as weight (ignore negative)
-        
-        # Normalize weights
-        total_weight = sum(weights.values())
-        weights = {k: v/total_weight for k, v in weights.items()}
-        
-        print("\nEnsemble weights:")
+            if name not in self.predictions.holdout:
+                if name == 'neural_network':
+                    scaler = self.scalers.get('nn_scaler')
+                    X_test_scaled = scaler.transform(X_test)
+                    self.predictions.add(name, holdout=model.predict(X_test_scaled))
+                else:
+                    self.predictions.add(name, holdout=model.predict(X_test))
+            store.add(name, holdout=self.predictions.holdout[name],
+                      oof=self.predictions.oof.get(name))
+        
+        weights = STRATEGIES[self.ensemble_strategy](store)
+        
+        print(f"\nEnsemble weights ({self.ensemble_strategy}):")
         for name, weight in sorted(weights.items(), key=lambda x: x[1], reverse=True):
             print(f"  {name:20s}: {weight:.3f}")
         
         # Calculate ensemble prediction
-        ensemble_pred = np.zeros(len(y_test))
-        for name, pred in predictions.items():
-            ensemble_pred += pred * weights[name]
+        ensemble_pred = store.combine(weights)
         
         # Evaluate ensemble
+        metrics = score(y_test, ensemble_pred)
         print("\nEnsemble Performance:")
-        print(f"Test R²: {r2_score(y_test, ensemble_pred):.4f}")
-        print(f"Test MAE: ${mean_absolute_error(y_test, ensemble_pred):.2f}")
-        print(f"Test RMSE: ${np.sqrt(mean_squared_error(y_test, ensemble_pred)):.2f}")
-        
-        exact_matches = np.sum(np.abs(ensemble_pred - y_test) <= 0.01)
-        close_matches = np.sum(np.abs(ensemble_pred - y_test) <= 1.00)
-        print(f"Exact matches (±$0.01): {exact_matches / len(y_test) * 100:.1f}%")
-        print(f"Close matches (±$1.00): {close_matches / len(y_test) * 100:.1f}%")
+        print(f"Test R²: {metrics['r2']:.4f}")
+        print(f"Test MAE: ${metrics['mae']:.2f}")
+        print(f"Test RMSE: ${metrics['rmse']:.2f}")
+        print(f"Exact matches (±$0.01): {metrics['exact_rate'] * 100:.1f}%")
+        print(f"Close matches (±$1.00): {metrics['close_rate'] * 100:.1f}%")
+        
+        # Recorded in the registry manifest when published
+        self.metrics = {
+            'test_r2': metrics['r2'],
+            'test_mae': metrics['mae'],
+            'test_rmse': metrics['rmse'],
+            'exact_rate': metrics['exact_rate'],
+            'close_rate': metrics['close_rate'],
+        }
         
         # Save ensemble weights
         self.models['ensemble_weights'] = weights
     
+    def distill_student(self, X_train, n_samples: int = None):
+        """
+        Fit a compact student to the ensemble's outputs on synthetic trips.
+        
+        Args:
+            X_train: Training features; the synthetic trips are drawn around them
+            n_samples: Synthetic trips (defaults to ``DISTILL_SAMPLES``)
+        """
+        from predict_reimbursement import ensemble_predict_batch
+        
+        # The ensemble as load_models would return it from the sklearn pickles
+        teacher = {**self.models, **self.scalers, 'feature_names': self.feature_names}
+        raw = [self.feature_names.index(name) for name in RAW_FEATURES]
+        
+        print("\nDistilling the ensemble into a student model...")
+        start_time = time.perf_counter()
+        self.student = distill(lambda X: ensemble_predict_batch(teacher, X), self.feature_names,
+                               *X_train[:, raw].T, n_samples or DISTILL_SAMPLES,
+                               random_state=self.random_state)
+        print(f"Student fitted in {time.perf_counter() - start_time:.2f}s")
+    
     def save_models(self, output_dir: str = 'models'):
         """Save all trained models to disk."""
         print(f"\nSaving models to {output_dir}/...")
@@ -285,43 +462,253 @@ class ModelTrainer:
             json.dump(self.feature_names, f, indent=2)
         print(f"  ✓ Saved feature_names.json")
         
+        # Statistics and version record for incremental_training.py
+        if self.train_stats is not None:
+            save_stats(f'{output_dir}/{STATS_FILENAME}', self.train_stats)
+            print(f"  ✓ Saved {STATS_FILENAME}")
+        version_info = self.version_info or {
+            'version': 1,
+            'parent': None,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'n_samples': None if self.train_stats is None else int(self.train_stats['n']),
+            'updates': [],
+        }
+        with open(f'{output_dir}/{VERSION_FILENAME}', 'w') as f:
+            json.dump(version_info, f, indent=2)
+        
+        if self.predictions:
+            self.predictions.save(f'{output_dir}/{PREDICTIONS_FILENAME}')
+            print(f"  ✓ Saved {PREDICTIONS_FILENAME}")
+        
+        if self.rules is not None:
+            save_rules(output_dir, self.rules)
+            print(f"  ✓ Saved {RULES_FILENAME}")
+        else:
+            # Left over rules would be added on top of full-target models
+            _remove_artifacts(output_dir, lambda name: name == RULES_FILENAME)
+        
+        # Compile everything into one NumPy-only artifact for fast loading
+        save_compiled({**self.models, **self.scalers}, self.feature_names,
+                      f'{output_dir}/{COMPILED_FILENAME}')
+        print(f"  ✓ Saved {COMPILED_FILENAME}")
+        
+        if self.use_router and self.holdout is not None:
+            router = fit_router(output_dir, *self.holdout)
+            print(f"  ✓ Saved {ROUTER_FILENAME} "
+                  f"({router.report['compute_saved']:.0%} compute saved on the test split)")
+        else:
+            # A router left from an earlier training would route to its old models
+            _remove_artifacts(output_dir, lambda name: name == ROUTER_FILENAME
+                              or (name.startswith(ROUTE_PREFIX) and name.endswith('.bin')))
+        
+        if self.student is not None:
+            save_student(output_dir, self.student, self.feature_names)
+            print(f"  ✓ Saved {STUDENT_FILENAME}")
+            if os.path.exists('public_cases.json'):
+                report = evaluate_student(output_dir, 'public_cases.json')
+                print(f"    student MAE ${report['student_mae']:.2f} vs ensemble "
+                      f"${report['ensemble_mae']:.2f}, {report['batch_speedup']:.1f}x faster")
+        else:
+            # A student distilled from the previous ensemble no longer matches it
+            _remove_artifacts(output_dir, lambda name: name in (STUDENT_FILENAME, REPORT_FILENAME))
+        
         print(f"\n✅ All models saved successfully!")
     
-    def train_all(self):
-        """Train all models and save them."""
+    def train_families(self, X_train, X_test, y_train, y_test, n_workers: int = None):
+        """
+        Train the independent model families, concurrently when possible.
+        
+        Each family in ``MODEL_FAMILIES`` is fitted in its own worker process.
+        The ``n_jobs`` CPU budget is split so the pool and the Random Forest's
+        internal threads don't oversubscribe the machine: the single-threaded
+        families get one core each and the forest gets the rest.
+        
+        Args:
+            X_train, X_test, y_train, y_test: Output of ``load_and_prepare_data``
+            n_workers: Number of worker processes (defaults to one per family,
+                capped by the CPU budget; 1 trains sequentially in-process)
+        """
+        cpu_budget = os.cpu_count() if self.n_jobs in (None, -1) else self.n_jobs
+        if n_workers is None:
+            n_workers = min(len(self.MODEL_FAMILIES), cpu_budget)
+        n_workers = max(1, n_workers)
+        
+        if n_workers == 1:
+            for family in self.MODEL_FAMILIES:
+                getattr(self, family)(X_train, X_test, y_train, y_test)
+            return
+        
+        forest_jobs = max(1, cpu_budget - (n_workers - 1))
+        print(f"\nTraining {len(self.MODEL_FAMILIES)} model families on {n_workers} "
+              f"workers (CPU budget {cpu_budget}, random forest n_jobs={forest_jobs})...")
+        
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [
+                pool.submit(_train_family, family, X_train, X_test, y_train, y_test,
+                            self.random_state, self.feature_names,
+                            forest_jobs if family == 'train_tree_models' else 1, self.params,
+                            self.oof_folds)
+                for family in self.MODEL_FAMILIES
+            ]
+            # Collect in submission order so the log and model order are stable
+            for future in futures:
+                models, scalers, timings, predictions, log = future.result()
+                print(log, end='')
+                self.models.update(models)
+                self.scalers.update(scalers)
+                self.timings.update(timings)
+                self.predictions.update(predictions)
+    
+    def print_timings(self):
+        """Print per-model wall-clock and CPU fit times."""
+        print("\n--- Training Time ---")
+        print(f"{'model':20s} {'wall (s)':>10s} {'cpu (s)':>10s}")
+        for name, timing in self.timings.items():
+            print(f"{name:20s} {timing['wall_time']:10.2f} {timing['cpu_time']:10.2f}")
+    
+    def train_all(self, n_workers: int = None, search: bool = False,
+                  search_checkpoint: str = None, n_splits: int = 5, registry: str = None):
+        """
+        Train all models and save them.
+        
+        Args:
+            n_workers: Worker processes for model training (see ``train_families``)
+            search: Tune hyperparameters with cross-validation first
+            search_checkpoint: Checkpoint file that lets an interrupted search resume
+            n_splits: Number of CV folds for the search
+            registry: Publish to this model registry root as a new current
+                version instead of overwriting ``models/``
+        """
+        start_time = time.perf_counter()
+        
         # Load and prepare data
-        X_train, X_test, y_train, y_test = self.load_and_prepare_data()
+        with span('train.prepare_data'):
+            X_train, X_test, y_train, y_test = self.load_and_prepare_data()
+        
+        if search:
+            with span('train.search'):
+                self.search_hyperparameters(X_train, y_train, n_splits=n_splits,
+                                            n_workers=n_workers,
+                                            checkpoint_path=search_checkpoint)
         
         # Train different model types
-        self.train_linear_models(X_train, X_test, y_train, y_test)
-        self.train_tree_models(X_train, X_test, y_train, y_test)
-        self.train_neural_network(X_train, X_test, y_train, y_test)
+        with span('train.families'):
+            self.train_families(X_train, X_test, y_train, y_test, n_workers)
+        # Fits may run in worker processes; their timings come back with the models
+        for name, timing in self.timings.items():
+            record(f'train.fit.{name}', timing['wall_time'])
         
         # Create ensemble
-        self.create_ensemble(X_train, X_test, y_train, y_test)
+        with span('train.ensemble'):
+            self.create_ensemble(X_train, X_test, y_train, y_test)
+        
+        if self.use_distill:
+            with span('train.distill'):
+                self.distill_student(X_train)
         
         # Save all models
-        self.save_models()
+        with span('train.save'):
+            if registry:
+                from model_registry import publish
+                
+                version = publish(registry, self.save_models, metrics=self.metrics)
+                print(f"✓ Published {version} to {registry}")
+            else:
+                self.save_models()
+        
+        self.print_timings()
         
         print("\n" + "="*60)
         print("Training Complete!")
         print("="*60)
         print(f"Total models trained: {len(self.models)}")
+        print(f"Total training time: {time.perf_counter() - start_time:.2f}s")
         print("Models are ready for production deployment.")
 
 
+def _remove_artifacts(output_dir: str, matches):
+    """Delete the files in ``output_dir`` whose names ``matches`` accepts."""
+    for name in os.listdir(output_dir):
+        if matches(name):
+            os.remove(os.path.join(output_dir, name))
+            print(f"  ✓ Removed stale {name}")
+
+
+def _train_family(family, X_train, X_test, y_train, y_test, random_state,
+                  feature_names, n_jobs, params=None, oof_folds=0):
+    """
+    Worker-process entry point: train one model family.
+    
+    Returns:
+        Tuple of (models, scalers, timings, prediction store, captured log output)
+    """
+    from threadpoolctl import threadpool_limits
+    
+    trainer = ModelTrainer(random_state=random_state, n_jobs=n_jobs, params=params,
+                           oof_folds=oof_folds)
+    trainer.feature_names = feature_names
+    
+    log = io.StringIO()
+    # Keep BLAS/OpenMP inside each worker to its share of the CPU budget
+    with threadpool_limits(n_jobs), contextlib.redirect_stdout(log):
+        getattr(trainer, family)(X_train, X_test, y_train, y_test)
+    
+    return trainer.models, trainer.scalers, trainer.timings, trainer.predictions, log.getvalue()
+
+
 def main():
     """Main function to run model training."""
+    parser = argparse.ArgumentParser(description="Train the reimbursement models")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes for training model families (1 = sequential)")
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                        help="Total CPU budget for training (-1 = all cores)")
+    parser.add_argument('--params', default=None,
+                        help="JSON file of per-model hyperparameters (e.g. from model_search.py)")
+    parser.add_argument('--search', action='store_true',
+                        help="Tune hyperparameters with k-fold cross-validation before training")
+    parser.add_argument('--search-checkpoint', default='search_checkpoint.jsonl',
+                        help="Checkpoint file an interrupted search resumes from")
+    parser.add_argument('--folds', type=int, default=5, help="Cross-validation folds")
+    parser.add_argument('--registry', default=None,
+                        help="Publish to this model registry root instead of models/")
+    parser.add_argument('--rules', action='store_true',
+                        help="Train the models on the residual of the business rules")
+    parser.add_argument('--router', action='store_true',
+                        help="Route each trip segment to the cheapest accurate model")
+    parser.add_argument('--distill', action='store_true',
+                        help="Distill the ensemble into a small student model (student.bin)")
+    parser.add_argument('--oof-folds', type=int, default=0,
+                        help="Also store k-fold out-of-fold predictions (predictions.npz)")
+    parser.add_argument('--ensemble', default='r2', choices=sorted(STRATEGIES),
+                        help="Ensemble weighting ('stacking' fits on out-of-fold predictions)")
+    args = parser.parse_args()
+    
+    params = None
+    if args.params:
+        with open(args.params) as f:
+            params = json.load(f)
+    
     # Initialize trainer
     trainer = ModelTrainer(
         data_path='public_cases.csv',
         test_size=0.25,
-        random_state=42
+        random_state=42,
+        n_jobs=args.n_jobs,
+        params=params,
+        use_rules=args.rules,
+        use_router=args.router,
+        use_distill=args.distill,
+        oof_folds=args.oof_folds,
+        ensemble_strategy=args.ensemble
     )
     
     # Train all models
-    trainer.train_all()
+    trainer.train_all(n_workers=args.workers, search=args.search,
+                      search_checkpoint=args.search_checkpoint, n_splits=args.folds,
+                      registry=args.registry)
 
 
 if __name__ == '__main__':
-    main()
+    with profiled('train'):
+        main()
@@ -0,0 +1,428 @@
+import sys
+import os
+import time
+import queue
+import signal
+import argparse
+import threading
+import itertools
+import multiprocessing
+from collections import deque
+from multiprocessing import connection
+from concurrent.futures import Future
+from typing import List
+
+import predict_reimbursement
+from predict_reimbursement import np, get_models, load_trips, validate_inputs, _predict_arrays
+
+
+# Worker processes (defaults to one per core)
+DEFAULT_WORKERS = int(os.environ.get('REIMBURSEMENT_WORKERS', os.cpu_count() or 1))
+
+# Most trips sent to a worker in one message; larger requests are split
+MAX_BATCH = 512
+
+# Replace a worker after it has scored this many trips (0 = never), which
+# bounds the memory a long-lived worker can accumulate
+RECYCLE_AFTER = int(os.environ.get('REIMBURSEMENT_WORKER_RECYCLE', 1_000_000))
+
+# Single-trip requests wait while every worker already has this many
+# batches outstanding, so they pile up into bigger batches under load
+MAX_PENDING = 2
+
+# How long the collector waits on worker pipes before rechecking the pool
+POLL_SECONDS = 0.05
+
+# Imported once by the fork server, so each worker it forks starts with them
+FORKSERVER_PRELOAD = ['numpy', 'predict_reimbursement', 'worker_pool']
+
+
+def _worker_main(conn, model_dir: str):
+    """
+    Worker-process loop: score batches until told to stop.
+
+    Workers are forked by the single-threaded fork server and load the
+    models themselves; ``ensemble.bin`` (and the lookup table and case
+    index) are mmap'd, so every worker shares them through the page cache.
+    """
+    # Shutdown is driven by the parent; Ctrl-C in a terminal reaches the
+    # whole process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    get_models(model_dir)
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        batch_id, days, miles, receipts = message
+        try:
+            conn.send((batch_id, _predict_arrays(days, miles, receipts, model_dir), None))
+        except Exception as e:
+            conn.send((batch_id, None, e))
+    conn.close()
+
+
+class _Worker:
+    """Parent-side handle of one worker process."""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        # batch_id -> Future of batches sent but not answered
+        self.pending = {}
+        # Messages queued under the pool lock, sent in order under send_lock
+        self.outbox = deque()
+        self.send_lock = threading.Lock()
+        self.trips = 0
+        self.retiring = False
+
+
+class PredictionPool:
+    """
+    Prefork pool of prediction worker processes.
+
+    Workers, including replacements for recycled or crashed ones, are forked
+    by a ``multiprocessing`` fork server rather than by this process. The
+    fork server is single-threaded, so a worker never inherits a lock that
+    one of this process's threads (collector, dispatcher, server handlers)
+    held at fork time, such as ``predict_reimbursement._SWAP_LOCK`` during
+    a hot swap or a cache lock. Requests are split into batches of at most
+    ``max_batch`` trips, each sent to the worker with the fewest outstanding
+    batches. Single-trip requests (``submit_one``) queue up while every
+    worker has ``MAX_PENDING`` batches outstanding and are then sent
+    together as one batch, so batches grow with load and idle workers answer
+    at once. A worker that has scored
+    ``recycle_after`` trips finishes its queued batches and exits; a fresh
+    one is forked in its place first, so capacity never drops.
+    """
+
+    def __init__(self, n_workers: int = None, model_dir: str = None,
+                 max_batch: int = MAX_BATCH, recycle_after: int = RECYCLE_AFTER):
+        """
+        Args:
+            n_workers: Worker processes (defaults to ``DEFAULT_WORKERS``)
+            model_dir: Model directory or registry root (defaults to ``MODEL_DIR``
+                at construction; workers don't see later changes to it)
+            max_batch: Most trips per message to a worker
+            recycle_after: Trips after which a worker is replaced (0 = never)
+        """
+        self.n_workers = n_workers or DEFAULT_WORKERS
+        self.model_dir = model_dir or predict_reimbursement.MODEL_DIR
+        self.max_batch = max_batch
+        self.recycle_after = recycle_after
+
+        self._context = multiprocessing.get_context('forkserver')
+        # No effect once the fork server is running (it is shared per process)
+        self._context.set_forkserver_preload(FORKSERVER_PRELOAD)
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        # Signalled whenever a worker finishes a batch
+        self._capacity = threading.Condition(self._lock)
+        self._batch_ids = itertools.count()
+        self._requests = queue.Queue()
+        self._closed = False
+        self._threads = []
+        self.counters = {'batches': 0, 'trips': 0, 'recycled': 0, 'crashed': 0}
+
+    def start(self) -> 'PredictionPool':
+        """Check that the models load, start the workers and start dispatching."""
+        # A broken model directory fails here rather than in every worker
+        get_models(self.model_dir)
+
+        with self._lock:
+            for _ in range(self.n_workers):
+                self._workers.append(self._spawn())
+
+        for target in (self._collect, self._dispatch_requests):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn, self.model_dir),
+                                        daemon=True)
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def submit(self, days, miles, receipts) -> Future:
+        """
+        Score input arrays in the pool.
+
+        Returns:
+            Future resolving to the array of predictions, in input order
+        """
+        days, miles, receipts = (np.atleast_1d(np.asarray(values, dtype=float))
+                                 for values in (days, miles, receipts))
+        chunks = [self._send(days[start:start + self.max_batch],
+                             miles[start:start + self.max_batch],
+                             receipts[start:start + self.max_batch])
+                  for start in range(0, len(days), self.max_batch)]
+        if len(chunks) == 1:
+            return chunks[0]
+
+        combined = Future()
+        remaining = [len(chunks)]
+        lock = threading.Lock()
+
+        def chunk_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                combined.set_result(np.concatenate([chunk.result() for chunk in chunks]))
+            except Exception as e:
+                combined.set_exception(e)
+
+        if not chunks:
+            combined.set_result(np.zeros(0))
+        for chunk in chunks:
+            chunk.add_done_callback(chunk_done)
+        return combined
+
+    def predict(self, days, miles, receipts) -> np.ndarray:
+        """Score input arrays in the pool and wait for the predictions."""
+        return self.submit(days, miles, receipts).result()
+
+    def submit_one(self, trip_duration_days: float, miles_traveled: float,
+                   total_receipts_amount: float) -> Future:
+        """
+        Queue a single trip; trips queued together are scored as one batch.
+
+        Returns:
+            Future resolving to the prediction as a float, or failing with
+            ValueError for invalid inputs (checked before batching, so one
+            bad trip never fails the others)
+        """
+        future = Future()
+        is_valid, error_msg = validate_inputs(trip_duration_days, miles_traveled,
+                                              total_receipts_amount)
+        if not is_valid:
+            future.set_exception(ValueError(error_msg))
+            return future
+        self._requests.put((float(trip_duration_days), float(miles_traveled),
+                            float(total_receipts_amount), future))
+        return future
+
+    def predict_one(self, trip_duration_days: float, miles_traveled: float,
+                    total_receipts_amount: float) -> float:
+        """Score a single trip in the pool and wait for the prediction."""
+        return self.submit_one(trip_duration_days, miles_traveled, total_receipts_amount).result()
+
+    def _dispatch_requests(self):
+        """Batch whatever single-trip requests are waiting and send them out."""
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            with self._capacity:
+                self._capacity.wait_for(self._has_capacity)
+            requests = [request]
+            while len(requests) < self.max_batch:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._requests.put(None)
+                    break
+                requests.append(request)
+
+            days, miles, receipts, futures = zip(*requests)
+            try:
+                batch = self._send(np.array(days), np.array(miles), np.array(receipts))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            batch.add_done_callback(lambda batch, futures=futures: _split(batch, futures))
+
+    def _has_capacity(self) -> bool:
+        return any(not w.retiring and len(w.pending) < MAX_PENDING for w in self._workers)
+
+    def _send(self, days: np.ndarray, miles: np.ndarray, receipts: np.ndarray) -> Future:
+        """Send one batch to the least-loaded worker."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Prediction pool is closed")
+            worker = min((w for w in self._workers if not w.retiring),
+                         key=lambda w: len(w.pending))
+            batch_id = next(self._batch_ids)
+            worker.pending[batch_id] = future
+            worker.outbox.append((batch_id, days, miles, receipts))
+            worker.trips += len(days)
+            self.counters['batches'] += 1
+            self.counters['trips'] += len(days)
+
+            if self.recycle_after and worker.trips >= self.recycle_after:
+                # The stop message queues behind the batches already sent
+                worker.retiring = True
+                worker.outbox.append(None)
+                self._workers.append(self._spawn())
+                self.counters['recycled'] += 1
+        self._flush(worker)
+        return future
+
+    def _flush(self, worker: _Worker):
+        """
+        Send a worker's queued messages in order.
+
+        Runs outside the pool lock: a send blocks while the worker's pipe is
+        full, and the worker only drains it once the collector, which needs
+        the pool lock, has read its replies.
+        """
+        with worker.send_lock:
+            try:
+                while worker.outbox:
+                    worker.conn.send(worker.outbox.popleft())
+            except (OSError, ValueError):
+                # The worker died; the collector fails its pending batches
+                worker.outbox.clear()
+
+    def _collect(self):
+        """Route worker replies to their futures; replace workers that died."""
+        while not self._closed or any(w.pending for w in self._workers):
+            with self._lock:
+                by_conn = {worker.conn: worker for worker in self._workers}
+            for conn in connection.wait(list(by_conn), timeout=POLL_SECONDS):
+                worker = by_conn[conn]
+                try:
+                    batch_id, predictions, error = conn.recv()
+                except (EOFError, OSError):
+                    self._retire(worker)
+                    continue
+                with self._capacity:
+                    future = worker.pending.pop(batch_id)
+                    self._capacity.notify()
+                if error is None:
+                    future.set_result(predictions)
+                else:
+                    future.set_exception(error)
+
+    def _retire(self, worker: _Worker):
+        """Drop a worker whose pipe closed, failing anything it still owed."""
+        worker.process.join(timeout=1)
+        with self._capacity:
+            self._workers.remove(worker)
+            crashed = not worker.retiring and not self._closed
+            if crashed:
+                self.counters['crashed'] += 1
+                self._workers.append(self._spawn())
+                self._capacity.notify()
+            pending, worker.pending = worker.pending, {}
+        worker.conn.close()
+        for future in pending.values():
+            future.set_exception(RuntimeError(
+                f"Prediction worker {worker.process.pid} exited "
+                f"(exit code {worker.process.exitcode})"))
+
+    def stats(self) -> dict:
+        """Return worker and traffic counters."""
+        with self._lock:
+            return {'workers': sum(not w.retiring for w in self._workers),
+                    'pending_batches': sum(len(w.pending) for w in self._workers),
+                    **self.counters}
+
+    def close(self):
+        """Finish every request already submitted, then stop the workers."""
+        if self._closed:
+            return
+        # Requests queued before the sentinel are still sent out
+        self._requests.put(None)
+        self._threads[1].join()
+
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+            for worker in workers:
+                if not worker.retiring:
+                    worker.retiring = True
+                    worker.outbox.append(None)
+        for worker in workers:
+            self._flush(worker)
+        self._threads[0].join()
+        for worker in workers:
+            worker.process.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _split(batch: Future, futures):
+    """Hand each request of a micro-batch its own prediction."""
+    try:
+        predictions = batch.result().tolist()
+    except Exception as e:
+        for future in futures:
+            future.set_exception(e)
+        return
+    for future, prediction in zip(futures, predictions):
+        future.set_result(prediction)
+
+
+def replay(path: str, worker_counts: List[int], max_batch: int = MAX_BATCH) -> List[dict]:
+    """
+    Replay a trips file as one request per trip against pools of each size.
+
+    Returns:
+        One result per worker count with ``workers``, ``seconds`` and
+        ``trips_per_second``
+    """
+    days, miles, receipts = load_trips(path)
+    results = []
+    for n_workers in worker_counts:
+        with PredictionPool(n_workers, max_batch=max_batch) as pool:
+            # Warm every worker before timing
+            pool.predict(days[:n_workers * max_batch], miles[:n_workers * max_batch],
+                         receipts[:n_workers * max_batch])
+            start_time = time.perf_counter()
+            futures = [pool.submit_one(*trip) for trip in zip(days, miles, receipts)]
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - start_time
+        results.append({'workers': n_workers, 'seconds': elapsed,
+                        'trips_per_second': len(days) / elapsed})
+    return results
+
+
+def main():
+    """
+    Main entry point for command-line usage.
+
+    Usage:
+        python worker_pool.py replay <trips.json> [--workers 1 2 4] [--max-batch 512]
+    """
+    parser = argparse.ArgumentParser(description="Prefork prediction worker pool")
+    parser.add_argument('command', choices=['replay'])
+    parser.add_argument('path', help="JSON or CSV file of trips")
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help="Pool sizes to compare (default: 1 and one per core)")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    args = parser.parse_args()
+
+    worker_counts = args.workers or sorted({1, DEFAULT_WORKERS})
+    try:
+        results = replay(args.path, worker_counts, args.max_batch)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    base = results[0]['trips_per_second']
+    print(f"{'workers':>8s} {'seconds':>9s} {'trips/s':>12s} {'speedup':>8s}")
+    for result in results:
+        print(f"{result['workers']:8d} {result['seconds']:9.3f} "
+              f"{result['trips_per_second']:12,.0f} {result['trips_per_second'] / base:7.2f}x")
+
+
+if __name__ == '__main__':
+    main()